@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+"""
+Name          : colour
+Author        : Joan Juvert <trust.no.one.51@gmail.com>
+Version       : 1.0
+Description   : Colour coordinates of multilayers from their reflectance
+              : spectra.
+
+Copyright 2012 Joan Juvert
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+###############################################################################
+#                               Tables                                        #
+###############################################################################
+
+# CIE 1931 2 degree standard observer colour matching functions and CIE
+# standard illuminant D65 from 380 nm to 780 nm in steps of 10 nm.
+# Source: CIE 15:2004, Colorimetry, 3rd edition.
+
+cie_wlengths = np.arange(380, 790, 10, dtype=np.float64)
+
+cie_xbar = np.array([
+        0.001368, 0.004243, 0.014310, 0.043510, 0.134380, 0.283900,
+        0.348280, 0.336200, 0.290800, 0.195360, 0.095640, 0.032010,
+        0.004900, 0.009300, 0.063270, 0.165500, 0.290400, 0.433450,
+        0.594500, 0.762100, 0.916300, 1.026300, 1.062200, 1.002600,
+        0.854450, 0.642400, 0.447900, 0.283500, 0.164900, 0.087400,
+        0.046770, 0.022700, 0.011359, 0.005790, 0.002899, 0.001440,
+        0.000690, 0.000332, 0.000166, 0.000083, 0.000042])
+
+cie_ybar = np.array([
+        0.000039, 0.000120, 0.000396, 0.001210, 0.004000, 0.011600,
+        0.023000, 0.038000, 0.060000, 0.090980, 0.139020, 0.208020,
+        0.323000, 0.503000, 0.710000, 0.862000, 0.954000, 0.994950,
+        0.995000, 0.952000, 0.870000, 0.757000, 0.631000, 0.503000,
+        0.381000, 0.265000, 0.175000, 0.107000, 0.061000, 0.032000,
+        0.017000, 0.008210, 0.004102, 0.002091, 0.001047, 0.000520,
+        0.000249, 0.000120, 0.000060, 0.000030, 0.000015])
+
+cie_zbar = np.array([
+        0.006450, 0.020050, 0.067850, 0.207400, 0.645600, 1.385600,
+        1.747060, 1.772110, 1.669200, 1.287640, 0.812950, 0.465180,
+        0.272000, 0.158200, 0.078250, 0.042160, 0.020300, 0.008750,
+        0.003900, 0.002100, 0.001650, 0.001100, 0.000800, 0.000340,
+        0.000190, 0.000050, 0.000020, 0.000000, 0.000000, 0.000000,
+        0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000,
+        0.000000, 0.000000, 0.000000, 0.000000, 0.000000])
+
+cie_d65 = np.array([
+        49.9755, 54.6482, 82.7549, 91.4860, 93.4318, 86.6823, 104.865,
+        117.008, 117.812, 114.861, 115.923, 108.811, 109.354, 107.802,
+        104.790, 107.689, 104.405, 104.046, 100.000, 96.3342, 95.7880,
+        88.6856, 90.0062, 89.5991, 87.6987, 83.2886, 83.6992, 80.0268,
+        80.2146, 82.2778, 78.2842, 69.7213, 71.6091, 74.3490, 61.6040,
+        69.8856, 75.0870, 63.5927, 46.4182, 66.8054, 63.3828])
+
+
+############################ Class definitions ########################
+
+
+class Colorimeter(object):
+    """
+    The Colorimeter class calculates the colour coordinates of the light
+    reflected by a multilayer.
+
+    The tristimulus values are integrals over the visible spectrum of
+    the reflectance times the spectral power distribution of the
+    illuminant times the colour matching functions of the CIE 1931
+    standard observer. For a fixed set of wavelengths these integrals
+    are linear in the reflectance, so they are replaced by a matrix of
+    quadrature weights calculated once when the Colorimeter is created.
+    The colour of any number of spectra then costs a single matrix
+    product, and the spectra themselves come from a single call to
+    Multilayer.calculateCoefficients.
+
+    The colour matching functions are tabulated in nanometers, so the
+    wavelengths given to a Colorimeter, and those of the multilayers it
+    is used with, must be in nanometers.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, wlengths=None, illuminant='D65'):
+        """
+        Initialize a Colorimeter instance.
+
+        Parameters
+        ----------
+        wlengths : numpy.ndarray, optional
+            The increasing wavelengths, in nanometers, at which the
+            spectra are sampled. The colour matching functions are
+            linearly interpolated at these wavelengths and are zero
+            outside the range 380-780 nm. The integrals are calculated
+            with the trapezoidal rule. Default: from 380 nm to 780 nm
+            in steps of 5 nm.
+        illuminant : str or numpy.ndarray, optional
+            The illuminant. It may be "D65" (daylight), "A" (incandescent
+            lamp), "E" (equal energy), case insensitive, or an array
+            with its spectral power distribution at wlengths. Default:
+            "D65".
+
+        Returns
+        -------
+        out : Colorimeter
+            A Colorimeter instance.
+        """
+
+        if wlengths is None:
+            wlengths = np.arange(380, 785, 5, dtype=np.float64)
+        wlengths = np.asarray(wlengths, dtype=np.float64)
+        if wlengths.ndim != 1 or wlengths.size < 2 or \
+                np.any(np.diff(wlengths) <= 0):
+            error = "Colorimeter creation error: wlengths must be an " + \
+                    "increasing 1D array"
+            print(error)
+            raise ValueError
+
+        spd = _illuminant(illuminant, wlengths)
+
+        # Trapezoidal quadrature weights
+        steps = np.diff(wlengths)
+        quadrature = np.zeros(wlengths.size)
+        quadrature[:-1] += steps / 2
+        quadrature[1:] += steps / 2
+
+        cmfs = np.array([
+                np.interp(wlengths, cie_wlengths, cmf, left=0, right=0)
+                for cmf in [cie_xbar, cie_ybar, cie_zbar]]).T
+        weights = (spd * quadrature)[:, np.newaxis] * cmfs
+        if weights[:, 1].sum() <= 0:
+            error = "Colorimeter creation error: the wavelengths do not " + \
+                    "cover the visible spectrum"
+            print(error)
+            raise ValueError
+
+        # Normalize so that the perfect reflector has Y = 100
+        self.__weights = 100 * weights / weights[:, 1].sum()
+        self.__wlengths = wlengths
+        self.__whitePoint = self.__weights.sum(axis=0)
+
+    def getWlengths(self):
+        """
+        Returns the wavelengths at which the spectra are sampled.
+
+        Returns
+        -------
+        out : numpy.ndarray
+            The wavelengths in nanometers.
+        """
+
+        return self.__wlengths.copy()
+
+    def getWhitePoint(self):
+        """
+        Returns the tristimulus values of the perfect reflector (R = 1)
+        under the illuminant.
+
+        Returns
+        -------
+        out : numpy.ndarray
+            The array [Xn, Yn, Zn], with Yn = 100.
+        """
+
+        return self.__whitePoint.copy()
+
+    def calculateXYZ(self, spectra):
+        """
+        Calculates the CIE XYZ tristimulus values of reflectance
+        spectra.
+
+        Parameters
+        ----------
+        spectra : numpy.ndarray
+            The reflectance spectra, sampled at the wavelengths of the
+            Colorimeter along the last axis.
+
+        Returns
+        -------
+        out : numpy.ndarray
+            The tristimulus values along the last axis (X, Y, Z). The
+            other axes are those of spectra.
+        """
+
+        spectra = np.asarray(spectra, dtype=np.float64)
+        if spectra.shape[-1:] != self.__wlengths.shape:
+            error = "Error: the spectra must be sampled at the " + \
+                    "wavelengths of the Colorimeter (last axis)"
+            print(error)
+            raise ValueError
+
+        return np.dot(spectra, self.__weights)
+
+    def calculatexyY(self, spectra):
+        """
+        Calculates the CIE xyY coordinates (chromaticity and luminance)
+        of reflectance spectra.
+
+        Parameters
+        ----------
+        spectra : numpy.ndarray
+            The reflectance spectra, sampled at the wavelengths of the
+            Colorimeter along the last axis.
+
+        Returns
+        -------
+        out : numpy.ndarray
+            The coordinates along the last axis (x, y, Y).
+        """
+
+        return xyzToxyY(self.calculateXYZ(spectra))
+
+    def calculateLab(self, spectra):
+        """
+        Calculates the CIE 1976 L*a*b* coordinates of reflectance
+        spectra relative to the white point of the illuminant.
+
+        Parameters
+        ----------
+        spectra : numpy.ndarray
+            The reflectance spectra, sampled at the wavelengths of the
+            Colorimeter along the last axis.
+
+        Returns
+        -------
+        out : numpy.ndarray
+            The coordinates along the last axis (L*, a*, b*).
+        """
+
+        return xyzToLab(self.calculateXYZ(spectra), self.__whitePoint)
+
+    def calculateColour(self, multilayer, angles=0, polarization=None,
+                        index=0, thicknesses=None, space='Lab'):
+        """
+        Calculates the colour of the light reflected by a multilayer for
+        arrays of viewing angles and thickness variants at once.
+
+        Parameters
+        ----------
+        multilayer : Multilayer
+            The multilayer system. Its refractive indices must be known
+            at all the wavelengths of the Colorimeter, in nanometers.
+        angles : float or numpy.ndarray, optional
+            The angles of incidence in radians. Default: 0.
+        polarization : str, optional
+            The polarization of the light, "te" or "tm". By default the
+            light is unpolarized and the reflectance is the mean of
+            those of TE and TM waves.
+        index : int, optional
+            The index of the layer where the angles are given. By
+            default the top medium (index = 0).
+        thicknesses : numpy.ndarray, optional
+            The thicknesses of all the layers of each variant of the
+            multilayer, with the layers along the last axis (see
+            Multilayer.calculateCoefficients). The other axes are
+            broadcast against angles. By default the thicknesses of the
+            multilayer.
+        space : str, optional
+            The colour space of the result: "XYZ", "xyY" or "Lab".
+            Default: "Lab".
+
+        Returns
+        -------
+        out : numpy.ndarray
+            The colour coordinates along the last axis. The other axes
+            are the broadcast shape of angles and the variants.
+        """
+
+        converters = {'XYZ': self.calculateXYZ, 'xyY': self.calculatexyY,
+                      'Lab': self.calculateLab}
+        if space not in converters:
+            error = "Error: space must be 'XYZ', 'xyY' or 'Lab'"
+            print(error)
+            raise ValueError
+
+        # The wavelengths go along the last axis of the batch
+        angles = np.asarray(angles, dtype=np.float64)[..., np.newaxis]
+        if thicknesses is not None:
+            thicknesses = np.asarray(thicknesses, dtype=np.float64)
+            thicknesses = thicknesses[..., np.newaxis, :]
+        if polarization is None:
+            polarizations = ['te', 'tm']
+        else:
+            polarizations = [polarization]
+
+        spectra = 0
+        for pol in polarizations:
+            spectra = spectra + multilayer.calculateCoefficients(
+                    self.__wlengths, angles, pol, index, thicknesses)['R']
+        spectra = spectra / len(polarizations)
+
+        return converters[space](spectra)
+
+
+######################### Auxiliary functions #########################
+
+
+def xyzToxyY(xyz):
+    """
+    Converts CIE XYZ tristimulus values to xyY coordinates. Black
+    (X + Y + Z = 0) is given the chromaticity of the equal energy white
+    point (1/3, 1/3).
+
+    Parameters
+    ----------
+    xyz : numpy.ndarray
+        The tristimulus values along the last axis.
+
+    Returns
+    -------
+    out : numpy.ndarray
+        The coordinates (x, y, Y) along the last axis.
+    """
+
+    xyz = np.asarray(xyz, dtype=np.float64)
+    total = xyz.sum(axis=-1)
+    black = total == 0
+    total = np.where(black, 1, total)
+    xyy = np.empty(xyz.shape)
+    xyy[..., 0] = np.where(black, 1 / 3.0, xyz[..., 0] / total)
+    xyy[..., 1] = np.where(black, 1 / 3.0, xyz[..., 1] / total)
+    xyy[..., 2] = xyz[..., 1]
+
+    return xyy
+
+
+def xyzToLab(xyz, whitePoint):
+    """
+    Converts CIE XYZ tristimulus values to CIE 1976 L*a*b* coordinates.
+
+    Parameters
+    ----------
+    xyz : numpy.ndarray
+        The tristimulus values along the last axis.
+    whitePoint : numpy.ndarray
+        The tristimulus values of the reference white.
+
+    Returns
+    -------
+    out : numpy.ndarray
+        The coordinates (L*, a*, b*) along the last axis.
+    """
+
+    ratios = np.asarray(xyz, dtype=np.float64) / np.asarray(whitePoint)
+    epsilon = (6 / 29.0) ** 3
+    f = np.where(ratios > epsilon, np.cbrt(ratios),
+                 ratios / (3 * (6 / 29.0) ** 2) + 4 / 29.0)
+    lab = np.empty(f.shape)
+    lab[..., 0] = 116 * f[..., 1] - 16
+    lab[..., 1] = 500 * (f[..., 0] - f[..., 1])
+    lab[..., 2] = 200 * (f[..., 1] - f[..., 2])
+
+    return lab
+
+
+def _illuminant(illuminant, wlengths):
+    """
+    Returns the spectral power distribution of an illuminant at the
+    given wavelengths (see the Colorimeter class).
+    """
+
+    if isinstance(illuminant, str):
+        name = illuminant.upper()
+        if name == 'D65':
+            return np.interp(wlengths, cie_wlengths, cie_d65)
+        elif name == 'A':
+            # Planck's law at 2856 K as defined by the CIE, normalized
+            # to 100 at 560 nm.
+            c2 = 1.435e7
+            return 100 * (560 / wlengths) ** 5 * \
+                    np.expm1(c2 / (2848 * 560)) / np.expm1(c2 / (2848 *
+                                                                 wlengths))
+        elif name == 'E':
+            return np.ones(wlengths.shape)
+        else:
+            error = "Error: unknown illuminant %s" % illuminant
+            print(error)
+            raise ValueError
+
+    spd = np.asarray(illuminant, dtype=np.float64)
+    if spd.shape != wlengths.shape:
+        error = "Error: the illuminant must be sampled at wlengths"
+        print(error)
+        raise ValueError
+
+    return spd
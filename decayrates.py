@@ -0,0 +1,596 @@
+# -*- coding: utf-8 -*-
+"""
+Name          : decayrates
+Author        : Joan Juvert <trust.no.one.51@gmail.com>
+Version       : 1.0
+Description   : Total decay rate (Purcell factor) of dipoles embedded in
+              : a multilayer and its partition into radiated, guided
+              : and lossy channels.
+
+Copyright 2012 Joan Juvert
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import multilayers as ml
+import numpy as np
+
+###############################################################################
+#                               Constants                                     #
+###############################################################################
+
+# 15 point Gauss-Kronrod rule and its embedded 7 point Gauss rule on
+# [-1, 1]. Source: QUADPACK (qk15).
+
+_kronrodNodes = np.array([
+        0.991455371120812639206854697526329,
+        0.949107912342758524526189684047851,
+        0.864864423359769072789712788640926,
+        0.741531185599394439863864773280788,
+        0.586087235467691130294144845693013,
+        0.405845151377397166906606412076961,
+        0.207784955007898467600689403773245,
+        0.000000000000000000000000000000000])
+_kronrodNodes = np.concatenate((-_kronrodNodes, _kronrodNodes[-2::-1]))
+
+_kronrodWeights = np.array([
+        0.022935322010529224963732008058970,
+        0.063092092629978553290700663189204,
+        0.104790010322250183839876322541518,
+        0.140653259715525918745189590510238,
+        0.169004726639267902826583426598550,
+        0.190350578064785409913256402421014,
+        0.204432940075298892414161999234649,
+        0.209482141084727828012999174891714])
+_kronrodWeights = np.concatenate((_kronrodWeights, _kronrodWeights[-2::-1]))
+
+_gaussWeights = np.zeros(15)
+_gaussWeights[1::2] = [
+        0.129484966168869693270611432679082,
+        0.279705391489276667901467771423780,
+        0.381830050505118944950369775488975,
+        0.417959183673469387755102040816327,
+        0.381830050505118944950369775488975,
+        0.279705391489276667901467771423780,
+        0.129484966168869693270611432679082]
+
+
+############################ Class definitions ########################
+
+
+class DecayRates(object):
+    """
+    The DecayRates class calculates the total decay rate of oscillating
+    dipoles embedded in a multilayer, normalized to the decay rate of
+    the same dipole in an infinite medium with the refractive index of
+    the layer that contains it (i.e. the Purcell factor).
+
+    Following Chance, Prock and Silbey (Adv. Chem. Phys. 37, 1, 1978),
+    the rate is an integral over the in-plane wavevector u, normalized
+    to the wavenumber in the emitting layer. For a dipole perpendicular
+    to the interfaces
+
+        b_perp = 3/2 Re integral(u^3 / l * (1 + a_p) * (1 + b_p) /
+                                 (1 - a_p * b_p) du)
+
+    and for a dipole parallel to them
+
+        b_par = 3/4 Re integral(u / l * ((1 + a_s) * (1 + b_s) /
+                                         (1 - a_s * b_s) +
+                                         l^2 * (1 - a_p) * (1 - b_p) /
+                                         (1 - a_p * b_p)) du),
+
+    where l = sqrt(1 - u^2) and a (b) is the reflection coefficient of
+    the part of the multilayer above (below) the emitting layer, as
+    seen from it, times exp(2i * k * l * d), d being the distance from
+    the dipole to the corresponding interface. The reflection
+    coefficients are those of Multilayer.updateCharMatrix.
+
+    The integrand has poles at the guided modes of the multilayer,
+    which lie on (or, with absorption, very close to) the real axis. The
+    path of integration is deformed into the lower half of the complex
+    plane in the range of u where guided modes may exist, so that the
+    poles are never approached, and each piece of the path is
+    integrated with an adaptive Gauss-Kronrod rule. All the dipole
+    positions and wavelengths are integrated at once.
+
+    The rate is split according to where the energy goes:
+        - top and bottom: power radiated into the top and bottom
+          mediums (the far field). It is calculated from the flux of the
+          transmitted plane waves and is zero for absorbing mediums.
+        - guided: power coupled to the range of u between the largest
+          refractive index of the top and bottom mediums and the largest
+          refractive index of the multilayer, where the guided modes of
+          the multilayer lie (including their absorption).
+        - lossy: the rest, i.e. the power absorbed by the layers at
+          smaller u and the power dissipated through the evanescent
+          near field at larger u (surface plasmons and quenching by
+          absorbing layers close to the dipole).
+
+    The absorption of the layer that contains the dipoles is neglected
+    (the real part of its refractive index is used), since the decay
+    rate is not defined within an absorbing medium.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, multilayer, tolerance=1e-6, maxIntervals=500):
+        """
+        Initialize a DecayRates instance.
+
+        Parameters
+        ----------
+        multilayer : Multilayer
+            The multilayer system.
+        tolerance : float, optional
+            The absolute tolerance of the normalized decay rates (which
+            are of order 1). Default: 1e-6.
+        maxIntervals : int, optional
+            The maximum number of subintervals of each piece of the path
+            of integration. Default: 500.
+
+        Returns
+        -------
+        out : DecayRates
+            A DecayRates instance.
+        """
+
+        if not isinstance(multilayer, ml.Multilayer):
+            error = "DecayRates creation error: a Multilayer instance " + \
+                    "is expected"
+            print(error)
+            raise TypeError
+        if tolerance <= 0:
+            error = "DecayRates creation error: the tolerance must be " + \
+                    "positive"
+            print(error)
+            raise ValueError
+        if int(maxIntervals) != maxIntervals or maxIntervals < 1:
+            error = "DecayRates creation error: maxIntervals must be a " + \
+                    "positive integer"
+            print(error)
+            raise ValueError
+
+        self.__multilayer = multilayer
+        self.__tolerance = float(tolerance)
+        self.__maxIntervals = int(maxIntervals)
+
+    def getTolerance(self):
+        """
+        Returns the absolute tolerance of the normalized decay rates.
+        """
+
+        return self.__tolerance
+
+    def calculateRates(self, z, wlengths):
+        """
+        Calculates the normalized decay rates of dipoles at z.
+
+        Parameters
+        ----------
+        z : float or numpy.ndarray
+            The z coordinates of the dipoles. They must not lie exactly
+            on an interface.
+        wlengths : float or numpy.ndarray
+            The emission wavelengths, broadcast against z.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with the keys:
+                - perpendicular, parallel, isotropic: dictionaries with
+                  the normalized rates of dipoles perpendicular and
+                  parallel to the interfaces and of randomly oriented
+                  dipoles ((perpendicular + 2 * parallel) / 3). Their
+                  keys are {'total', 'top', 'bottom', 'guided',
+                  'lossy'}.
+                - error: an estimate of the absolute error of the
+                  results.
+            Each value is an array with the broadcast shape of z and
+            wlengths.
+        """
+
+        z, wlengths = np.broadcast_arrays(
+                np.asarray(z, dtype=np.float64),
+                np.asarray(wlengths, dtype=np.float64))
+        multilayer = self.__multilayer
+        layers = np.asarray(multilayer.getIndexAtPos(z))
+        if np.any(np.in1d(z, [multilayer.getPosition(layer) for layer in
+                              range(multilayer.numLayers() - 1)])):
+            error = "Error: the dipoles cannot lie on an interface"
+            print(error)
+            raise ValueError
+
+        channels = ['total', 'top', 'bottom', 'guided', 'lossy']
+        results = {}
+        for orientation in ['perpendicular', 'parallel']:
+            results[orientation] = {}
+            for channel in channels:
+                results[orientation][channel] = np.empty(z.shape)
+        results['error'] = np.empty(z.shape)
+
+        for layer in np.unique(layers):
+            selection = layers == layer
+            rates, error = self.__layerRates(layer, z[selection],
+                                             wlengths[selection])
+            for orientation in ['perpendicular', 'parallel']:
+                for channel in channels:
+                    results[orientation][channel][selection] = \
+                            rates[orientation][channel]
+            results['error'][selection] = error
+
+        results['isotropic'] = {}
+        for channel in channels:
+            results['isotropic'][channel] = \
+                    (results['perpendicular'][channel] +
+                     2 * results['parallel'][channel]) / 3
+
+        return results
+
+    def __layerRates(self, layer, z, wlengths):
+        """
+        Calculates the rates of dipoles that lie within the same layer.
+        The arrays z and wlengths are one-dimensional.
+        """
+
+        multilayer = self.__multilayer
+        last = multilayer.numLayers() - 1
+
+        # Everything but the distances to the interfaces depends only on
+        # the wavelength.
+        uniqueWlengths, inverse = np.unique(wlengths, return_inverse=True)
+        n = multilayer.getRefrIndices(uniqueWlengths)
+        emitter = n[:, layer].real
+        n = n / emitter[:, np.newaxis]
+        k = 2 * np.pi * emitter / uniqueWlengths
+        distanceTop = multilayer.getPosition(layer - 1) - z if layer > 0 \
+                else np.zeros(z.shape)
+        distanceBottom = z - multilayer.getPosition(layer) if layer < last \
+                else np.zeros(z.shape)
+        geometry = {'layer': layer, 'inverse': inverse,
+                    'wlength': uniqueWlengths, 'emitter': emitter,
+                    'k': k[inverse, np.newaxis],
+                    'top': distanceTop[:, np.newaxis],
+                    'bottom': distanceBottom[:, np.newaxis]}
+
+        # Landmarks of the path of integration, normalized to the
+        # wavenumber in the emitting layer.
+        transparent = n.imag == 0
+        uTop = np.where(transparent[:, 0], n[:, 0].real, 0)
+        uBottom = np.where(transparent[:, -1], n[:, -1].real, 0)
+        uRadiated = np.maximum(n[:, 0].real, n[:, -1].real)
+        uGuided = np.maximum(uRadiated, n.real.max(axis=1))
+        uTail = 2 * np.absolute(n).max(axis=1) + 1
+
+        def pieces(end, branches):
+            # Straight pieces along the real axis between the branch
+            # points that lie below end.
+            points = np.sort(np.concatenate(
+                    [np.zeros((end.size, 1)), end[:, np.newaxis]] +
+                    [np.minimum(branch, end)[:, np.newaxis]
+                     for branch in branches], axis=1), axis=1)
+            return [(points[:, i], points[:, i + 1], 0)
+                    for i in range(points.shape[1] - 1)]
+
+        ones = np.ones(uniqueWlengths.shape)
+        outer = [n[:, 0].real, n[:, -1].real]
+        integrals = {}
+        error = 0
+        paths = {
+                'top': pieces(uTop, [ones, outer[1]]),
+                'bottom': pieces(uBottom, [ones, outer[0]]),
+                'radiated': pieces(uRadiated, [ones] + outer),
+                'guided': [(uRadiated, uGuided, (uGuided - uRadiated) / 2)],
+                'lossy': [(uGuided, uTail, (uTail - uGuided) / 2),
+                          (uTail, None, 0)]}
+        for (name, path) in paths.items():
+            kind = 'flux' if name in ['top', 'bottom'] else 'rate'
+            integrals[name] = 0
+            for (start, end, depth) in path:
+                function = self.__integrand(geometry, kind, name, start, end,
+                                            depth)
+                value, estimate = _integrate(function, self.__tolerance,
+                                             self.__maxIntervals)
+                integrals[name] = integrals[name] + value.real
+                error = error + estimate.max(axis=0)
+
+        # Add the integrals of the bare dipole in an infinite medium
+        # (the terms subtracted from the integrand) and partition.
+        rates = {}
+        for (orientation, bare) in [('perpendicular', _barePerpendicular),
+                                    ('parallel', _bareParallel)]:
+            q = 0 if orientation == 'perpendicular' else 1
+            radiated = integrals['radiated'][q] + bare(uRadiated)[inverse]
+            guided = integrals['guided'][q] + \
+                    (bare(uGuided) - bare(uRadiated))[inverse]
+            lossy = integrals['lossy'][q] + (1 - bare(uGuided))[inverse]
+            rates[orientation] = {
+                    'total': radiated + guided + lossy,
+                    'top': integrals['top'][q],
+                    'bottom': integrals['bottom'][q],
+                    'guided': guided,
+                    'lossy': radiated + lossy - integrals['top'][q] -
+                    integrals['bottom'][q]}
+
+        return (rates, error)
+
+    def __integrand(self, geometry, kind, name, start, end, depth):
+        """
+        Returns a function of the parameter t in [0, 1] of a piece of
+        the path of integration that gives the integrand (including the
+        Jacobian) for every dipole and the two orientations, with shape
+        (2, dipoles, t.size).
+
+        The piece goes from start to end (None for infinity) and bulges
+        into the lower half plane by depth. kind is 'rate' for the
+        decay rate (without the bare dipole terms) and 'flux' for the
+        power radiated into the top or bottom medium (name).
+        """
+
+        multilayer = self.__multilayer
+        layer = geometry['layer']
+        last = multilayer.numLayers() - 1
+        inverse = geometry['inverse']
+        emitter = geometry['emitter'][:, np.newaxis]
+
+        def evaluate(t):
+            t = t[np.newaxis, :]
+            if end is None:
+                u = start[:, np.newaxis] + t / (1 - t)
+                du = 1 / (1 - t) ** 2 * np.ones(u.shape)
+            else:
+                # The nodes are clustered at both ends, where the
+                # integrand may have square root singularities.
+                s = (1 - np.cos(np.pi * t)) / 2
+                ds = np.pi / 2 * np.sin(np.pi * t)
+                length = (end - start)[:, np.newaxis]
+                bulge = np.asarray(depth)[..., np.newaxis] * np.ones(s.shape)
+                u = start[:, np.newaxis] + length * s - \
+                        1j * bulge * np.sin(np.pi * s)
+                du = (length - 1j * np.pi * bulge * np.cos(np.pi * s)) * ds
+            u = u.astype(np.complex128)
+
+            coefficients = _coefficients(multilayer, layer,
+                                         geometry['wlength'][:, np.newaxis],
+                                         emitter * u)
+            l = _kz(1, u)[inverse]
+            u = u[inverse]
+            du = du[inverse]
+            phase = 1j * geometry['k'] * l
+            expTop = np.exp(phase * geometry['top'])
+            expBottom = np.exp(phase * geometry['bottom'])
+            a = {}
+            b = {}
+            for pol in ['TE', 'TM']:
+                a[pol] = coefficients[pol]['rTop'][inverse] * expTop ** 2
+                b[pol] = coefficients[pol]['rBottom'][inverse] * \
+                        expBottom ** 2
+
+            if kind == 'rate':
+                s = (a['TE'] + b['TE'] + 2 * a['TE'] * b['TE']) / \
+                        (1 - a['TE'] * b['TE'])
+                p = (a['TM'] + b['TM'] + 2 * a['TM'] * b['TM']) / \
+                        (1 - a['TM'] * b['TM'])
+                pp = (2 * a['TM'] * b['TM'] - a['TM'] - b['TM']) / \
+                        (1 - a['TM'] * b['TM'])
+                perpendicular = 1.5 * u ** 3 / l * p
+                parallel = 0.75 * u / l * (s + l ** 2 * pp)
+            else:
+                if name == 'top':
+                    there, here, other = ('Top', expTop, b)
+                    if layer == 0:
+                        here = np.ones(here.shape)
+                else:
+                    there, here, other = ('Bottom', expBottom, a)
+                    if layer == last:
+                        here = np.ones(here.shape)
+                waves = {}
+                for pol in ['TE', 'TM']:
+                    flux = coefficients[pol]['flux' + there][inverse]
+                    transmitted = coefficients[pol]['t' + there][inverse] * \
+                            here / (1 - a[pol] * b[pol])
+                    waves[pol] = (transmitted, flux)
+                norm = np.absolute(l) * emitter[inverse]
+
+                def power(pol, sign):
+                    transmitted, flux = waves[pol]
+                    return np.absolute(transmitted * (1 + sign *
+                                                      other[pol])) ** 2 * \
+                            flux / norm
+
+                perpendicular = 0.75 * np.absolute(u ** 3 / l) * \
+                        power('TM', 1)
+                parallel = 0.375 * (np.absolute(u / l) * power('TE', 1) +
+                                    np.absolute(u * l) * power('TM', -1))
+
+            # Degenerate pieces of the path (e.g. towards an absorbing
+            # medium) may sit on a branch point.
+            values = np.array([perpendicular * du, parallel * du])
+            return np.where(du == 0, 0, values)
+
+        def function(t):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return evaluate(t)
+
+        return function
+
+
+######################### Auxiliary functions #########################
+
+
+def _kz(n, neff):
+    """
+    Returns the normal component of the normalized wavevector,
+    sqrt(n^2 - neff^2), with non-negative imaginary part.
+    """
+
+    kz = np.sqrt(n ** 2 - neff ** 2 + 0j)
+    flip = (kz.imag < 0) | ((kz.imag == 0) & (kz.real < 0))
+
+    return np.where(flip, -kz, kz)
+
+
+def _coefficients(multilayer, layer, wlengths, neff):
+    """
+    Calculates the reflection and transmission coefficients, as seen
+    from the given layer, of the parts of the multilayer above and below
+    it, and the normal energy flux of a plane wave of unit amplitude in
+    the top and bottom mediums.
+
+    The coefficients follow the conventions of updateCharMatrix but are
+    obtained by the recursive (Airy) summation over the interfaces
+    instead of the characteristic matrices, which overflow for the
+    strongly evanescent waves found at large neff.
+
+    Returns a dictionary with keys 'TE' and 'TM', each a dictionary with
+    the keys {'rTop', 'tTop', 'fluxTop', 'rBottom', 'tBottom',
+    'fluxBottom'}.
+    """
+
+    last = multilayer.numLayers() - 1
+    n = multilayer.getRefrIndices(wlengths)
+    n[..., layer] = n[..., layer].real
+    kz = _kz(n, neff[..., np.newaxis])
+    k0 = 2 * np.pi / wlengths
+    thicknesses = [0] + [multilayer.getThickness(index)
+                         for index in range(1, last)] + [0]
+    phases = [k0 * kz[..., index] * thicknesses[index]
+              for index in range(last + 1)]
+
+    results = {}
+    for pol in ['TE', 'TM']:
+        coefficients = {}
+        for (side, sequence) in [('Top', range(layer, -1, -1)),
+                                 ('Bottom', range(layer, last + 1))]:
+            sequence = list(sequence)
+            r = np.zeros(kz.shape[:-1], dtype=np.complex128)
+            t = np.ones(kz.shape[:-1], dtype=np.complex128)
+            # From the exit medium back to the emitting layer
+            for (i, l) in reversed(list(zip(sequence[:-1], sequence[1:]))):
+                r_il, t_il = _interfaceCoefficients(
+                        n[..., i], kz[..., i], n[..., l], kz[..., l], pol)
+                if l == sequence[-1]:
+                    r, t = (r_il, t_il)
+                else:
+                    phase = np.exp(1j * phases[l])
+                    denominator = 1 + r_il * r * phase ** 2
+                    r, t = ((r_il + r * phase ** 2) / denominator,
+                            t_il * t * phase / denominator)
+            exit = n[..., sequence[-1]]
+            if pol == 'TE':
+                flux = kz[..., sequence[-1]].real
+            else:
+                flux = (np.conj(exit) * kz[..., sequence[-1]] / exit).real
+            coefficients['r' + side] = r
+            coefficients['t' + side] = t
+            coefficients['flux' + side] = flux
+        results[pol] = coefficients
+
+    return results
+
+
+def _interfaceCoefficients(n_i, kz_i, n_l, kz_l, polarization):
+    """
+    Returns the Fresnel reflection and transmission (electric field)
+    coefficients of a single interface, as in updateCharMatrix, with
+    the normal components of the wavevectors in the incidence and exit
+    mediums given explicitly.
+    """
+
+    if polarization == 'TE':
+        p_i = kz_i
+        p_l = kz_l
+    else:
+        p_i = kz_i / n_i ** 2
+        p_l = kz_l / n_l ** 2
+    r = (p_i - p_l) / (p_i + p_l)
+    t = 2 * p_i / (p_i + p_l)
+    if polarization == 'TM':
+        t = t * n_i / n_l
+
+    return (r, t)
+
+
+def _barePerpendicular(u):
+    """
+    Returns the real part of the integral between 0 and u of the
+    integrand of a perpendicular dipole in an infinite medium.
+    """
+
+    v = np.sqrt(1 - np.minimum(u, 1) ** 2)
+
+    return 1.5 * (2 / 3.0 - v + v ** 3 / 3)
+
+
+def _bareParallel(u):
+    """
+    Returns the real part of the integral between 0 and u of the
+    integrand of a parallel dipole in an infinite medium.
+    """
+
+    v = np.sqrt(1 - np.minimum(u, 1) ** 2)
+
+    return 0.75 * (4 / 3.0 - v - v ** 3 / 3)
+
+
+def _integrate(function, tolerance, maxIntervals):
+    """
+    Integrates function over [0, 1] with an adaptive 15 point
+    Gauss-Kronrod rule. The function maps an array of nodes to an array
+    of values with the nodes along the last axis, so all the integrals
+    share the same subdivision, which is refined until every one of
+    them meets the absolute tolerance (relative, for integrals larger
+    than 1).
+
+    Returns the integrals and the estimates of their absolute errors.
+    """
+
+    def rule(lower, upper):
+        centers = (lower + upper) / 2
+        halves = (upper - lower) / 2
+        nodes = centers[:, np.newaxis] + halves[:, np.newaxis] * \
+                _kronrodNodes
+        samples = function(nodes.ravel())
+        samples = samples.reshape(samples.shape[:-1] + nodes.shape)
+        kronrod = np.dot(samples, _kronrodWeights) * halves
+        gauss = np.dot(samples, _gaussWeights) * halves
+        return (kronrod, np.absolute(kronrod - gauss))
+
+    lower = np.array([0.0])
+    upper = np.array([1.0])
+    values, errors = rule(lower, upper)
+    while True:
+        total = values.sum(axis=-1)
+        scale = tolerance * np.maximum(np.absolute(total), 1)
+        if np.all(errors.sum(axis=-1) <= scale) or \
+                lower.size >= maxIntervals:
+            break
+
+        # Bisect the intervals that exceed their share of the tolerance
+        # for some integral, and at least the worst one.
+        share = (errors / scale[..., np.newaxis] / (upper - lower))
+        share = share.reshape(-1, lower.size).max(axis=0)
+        refine = share > 1
+        refine[np.argmax(share)] = True
+        middle = (lower[refine] + upper[refine]) / 2
+        newLower = np.concatenate((lower[refine], middle))
+        newUpper = np.concatenate((middle, upper[refine]))
+        newValues, newErrors = rule(newLower, newUpper)
+        lower = np.concatenate((lower[~refine], newLower))
+        upper = np.concatenate((upper[~refine], newUpper))
+        values = np.concatenate((values[..., ~refine], newValues), axis=-1)
+        errors = np.concatenate((errors[..., ~refine], newErrors), axis=-1)
+
+    return (total, errors.sum(axis=-1))
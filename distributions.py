@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+"""
+Name          : distributions
+Author        : Joan Juvert <trust.no.one.51@gmail.com>
+Version       : 1.0
+Description   : Distributions of emitters along the z axis of a
+              : multilayer.
+
+Copyright 2012 Joan Juvert
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+import scipy.special as special
+
+
+############################ Class definitions ########################
+
+
+class Distribution(object):
+    """
+    The Distribution class is the base of the distributions of emitters
+    (e.g. radiative centers) along the z axis of a multilayer. It is
+    not meant to be instantiated directly; use one of the subclasses:
+
+        - UniformDistribution
+        - ExponentialDistribution
+        - GaussianDistribution
+        - TabulatedDistribution
+
+    Within a homogeneous layer, |F(z)|^2 is a sum of exponentials of z.
+    The subclasses provide the integrals of their density against
+    exp(q * z) in closed form, which Multilayer.calculateDepthIntegral
+    uses to average the emission factors over the distribution without
+    sampling F along z.
+
+    The densities need not be normalized. The distributions are
+    restricted to a finite interval of the z axis, the support.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, zmin, zmax):
+        """
+        Initialize the support of the distribution.
+
+        Parameters
+        ----------
+        zmin, zmax : float
+            The lower and upper limits of the support.
+        """
+
+        try:
+            zmin = float(zmin)
+            zmax = float(zmax)
+        except (TypeError, ValueError):
+            error = "Distribution creation error: the limits of the " + \
+                    "support must be numbers"
+            print(error)
+            raise TypeError
+        if not (np.isfinite(zmin) and np.isfinite(zmax) and zmin < zmax):
+            error = "Distribution creation error: the support must be a " + \
+                    "finite interval with zmin < zmax"
+            print(error)
+            raise ValueError
+
+        self.__support = (zmin, zmax)
+        self.__weight = None
+
+    def getSupport(self):
+        """
+        Returns the limits of the support of the distribution.
+
+        Returns
+        -------
+        out : tuple
+            (zmin, zmax)
+        """
+
+        return self.__support
+
+    def getWeight(self):
+        """
+        Returns the integral of the density over the support.
+
+        Returns
+        -------
+        out : float
+            The total weight of the distribution.
+        """
+
+        if self.__weight is None:
+            zmin, zmax = self.__support
+            self.__weight = float(self.calculateIntegral(
+                    0.0, zmin, zmax, zmin).real)
+
+        return self.__weight
+
+    def calculateDensity(self, z):
+        """
+        Returns the (unnormalized) density of the distribution at z. It
+        is zero outside the support.
+
+        Parameters
+        ----------
+        z : float or numpy.ndarray
+            The z coordinates.
+
+        Returns
+        -------
+        out : numpy.ndarray
+            The density with the shape of z.
+        """
+
+        raise NotImplementedError
+
+    def calculateIntegral(self, q, lower, upper, reference):
+        """
+        Calculates the integral of rho(z) * exp(q * (z - reference))
+        between lower and upper, where rho is the density of the
+        distribution.
+
+        Parameters
+        ----------
+        q : complex or numpy.ndarray
+            The complex rates of the exponentials.
+        lower, upper : float
+            The integration limits. They are clipped to the support.
+        reference : float
+            The origin of the exponentials. Choosing it within the
+            integration interval avoids overflows.
+
+        Returns
+        -------
+        out : numpy.ndarray
+            The integrals with the shape of q.
+        """
+
+        raise NotImplementedError
+
+    def _clip(self, lower, upper):
+        """
+        Returns the integration limits clipped to the support, or None
+        if the interval does not overlap the support.
+        """
+
+        lower = max(lower, self.__support[0])
+        upper = min(upper, self.__support[1])
+        if lower >= upper:
+            return None
+
+        return (lower, upper)
+
+
+class UniformDistribution(Distribution):
+    """
+    A uniform distribution of emitters between zmin and zmax.
+    """
+
+    def __init__(self, zmin, zmax):
+        """
+        Initialize a UniformDistribution instance.
+
+        Parameters
+        ----------
+        zmin, zmax : float
+            The limits of the distribution.
+
+        Returns
+        -------
+        out : UniformDistribution
+            A UniformDistribution instance.
+        """
+
+        Distribution.__init__(self, zmin, zmax)
+
+    def calculateDensity(self, z):
+        z = np.asarray(z, dtype=np.float64)
+        zmin, zmax = self.getSupport()
+
+        return ((z >= zmin) & (z <= zmax)).astype(np.float64)
+
+    calculateDensity.__doc__ = Distribution.calculateDensity.__doc__
+
+    def calculateIntegral(self, q, lower, upper, reference):
+        q = np.asarray(q, dtype=np.complex128)
+        limits = self._clip(lower, upper)
+        if limits is None:
+            return np.zeros(q.shape, dtype=np.complex128)
+
+        return _exponentialIntegral(q, 0.0, limits, reference)
+
+    calculateIntegral.__doc__ = Distribution.calculateIntegral.__doc__
+
+
+class ExponentialDistribution(Distribution):
+    """
+    An exponential distribution of emitters between zmin and zmax. The
+    density is exp(rate * (z - zmax)), so a positive rate concentrates
+    the emitters near the upper limit and a negative rate near the
+    lower limit.
+    """
+
+    def __init__(self, zmin, zmax, rate):
+        """
+        Initialize an ExponentialDistribution instance.
+
+        Parameters
+        ----------
+        zmin, zmax : float
+            The limits of the distribution.
+        rate : float
+            The inverse of the decay length of the density, in the
+            inverse units of z.
+
+        Returns
+        -------
+        out : ExponentialDistribution
+            An ExponentialDistribution instance.
+        """
+
+        Distribution.__init__(self, zmin, zmax)
+        self.__rate = float(rate)
+
+    def getRate(self):
+        """
+        Returns the rate of the exponential density.
+        """
+
+        return self.__rate
+
+    def calculateDensity(self, z):
+        z = np.asarray(z, dtype=np.float64)
+        zmin, zmax = self.getSupport()
+        inside = (z >= zmin) & (z <= zmax)
+
+        return np.where(inside, np.exp(self.__rate * (np.clip(z, zmin, zmax)
+                                                      - zmax)), 0.0)
+
+    calculateDensity.__doc__ = Distribution.calculateDensity.__doc__
+
+    def calculateIntegral(self, q, lower, upper, reference):
+        q = np.asarray(q, dtype=np.complex128)
+        limits = self._clip(lower, upper)
+        if limits is None:
+            return np.zeros(q.shape, dtype=np.complex128)
+
+        # exp(rate * (z - zmax)) = exp(rate * (reference - zmax)) *
+        #                          exp(rate * (z - reference))
+        return _exponentialIntegral(
+                q + self.__rate, self.__rate * (reference -
+                                                self.getSupport()[1]),
+                limits, reference)
+
+    calculateIntegral.__doc__ = Distribution.calculateIntegral.__doc__
+
+
+class GaussianDistribution(Distribution):
+    """
+    A Gaussian distribution of emitters with density
+    exp(-(z - mu)^2 / (2 * sigma^2)), truncated to the interval
+    [zmin, zmax].
+    """
+
+    def __init__(self, mu, sigma, zmin=None, zmax=None):
+        """
+        Initialize a GaussianDistribution instance.
+
+        Parameters
+        ----------
+        mu : float
+            The center of the distribution.
+        sigma : float
+            The standard deviation of the distribution.
+        zmin, zmax : float, optional
+            The limits of the distribution. Default: mu -/+ 8 * sigma,
+            where the density is negligible.
+
+        Returns
+        -------
+        out : GaussianDistribution
+            A GaussianDistribution instance.
+        """
+
+        if sigma <= 0:
+            error = "Distribution creation error: sigma must be positive"
+            print(error)
+            raise ValueError
+        if zmin is None:
+            zmin = mu - 8 * sigma
+        if zmax is None:
+            zmax = mu + 8 * sigma
+
+        Distribution.__init__(self, zmin, zmax)
+        self.__mu = float(mu)
+        self.__sigma = float(sigma)
+
+    def getMu(self):
+        """
+        Returns the center of the distribution.
+        """
+
+        return self.__mu
+
+    def getSigma(self):
+        """
+        Returns the standard deviation of the distribution.
+        """
+
+        return self.__sigma
+
+    def calculateDensity(self, z):
+        z = np.asarray(z, dtype=np.float64)
+        zmin, zmax = self.getSupport()
+        inside = (z >= zmin) & (z <= zmax)
+
+        return np.where(inside, np.exp(-(z - self.__mu) ** 2 /
+                                       (2 * self.__sigma ** 2)), 0.0)
+
+    calculateDensity.__doc__ = Distribution.calculateDensity.__doc__
+
+    def calculateIntegral(self, q, lower, upper, reference):
+        q = np.asarray(q, dtype=np.complex128)
+        limits = self._clip(lower, upper)
+        if limits is None:
+            return np.zeros(q.shape, dtype=np.complex128)
+
+        # With t = (z - mu) / (sqrt(2) * sigma) and p = q * sigma /
+        # sqrt(2) the integral becomes
+        #
+        #   sqrt(pi / 2) * sigma * exp(q * (mu - reference) + p^2) *
+        #   (erfc(ta - p) - erfc(tb - p)).
+        #
+        # The complementary error functions are written in terms of the
+        # Faddeeva function w, which stays finite where exp(p^2) and
+        # erfc overflow.
+        mu = self.__mu
+        sigma = self.__sigma
+        p = q * sigma / np.sqrt(2)
+        shift = q * (mu - reference)
+        ta, tb = [(limit - mu) / (np.sqrt(2) * sigma) for limit in limits]
+
+        def scaledErfc(t):
+            # exp(shift + p^2) * erfc(t - p) without the constant 2 *
+            # exp(shift + p^2) that appears when Re(t - p) < 0.
+            zeta = t - p
+            negative = zeta.real < 0
+            argument = np.where(negative, -1j * zeta, 1j * zeta)
+            value = np.exp(shift + 2 * t * p - t ** 2) * \
+                    special.wofz(argument)
+            return (np.where(negative, -value, value), negative)
+
+        valueA, negativeA = scaledErfc(ta)
+        valueB, negativeB = scaledErfc(tb)
+        difference = valueA - valueB
+        crossing = negativeA & ~negativeB
+        if np.any(crossing):
+            difference = difference + np.where(
+                    crossing, 2 * np.exp(shift + p ** 2), 0)
+
+        return np.sqrt(np.pi / 2) * sigma * difference
+
+    calculateIntegral.__doc__ = Distribution.calculateIntegral.__doc__
+
+
+class TabulatedDistribution(Distribution):
+    """
+    A distribution of emitters given by a table of densities. The
+    density is linearly interpolated between the tabulated points and
+    is zero outside them.
+    """
+
+    def __init__(self, z, density):
+        """
+        Initialize a TabulatedDistribution instance.
+
+        Parameters
+        ----------
+        z : numpy.ndarray
+            The increasing z coordinates of the table.
+        density : numpy.ndarray
+            The non-negative density at each z coordinate.
+
+        Returns
+        -------
+        out : TabulatedDistribution
+            A TabulatedDistribution instance.
+        """
+
+        z = np.asarray(z, dtype=np.float64)
+        density = np.asarray(density, dtype=np.float64)
+        if z.ndim != 1 or z.shape != density.shape or z.size < 2:
+            error = "Distribution creation error: z and density must " + \
+                    "be 1D arrays with the same size (at least 2)"
+            print(error)
+            raise ValueError
+        if np.any(np.diff(z) <= 0):
+            error = "Distribution creation error: z must be increasing"
+            print(error)
+            raise ValueError
+        if np.any(density < 0):
+            error = "Distribution creation error: the density must be " + \
+                    "non-negative"
+            print(error)
+            raise ValueError
+
+        Distribution.__init__(self, z[0], z[-1])
+        self.__z = z
+        self.__density = density
+
+    def calculateDensity(self, z):
+        return np.interp(z, self.__z, self.__density, left=0, right=0)
+
+    calculateDensity.__doc__ = Distribution.calculateDensity.__doc__
+
+    def calculateIntegral(self, q, lower, upper, reference):
+        q = np.asarray(q, dtype=np.complex128)
+        limits = self._clip(lower, upper)
+        if limits is None:
+            return np.zeros(q.shape, dtype=np.complex128)
+
+        # Pieces of the table within the limits. Within each piece the
+        # density is rho(m) + slope * (z - m), where m is the center of
+        # the piece.
+        nodes = np.concatenate((
+                [limits[0]],
+                self.__z[(self.__z > limits[0]) & (self.__z < limits[1])],
+                [limits[1]]))
+        centers = (nodes[1:] + nodes[:-1]) / 2
+        halfWidths = (nodes[1:] - nodes[:-1]) / 2
+        slopes = np.diff(np.interp(nodes, self.__z, self.__density)) / \
+                (2 * halfWidths)
+        densities = np.interp(centers, self.__z, self.__density)
+
+        x = q[..., np.newaxis] * halfWidths
+        pieces = np.exp(q[..., np.newaxis] * (centers - reference)) * \
+                2 * halfWidths * (densities * _sinhc(x) +
+                                  slopes * halfWidths * _sinhc1(x))
+
+        return pieces.sum(axis=-1)
+
+    calculateIntegral.__doc__ = Distribution.calculateIntegral.__doc__
+
+
+######################### Auxiliary functions #########################
+
+
+def _sinhc(x):
+    """
+    Returns sinh(x) / x for complex x, accurate also near x = 0.
+    """
+
+    x = np.asarray(x, dtype=np.complex128)
+    small = np.absolute(x) < 0.1
+    safe = np.where(small, 1, x)
+    x2 = x ** 2
+    series = 1 + x2 / 6 * (1 + x2 / 20 * (1 + x2 / 42 * (1 + x2 / 72)))
+
+    return np.where(small, series, np.sinh(safe) / safe)
+
+
+def _sinhc1(x):
+    """
+    Returns (x * cosh(x) - sinh(x)) / x^2 for complex x, accurate also
+    near x = 0. Note that the integral of u * exp(x * u) between -1 and
+    1 is 2 * _sinhc1(x).
+    """
+
+    x = np.asarray(x, dtype=np.complex128)
+    small = np.absolute(x) < 0.1
+    safe = np.where(small, 1, x)
+    x2 = x ** 2
+    series = x / 3 * (1 + x2 / 10 * (1 + x2 / 28 * (1 + x2 / 54 *
+                                                     (1 + x2 / 88))))
+
+    return np.where(small, series,
+                    (safe * np.cosh(safe) - np.sinh(safe)) / safe ** 2)
+
+
+def _exponentialIntegral(q, offset, limits, reference):
+    """
+    Returns the integral of exp(offset + q * (z - reference)) between
+    the limits.
+    """
+
+    lower, upper = limits
+    center = (lower + upper) / 2.0
+    halfWidth = (upper - lower) / 2.0
+
+    return np.exp(offset + q * (center - reference)) * 2 * halfWidth * \
+            _sinhc(q * halfWidth)
@@ -24,6 +24,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import multilayers as ml
+import shards as sh
 import numpy as np
 import bphysics as bp
 import scipy.integrate as int
@@ -44,6 +45,12 @@ parser.add_argument(
         "-o",
         "--output",
         help = "Dump the results to a file")
+parser.add_argument(
+        "-c",
+        "--checkpoint",
+        help = "Keep the finished chunks of the calculation of F in " + \
+        "this directory and resume from them if the script is " + \
+        "interrupted and run again")
 args = parser.parse_args()
 
 # Create the materials
@@ -99,21 +106,29 @@ print("Done")
 # times instead of three.
 print("Calculating F... ")
 
-for (widx, wlength) in enumerate(wlist):
-    percent = (float(widx) / wlist.size) * 100
-    print("%.2f%%" % percent)
-    for (aidx, angle) in enumerate(alist):
-        resmatrix[aidx][widx]['fx'] = multilayer.calculateFx(z, wlength, angle)
-        resmatrix[aidx][widx]['fz'] = multilayer.calculateFz(z, wlength, angle)
-        resmatrix[aidx][widx]['fy'] = multilayer.calculateFy(z, wlength, angle)
-
-# We are probably more interesed on the effect of the multilayer on the
-# energy rather than the electric field. What we want is |Fy(z)|^2 for
-# TE waves and |Fx(z) cosA^2 + Fz(z) sinA^2|^2 for TM waves.
-ftm = np.absolute(
-        resmatrix['fx'] * np.cos(alist.reshape(alist.size, 1)) ** 2 + \
-        resmatrix['fz'] * np.sin(alist.reshape(alist.size, 1)) ** 2) ** 2
-fte = np.absolute(resmatrix['fy']) ** 2
+if args.checkpoint:
+    # The chunks already in the checkpoint directory are not calculated
+    # again
+    results = sh.resumeSweep(args.checkpoint, multilayer, [z], wlist, alist,
+                             output = 'energy')
+    fte = results['te'][0].T
+    ftm = results['tm'][0].T
+else:
+    for (widx, wlength) in enumerate(wlist):
+        percent = (float(widx) / wlist.size) * 100
+        print("%.2f%%" % percent)
+        for (aidx, angle) in enumerate(alist):
+            resmatrix[aidx][widx]['fx'] = multilayer.calculateFx(z, wlength, angle)
+            resmatrix[aidx][widx]['fz'] = multilayer.calculateFz(z, wlength, angle)
+            resmatrix[aidx][widx]['fy'] = multilayer.calculateFy(z, wlength, angle)
+
+    # We are probably more interesed on the effect of the multilayer on the
+    # energy rather than the electric field. What we want is |Fy(z)|^2 for
+    # TE waves and |Fx(z) cosA^2 + Fz(z) sinA^2|^2 for TM waves.
+    ftm = np.absolute(
+            resmatrix['fx'] * np.cos(alist.reshape(alist.size, 1)) ** 2 + \
+            resmatrix['fz'] * np.sin(alist.reshape(alist.size, 1)) ** 2) ** 2
+    fte = np.absolute(resmatrix['fy']) ** 2
 
 # For each angle, integrate over the wavelengths. We want the integral
 # in relation to what we would have without the multilayer, which is the
@@ -24,6 +24,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import multilayers as ml
+import shards as sh
 import numpy as np
 import bphysics as bp
 import scipy.integrate as integ
@@ -58,6 +59,12 @@ parser.add_argument(
         "-l",
         "--loadmatrix",
         help = "Load the matrix with the F(z, lambda) values from a file")
+parser.add_argument(
+        "-c",
+        "--checkpoint",
+        help = "Keep the finished chunks of the calculation of F(z, " + \
+        "lambda) in this directory and resume from them if the script " + \
+        "is interrupted and run again")
 args = parser.parse_args()
 
 # Load the depth distribution of radiative centers. Note that the origin
@@ -136,22 +143,30 @@ else:
     # recalculating the characteristic matrix at every iteration due to the
     # change of polarization.
     print("Calculating F...")
-    for (widx, wlength) in enumerate(wlist):
-        percent = (float(widx) / wlist.size) * 100
-        print("%.2f%%" % percent)
-        for (zidx, z) in enumerate(zlist):
-            resmatrix[zidx][widx]['fx'] = multilayer.calculateFx(z, wlength, angle)
-            resmatrix[zidx][widx]['fz'] = multilayer.calculateFz(z, wlength, angle)
-        for (zidx, z) in enumerate(zlist):
-            resmatrix[zidx][widx]['fy'] = multilayer.calculateFy(z, wlength, angle)
-
-    # We are probably more interesed on the effect of the multilayer on the
-    # energy rather than the electric field. What we want is |Fy(z)|^2 for
-    # TE waves and |Fx(z) cosA^2 + Fz(z) sinA^2|^2 for TM waves.
-    ftm = np.absolute(
-            resmatrix['fx'] * np.cos(angle) ** 2 + \
-            resmatrix['fz'] * np.sin(angle) ** 2) ** 2
-    fte = np.absolute(resmatrix['fy']) ** 2
+    if args.checkpoint:
+        # The chunks already in the checkpoint directory are not
+        # calculated again
+        results = sh.resumeSweep(args.checkpoint, multilayer, zlist, wlist,
+                                 [angle], output = 'energy')
+        fte = results['te'][:, :, 0]
+        ftm = results['tm'][:, :, 0]
+    else:
+        for (widx, wlength) in enumerate(wlist):
+            percent = (float(widx) / wlist.size) * 100
+            print("%.2f%%" % percent)
+            for (zidx, z) in enumerate(zlist):
+                resmatrix[zidx][widx]['fx'] = multilayer.calculateFx(z, wlength, angle)
+                resmatrix[zidx][widx]['fz'] = multilayer.calculateFz(z, wlength, angle)
+            for (zidx, z) in enumerate(zlist):
+                resmatrix[zidx][widx]['fy'] = multilayer.calculateFy(z, wlength, angle)
+
+        # We are probably more interesed on the effect of the multilayer on the
+        # energy rather than the electric field. What we want is |Fy(z)|^2 for
+        # TE waves and |Fx(z) cosA^2 + Fz(z) sinA^2|^2 for TM waves.
+        ftm = np.absolute(
+                resmatrix['fx'] * np.cos(angle) ** 2 + \
+                resmatrix['fz'] * np.sin(angle) ** 2) ** 2
+        fte = np.absolute(resmatrix['fy']) ** 2
     print("Done")
 
     # Notice that until now we have not used the distribution of the
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Name          : excitation
+Author        : Joan Juvert <trust.no.one.51@gmail.com>
+Version       : 1.0
+Description   : Excitation-emission maps of the photoluminescence of a
+              : distribution of emitters within a multilayer.
+
+Copyright 2012 Joan Juvert
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import distributions as ds
+import multilayers as ml
+import numpy as np
+
+
+############################ Class definitions ########################
+
+
+class ExcitationEmissionMap(object):
+    """
+    The ExcitationEmissionMap class calculates the photoluminescence of
+    a distribution of emitters within a multilayer as a function of the
+    excitation and the emission wavelengths:
+
+        I(lambda_exc, lambda_em, theta) = integral(rho(z) *
+                A(z, lambda_exc) * F(z, lambda_em, theta) * dz)
+
+    where rho is the density of emitters, A is the power of the pump
+    absorbed per unit length at depth z (relative to the incident power)
+    and F is the TE or TM emission factor observed at the angle theta:
+
+        F_TE = |Fy|^2
+        F_TM = |Fx * cos(theta)^2 + Fz * sin(theta)^2|^2
+
+    The pump is a plane wave incident from the top medium, which must be
+    transparent. Its standing wave within the multilayer is the same
+    field that gives the emission factors (by reciprocity), so
+
+        A(z) = 2 * pi / lambda * Im(n(z)^2) * |E(z)|^2 / (n_0 * cos(theta_0))
+
+    with |E|^2 = |Fy|^2 for TE and |Fx|^2 * cos(theta_0)^2 + |Fz|^2 *
+    sin(theta_0)^2 for TM, where theta_0 is the angle of incidence.
+
+    F is calculated once on the grid of depths for all the excitation
+    and emission wavelengths (without repeating the wavelengths shared
+    by both) and for the pump and detection angles together, so the
+    matrices of every wavelength are calculated only once and serve
+    both the absorption and the emission. The integral over z is then a
+    matrix product over the depths, calculated with the trapezoidal
+    rule. The depths should not cross interfaces, where A is
+    discontinuous.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, multilayer, zlist, excitation, emission, angles,
+                 pumpAngle=0.0, pumpPolarization='unpolarized'):
+        """
+        Initialize an ExcitationEmissionMap instance.
+
+        Parameters
+        ----------
+        multilayer : Multilayer
+            The multilayer system.
+        zlist : numpy.ndarray
+            The depths of the grid, in increasing order.
+        excitation : numpy.ndarray
+            The excitation (pump) wavelengths.
+        emission : numpy.ndarray
+            The emission wavelengths.
+        angles : float or numpy.ndarray
+            The detection angles in radians, in the top medium.
+        pumpAngle : float, optional
+            The angle of incidence of the pump in radians, in the top
+            medium. Default: 0.
+        pumpPolarization : str, optional
+            'te', 'tm' or 'unpolarized' (the average of both). Default:
+            'unpolarized'.
+
+        Returns
+        -------
+        out : ExcitationEmissionMap
+            An ExcitationEmissionMap instance.
+        """
+
+        if not isinstance(multilayer, ml.Multilayer):
+            error = "ExcitationEmissionMap creation error: a Multilayer " + \
+                    "instance is expected"
+            print(error)
+            raise TypeError
+        zlist = np.atleast_1d(np.asarray(zlist, dtype=np.float64))
+        if zlist.ndim != 1 or zlist.size < 2 or np.any(np.diff(zlist) <= 0):
+            error = "ExcitationEmissionMap creation error: the depths " + \
+                    "must be increasing"
+            print(error)
+            raise ValueError
+        pumpPolarization = pumpPolarization.lower()
+        if pumpPolarization not in ['te', 'tm', 'unpolarized']:
+            error = "ExcitationEmissionMap creation error: the " + \
+                    "polarization of the pump must be 'te', 'tm' or " + \
+                    "'unpolarized'"
+            print(error)
+            raise ValueError
+        if not 0 <= pumpAngle < np.pi / 2:
+            error = "ExcitationEmissionMap creation error: the angle of " + \
+                    "the pump must be in [0, pi/2)"
+            print(error)
+            raise ValueError
+
+        self.__multilayer = multilayer
+        self.__zlist = zlist
+        self.__excitation = np.atleast_1d(np.asarray(excitation,
+                                                     dtype=np.float64))
+        self.__emission = np.atleast_1d(np.asarray(emission,
+                                                   dtype=np.float64))
+        self.__angles = np.atleast_1d(np.asarray(angles, dtype=np.float64))
+        self.__pumpAngle = float(pumpAngle)
+        self.__pumpPolarization = pumpPolarization
+
+        # Trapezoidal weights of the depths
+        self.__weights = np.zeros(zlist.size)
+        self.__weights[1:] += np.diff(zlist) / 2
+        self.__weights[:-1] += np.diff(zlist) / 2
+
+    def getZ(self):
+        """
+        Returns the depths of the grid.
+        """
+
+        return self.__zlist
+
+    def getExcitation(self):
+        """
+        Returns the excitation wavelengths.
+        """
+
+        return self.__excitation
+
+    def getEmission(self):
+        """
+        Returns the emission wavelengths.
+        """
+
+        return self.__emission
+
+    def getAngles(self):
+        """
+        Returns the detection angles in radians.
+        """
+
+        return self.__angles
+
+    def calculateProfiles(self):
+        """
+        Calculates the absorption of the pump and the emission factors on
+        the grid of depths.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with the keys:
+                - absorption: the absorbed power per unit length relative
+                  to the incident power, with shape (number of depths,
+                  number of excitation wavelengths).
+                - te, tm: the emission factors, with shape (number of
+                  depths, number of emission wavelengths, number of
+                  angles).
+        """
+
+        multilayer = self.__multilayer
+        zlist = self.__zlist
+        wlengths, inverse = np.unique(
+                np.concatenate((self.__excitation, self.__emission)),
+                return_inverse=True)
+        excitation = inverse[:self.__excitation.size]
+        emission = inverse[self.__excitation.size:]
+        angles = np.concatenate(([self.__pumpAngle], self.__angles))
+
+        refindices = multilayer.getRefrIndices(wlengths)
+        if np.any(np.absolute(refindices[:, 0].imag) > 1e-12):
+            error = "Error: the top medium must be transparent at the " + \
+                    "excitation wavelengths"
+            print(error)
+            raise ValueError
+
+        factors = multilayer.calculateF(
+                zlist[:, np.newaxis, np.newaxis], wlengths[:, np.newaxis],
+                angles)
+
+        # Absorption of the pump
+        pump = dict((key, value[:, excitation, 0]) for (key, value) in
+                    factors.items())
+        intensities = []
+        if self.__pumpPolarization in ['te', 'unpolarized']:
+            intensities.append(np.absolute(pump['fy']) ** 2)
+        if self.__pumpPolarization in ['tm', 'unpolarized']:
+            intensities.append(
+                    np.absolute(pump['fx']) ** 2 *
+                    np.cos(self.__pumpAngle) ** 2 +
+                    np.absolute(pump['fz']) ** 2 *
+                    np.sin(self.__pumpAngle) ** 2)
+        intensity = sum(intensities) / len(intensities)
+        layers = np.asarray(multilayer.getIndexAtPos(zlist))
+        refindices = refindices[excitation]
+        permittivity = (refindices[:, layers] ** 2).imag.T
+        absorption = 2 * np.pi / self.__excitation * permittivity * \
+            intensity / (refindices[:, 0].real * np.cos(self.__pumpAngle))
+
+        # Emission factors
+        detected = dict((key, value[:, emission, 1:]) for (key, value) in
+                        factors.items())
+        te = np.absolute(detected['fy']) ** 2
+        tm = np.absolute(detected['fx'] * np.cos(self.__angles) ** 2 +
+                         detected['fz'] * np.sin(self.__angles) ** 2) ** 2
+
+        return {'absorption': absorption, 'te': te, 'tm': tm}
+
+    def calculateMap(self, distribution=None):
+        """
+        Calculates the excitation-emission map.
+
+        Parameters
+        ----------
+        distribution : Distribution or numpy.ndarray, optional
+            The distribution of emitters (see the distributions module)
+            or its density sampled at the depths of the grid. By default
+            the density is 1 at all the depths of the grid.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with the keys:
+                - te, tm: the maps, with shape (number of excitation
+                  wavelengths, number of emission wavelengths, number of
+                  angles).
+                - absorption: the power of the pump absorbed by the
+                  emitters relative to the incident power (the integral
+                  of rho * A), for every excitation wavelength.
+        """
+
+        if distribution is None:
+            density = np.ones(self.__zlist.size)
+        elif isinstance(distribution, ds.Distribution):
+            density = distribution.calculateDensity(self.__zlist)
+        else:
+            density = np.asarray(distribution, dtype=np.float64)
+        if density.shape != self.__zlist.shape:
+            error = "Error: the density must be sampled at the depths of " + \
+                    "the grid"
+            print(error)
+            raise ValueError
+
+        profiles = self.calculateProfiles()
+        weighted = profiles['absorption'] * \
+            (density * self.__weights)[:, np.newaxis]
+        shape = (self.__excitation.size, self.__emission.size,
+                 self.__angles.size)
+        results = {'absorption': np.sum(weighted, axis=0)}
+        for key in ['te', 'tm']:
+            results[key] = np.dot(
+                    weighted.T,
+                    profiles[key].reshape(self.__zlist.size, -1)).reshape(
+                            shape)
+
+        return results
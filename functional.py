@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Name          : functional
+Author        : Joan Juvert <trust.no.one.51@gmail.com>
+Version       : 1.0
+Description   : Stateless functions that evaluate the optical properties
+              : of immutable descriptions of multilayers.
+
+Copyright 2012 Joan Juvert
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+The Multilayer class keeps the working wavelength, polarization and
+propagation angles, which the scalar methods (calculateFx, etc.) change,
+and its thicknesses can be changed at any time. A Multilayer shared by
+several threads therefore gives wrong results if one of them changes it
+while another one is calculating.
+
+The functions of this module take instead an immutable description of
+the multilayer, a stack, made by freezeStack. A stack is a tuple of
+(medium, thickness) tuples, from the top medium to the bottom medium,
+with infinite thicknesses for the top and bottom mediums. Every call
+builds its own private Multilayer from the stack (which takes a few
+microseconds) and uses its batched methods, which do not change it. No
+state is shared between calls, so the functions can be called
+concurrently from several threads; NumPy releases the GIL in the
+heavy operations on large arrays. The Medium instances are shared, but
+they are never changed after being loaded.
+
+Example
+-------
+stack = freezeStack([air, [sro, 100], [sio2, 50], silicon])
+pool = multiprocessing.pool.ThreadPool(4)
+results = pool.map(lambda wlengths: calculateF(stack, z, wlengths, 0),
+                   chunks)
+"""
+
+import multilayers as ml
+
+
+######################### Auxiliary functions #########################
+
+
+def freezeStack(mediums):
+    """
+    Returns an immutable description of a multilayer.
+
+    Parameters
+    ----------
+    mediums : Multilayer or list
+        A Multilayer instance, whose current thicknesses are taken, or a
+        list of mediums in the format accepted by Multilayer.
+
+    Returns
+    -------
+    out : tuple
+        A tuple of (medium, thickness) tuples, from the top medium to
+        the bottom medium.
+    """
+
+    if isinstance(mediums, ml.Multilayer):
+        multilayer = mediums
+    else:
+        multilayer = ml.Multilayer(mediums)
+
+    return tuple((multilayer.getMedium(index),
+                  multilayer.getThickness(index))
+                 for index in range(multilayer.numLayers()))
+
+
+def calculateCoefficients(stack, wlengths, angles, polarization, index=0):
+    """
+    Calculates the coefficients r, t, R and T of a stack. See
+    Multilayer.calculateCoefficients.
+
+    Parameters
+    ----------
+    stack : tuple
+        The description of the multilayer made by freezeStack.
+    wlengths : float or numpy.ndarray
+        The wavelengths of the light.
+    angles : float or numpy.ndarray
+        The propagation angles in radians.
+    polarization : str
+        The polarization of the light, "te" or "tm".
+    index : int, optional
+        The index of the layer where the propagation angles are given.
+        By default the top medium (index = 0).
+
+    Returns
+    -------
+    out : dictionary
+        A dictionary with the keys {'r', 't', 'R', 'T'}.
+    """
+
+    return _multilayer(stack).calculateCoefficients(
+            wlengths, angles, polarization, index)
+
+
+def calculateF(stack, z, wlengths, angles, index=0, components='xyz',
+               output='field'):
+    """
+    Calculates Fx, Fy and Fz (or the TE and TM emission factors) of a
+    stack. See Multilayer.calculateF.
+
+    Parameters
+    ----------
+    stack : tuple
+        The description of the multilayer made by freezeStack.
+    z : float or numpy.ndarray
+        The z coordinates of the emitting dipoles.
+    wlengths : float or numpy.ndarray
+        The wavelengths of the light.
+    angles : float or numpy.ndarray
+        The propagation angles in radians.
+    index : int, optional
+        The index of the layer where the propagation angles are given.
+        By default the top medium (index = 0).
+    components : str, optional
+        The components to calculate. Default: 'xyz'.
+    output : str, optional
+        'field' (default) or 'energy'.
+
+    Returns
+    -------
+    out : dictionary
+        The same dictionary as Multilayer.calculateF.
+    """
+
+    return _multilayer(stack).calculateF(z, wlengths, angles, index,
+                                         components, output)
+
+
+def calculateEmission(stack, z, wlengths, angles, index=0,
+                      orientation='isotropic'):
+    """
+    Calculates the TE and TM emission factors of dipoles with a given
+    orientation within a stack. See Multilayer.calculateEmission.
+
+    Parameters
+    ----------
+    stack : tuple
+        The description of the multilayer made by freezeStack.
+    z : float or numpy.ndarray
+        The z coordinates of the emitting dipoles.
+    wlengths : float or numpy.ndarray
+        The wavelengths of the light.
+    angles : float or numpy.ndarray
+        The propagation angles in radians.
+    index : int, optional
+        The index of the layer where the propagation angles are given.
+        By default the top medium (index = 0).
+    orientation : str or float, optional
+        The orientation of the dipoles. Default: 'isotropic'.
+
+    Returns
+    -------
+    out : dictionary
+        A dictionary with the keys {'te', 'tm'}.
+    """
+
+    return _multilayer(stack).calculateEmission(z, wlengths, angles, index,
+                                                orientation)
+
+
+def calculateDepthIntegral(stack, distribution, wlengths, angles, index=0):
+    """
+    Averages the TE and TM emission factors of a stack over a
+    distribution of emitters. See Multilayer.calculateDepthIntegral.
+
+    Parameters
+    ----------
+    stack : tuple
+        The description of the multilayer made by freezeStack.
+    distribution : Distribution
+        The distribution of emitters along the z axis.
+    wlengths : float or numpy.ndarray
+        The wavelengths of the light.
+    angles : float or numpy.ndarray
+        The propagation angles in radians.
+    index : int, optional
+        The index of the layer where the propagation angles are given.
+        By default the top medium (index = 0).
+
+    Returns
+    -------
+    out : dictionary
+        A dictionary with the keys {'te', 'tm'}.
+    """
+
+    return _multilayer(stack).calculateDepthIntegral(distribution, wlengths,
+                                                     angles, index)
+
+
+def _multilayer(stack):
+    """
+    Builds a private Multilayer from a stack.
+    """
+
+    if not isinstance(stack, tuple) or len(stack) < 2:
+        error = "Error: a stack made by freezeStack is expected"
+        print(error)
+        raise TypeError
+
+    return ml.Multilayer([stack[0][0]] +
+                         [[medium, thickness] for (medium, thickness) in
+                          stack[1:-1]] +
+                         [stack[-1][0]])
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+Name          : instrument
+Author        : Joan Juvert <trust.no.one.51@gmail.com>
+Version       : 1.0
+Description   : Averaging of the optical properties of a multilayer
+              : over the finite resolution of a measurement.
+
+Copyright 2012 Joan Juvert
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bphysics as bp
+import numpy as np
+
+
+############################ Class definitions ########################
+
+
+class Instrument(object):
+    """
+    The Instrument class describes the finite resolution of a
+    measurement and averages the results of a Multilayer over it.
+
+    Three distributions are taken into account:
+        - The spectral bandwidth (slit function of the spectrometer).
+        - The angular spread of the light (numerical aperture of the
+          objective).
+        - The relative spread of the layer thicknesses across the
+          measurement spot.
+
+    Each distribution is replaced by a fixed set of Gauss-Legendre
+    quadrature nodes spanning a given number of standard deviations
+    around the nominal value, weighted with the distribution kernel. By
+    default the kernels are Gaussian functions (see bphysics.gaussian),
+    but any other kernel can be given. All the nodes are evaluated in a
+    single call to the vectorized methods of the multilayer, so the
+    averaged result costs a fixed multiple (the product of the number
+    of nodes of each distribution) of a single evaluation.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, order=7, span=3.0):
+        """
+        Initialize an Instrument instance with perfect resolution. Use
+        the setBandwidth, setAngularSpread and setThicknessSpread
+        methods to describe the actual instrument.
+
+        Parameters
+        ----------
+        order : int, optional
+            The number of quadrature nodes used for every distribution
+            with nonzero width. Default: 7.
+        span : float, optional
+            The quadrature nodes cover the interval [-span * width,
+            span * width] around the nominal value. Default: 3.
+
+        Returns
+        -------
+        out : Instrument
+            An Instrument instance.
+        """
+
+        if int(order) != order or order < 1:
+            error = "Instrument creation error: order must be a " + \
+                    "positive integer"
+            print(error)
+            raise ValueError
+        if span <= 0:
+            error = "Instrument creation error: span must be positive"
+            print(error)
+            raise ValueError
+
+        self.__order = int(order)
+        self.__span = float(span)
+
+        # Each distribution is stored as a dictionary with the following
+        # keys:
+        #    - width: the standard deviation of the distribution.
+        #    - kernel: the function giving the (unnormalized) weight of
+        #      a deviation from the nominal value.
+        #    - nodes: deviations from the nominal value at which the
+        #      multilayer is evaluated.
+        #    - weights: the normalized quadrature weights.
+        self.__bandwidth = _distribution(0.0, None, self.__order, self.__span)
+        self.__angularSpread = _distribution(0.0, None, self.__order,
+                                             self.__span)
+        self.__thicknessSpread = _distribution(0.0, None, self.__order,
+                                               self.__span)
+        self.__thicknessLayers = None
+
+    def setBandwidth(self, width, kernel=None):
+        """
+        Sets the spectral bandwidth of the instrument.
+
+        Parameters
+        ----------
+        width : float
+            The standard deviation of the slit function in the same
+            units as the wavelengths. Zero means perfect resolution.
+        kernel : callable, optional
+            A function k(x) returning the (unnormalized) weight of a
+            wavelength deviation x from the nominal wavelength. It must
+            accept numpy arrays. By default a Gaussian function with
+            standard deviation width.
+        """
+
+        self.__bandwidth = _distribution(width, kernel, self.__order,
+                                         self.__span)
+
+    def getBandwidth(self):
+        """
+        Returns the standard deviation of the slit function.
+
+        Returns
+        -------
+        out : float
+            The spectral bandwidth in the units of the wavelengths.
+        """
+
+        return self.__bandwidth['width']
+
+    def setAngularSpread(self, width, kernel=None):
+        """
+        Sets the angular spread of the light in the plane of incidence.
+
+        Parameters
+        ----------
+        width : float
+            The standard deviation of the propagation angle in radians.
+            Zero means a perfectly collimated beam.
+        kernel : callable, optional
+            A function k(x) returning the (unnormalized) weight of an
+            angular deviation x from the nominal angle. It must accept
+            numpy arrays. By default a Gaussian function with standard
+            deviation width.
+        """
+
+        self.__angularSpread = _distribution(width, kernel, self.__order,
+                                             self.__span)
+
+    def getAngularSpread(self):
+        """
+        Returns the standard deviation of the propagation angle.
+
+        Returns
+        -------
+        out : float
+            The angular spread in radians.
+        """
+
+        return self.__angularSpread['width']
+
+    def setThicknessSpread(self, width, layers=None, kernel=None):
+        """
+        Sets the relative spread of the thicknesses across the
+        measurement spot.
+
+        The thicknesses of the selected layers are all scaled by the
+        same factor (1 + x), where x is distributed according to the
+        kernel. This describes the usual non-uniformity of a deposition
+        process.
+
+        Parameters
+        ----------
+        width : float
+            The standard deviation of the relative thickness deviation
+            x (e.g. 0.01 for a 1% non-uniformity).
+        layers : list, optional
+            The indices of the layers affected by the spread. By
+            default all the layers except the top and bottom mediums.
+        kernel : callable, optional
+            A function k(x) returning the (unnormalized) weight of a
+            relative deviation x. It must accept numpy arrays. By
+            default a Gaussian function with standard deviation width.
+        """
+
+        if layers is not None:
+            if not isinstance(layers, list):
+                error = "Error: layers must be a list of layer indices"
+                print(error)
+                raise TypeError
+            layers = list(layers)
+        self.__thicknessSpread = _distribution(width, kernel, self.__order,
+                                               self.__span)
+        self.__thicknessLayers = layers
+
+    def getThicknessSpread(self):
+        """
+        Returns the relative spread of the thicknesses.
+
+        Returns
+        -------
+        out : float
+            The standard deviation of the relative thickness deviation.
+        """
+
+        return self.__thicknessSpread['width']
+
+    def getNumNodes(self):
+        """
+        Returns the number of evaluations of the multilayer needed for
+        every averaged point, i.e. the cost of the averaging relative to
+        a single evaluation.
+
+        Returns
+        -------
+        out : int
+            The number of quadrature nodes per averaged point.
+        """
+
+        return self.__bandwidth['nodes'].size * \
+                self.__angularSpread['nodes'].size * \
+                self.__thicknessSpread['nodes'].size
+
+    def calculateCoefficients(self, multilayer, wlengths, angles,
+                              polarization, index=0):
+        """
+        Calculates the reflectance and transmittance of a multilayer
+        averaged over the spectral bandwidth, the angular spread and the
+        thickness spread of the instrument.
+
+        Only the reflectance and transmittance are returned because the
+        complex coefficients r and t lose their meaning once they are
+        averaged incoherently.
+
+        Parameters
+        ----------
+        multilayer : Multilayer
+            The multilayer system.
+        wlengths : float or numpy.ndarray
+            The nominal wavelengths. All the quadrature nodes must lie
+            within the range of wavelengths of the multilayer.
+        angles : float or numpy.ndarray
+            The nominal propagation angles in radians.
+        polarization : str
+            The polarization of the light, "te" or "tm".
+        index : int, optional
+            The index of the layer where the angles are given. By
+            default the top medium (index = 0).
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with keys {'R', 'T'}. Each value is an array
+            with the broadcast shape of wlengths and angles.
+        """
+
+        wlengths, angles = self.__nodes(wlengths, angles)
+        spread = self.__thicknessSpread
+        thicknesses = np.array([multilayer.getThickness(layer) for layer in
+                                range(multilayer.numLayers())])
+        if self.__thicknessLayers is None:
+            layers = list(range(1, multilayer.numLayers() - 1))
+        else:
+            layers = self.__thicknessLayers
+        scale = np.ones((spread['nodes'].size, thicknesses.size))
+        scale[:, layers] += spread['nodes'][:, np.newaxis]
+        thicknesses = thicknesses * scale
+
+        coefficients = multilayer.calculateCoefficients(
+                wlengths[..., np.newaxis], angles[..., np.newaxis],
+                polarization, index, thicknesses)
+
+        return {'R': self.__average(coefficients['R'], 3),
+                'T': self.__average(coefficients['T'], 3)}
+
+    def calculateF(self, multilayer, z, wlengths, angles):
+        """
+        Calculates the energy factors of the emission of a dipole at z
+        averaged over the spectral bandwidth and the angular spread of
+        the instrument.
+
+        The energy factors are those used throughout the examples:
+        |Fy|^2 for TE waves and |Fx * cos(A)^2 + Fz * sin(A)^2|^2 for TM
+        waves, where A is the propagation angle in the top medium at
+        each quadrature node. The thickness spread is not taken into
+        account here because it would move the dipoles with respect to
+        the interfaces.
+
+        Parameters
+        ----------
+        multilayer : Multilayer
+            The multilayer system.
+        z : float or numpy.ndarray
+            The z coordinates of the emitting dipoles.
+        wlengths : float or numpy.ndarray
+            The nominal wavelengths.
+        angles : float or numpy.ndarray
+            The nominal propagation angles in the top medium, in
+            radians.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with keys {'te', 'tm'}. Each value is an array
+            with the broadcast shape of z, wlengths and angles.
+        """
+
+        wlengths, angles = self.__nodes(wlengths, angles)
+        z = np.asarray(z, dtype=np.float64)[..., np.newaxis, np.newaxis]
+        f = multilayer.calculateF(z, wlengths, angles, output='energy')
+
+        return {'te': self.__average(f['te'], 2),
+                'tm': self.__average(f['tm'], 2)}
+
+    def __nodes(self, wlengths, angles):
+        """
+        Returns the wavelengths and angles at the quadrature nodes. Two
+        axes are appended: the wavelength nodes and the angle nodes.
+        """
+
+        wlengths = np.asarray(wlengths, dtype=np.float64)
+        angles = np.asarray(angles, dtype=np.float64)
+        wlengths = wlengths[..., np.newaxis, np.newaxis] + \
+                self.__bandwidth['nodes'][:, np.newaxis]
+        angles = angles[..., np.newaxis, np.newaxis] + \
+                self.__angularSpread['nodes']
+
+        return (wlengths, angles)
+
+    def __average(self, values, numAxes):
+        """
+        Returns the weighted sum of values over the trailing quadrature
+        axes (wavelength, angle and, if numAxes is 3, thickness).
+        """
+
+        weights = [self.__bandwidth['weights'],
+                   self.__angularSpread['weights'],
+                   self.__thicknessSpread['weights']][:numAxes]
+        for weight in reversed(weights):
+            values = np.dot(values, weight)
+
+        return values
+
+
+######################### Auxiliary functions #########################
+
+
+def _distribution(width, kernel, order, span):
+    """
+    Builds the quadrature nodes and weights of a distribution of the
+    given width (see the Instrument class). A zero width gives a single
+    node with unit weight.
+    """
+
+    try:
+        width = float(width)
+    except (TypeError, ValueError):
+        error = "Error: the width of a distribution must be a number"
+        print(error)
+        raise TypeError
+    if width < 0:
+        error = "Error: the width of a distribution must be >= 0"
+        print(error)
+        raise ValueError
+    if kernel is not None and not callable(kernel):
+        error = "Error: the kernel must be a callable"
+        print(error)
+        raise TypeError
+
+    if width == 0:
+        return {'width': 0.0, 'kernel': kernel, 'nodes': np.zeros(1),
+                'weights': np.ones(1)}
+
+    if kernel is None:
+        def kernel(x):
+            return bp.gaussian(x, 1, 0, width)
+
+    abscissae, weights = np.polynomial.legendre.leggauss(order)
+    nodes = span * width * abscissae
+    weights = weights * kernel(nodes)
+    if not np.all(np.isfinite(weights)) or weights.sum() <= 0:
+        error = "Error: the kernel must be positive within the " + \
+                "quadrature interval"
+        print(error)
+        raise ValueError
+
+    return {'width': width, 'kernel': kernel, 'nodes': nodes,
+            'weights': weights / weights.sum()}
@@ -0,0 +1,593 @@
+# -*- coding: utf-8 -*-
+"""
+Name          : jobs
+Author        : Joan Juvert <trust.no.one.51@gmail.com>
+Version       : 1.0
+Description   : Background jobs for long calculations (spectra, grids of
+              : F and fits) with progress, partial results, cancellation
+              : and asyncio support.
+
+Copyright 2012 Joan Juvert
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A JobManager runs the jobs submitted to it on a fixed number of worker
+threads, so the caller (for instance the event loop of a web server)
+never blocks on the calculations. NumPy releases the GIL in the heavy
+operations on large arrays. Every job is split into chunks of
+wavelengths, and its SweepJob gives the progress, the chunks already
+calculated and the final result, and cancels the job between two
+chunks.
+
+The multilayers and distributions given to the jobs must not be changed
+while the jobs are running (see also the functional module).
+
+With asyncio (Python 3) the jobs can be awaited and their chunks
+streamed with async for, without blocking the event loop:
+
+    manager = JobManager(2)
+    job = manager.submitSpectra(pipeline, wlengths)
+    async for chunk in job.streamChunks():
+        send(chunk)
+    spectra = await job
+
+Cancelling the task that awaits a job cancels the job too.
+"""
+
+import multilayers as ml
+import numpy as np
+import spectra as sp
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+
+############################ Class definitions ########################
+
+
+class SweepJob(object):
+    """
+    The SweepJob class follows a job submitted to a JobManager. The job
+    is a sequence of chunks calculated one after the other in a worker
+    thread; the result of the job is assembled from all of them when
+    the last one is finished.
+
+    The methods can be called from any thread. The chunks are kept, so
+    they can be read (and streamed) any number of times.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, chunks, numChunks, combine):
+        """
+        Initialize a SweepJob instance. The jobs are created by the
+        submit methods of JobManager.
+
+        Parameters
+        ----------
+        chunks : iterable
+            The chunks of the job, calculated when they are iterated.
+        numChunks : int
+            The number of chunks.
+        combine : callable
+            A function that assembles the result from the list of
+            chunks.
+
+        Returns
+        -------
+        out : SweepJob
+            A SweepJob instance.
+        """
+
+        self.__chunks = chunks
+        self.__numChunks = numChunks
+        self.__combine = combine
+        self.__done = []
+        self.__state = 'pending'
+        self.__result = None
+        self.__exception = None
+        self.__callbacks = []
+        self.__condition = threading.Condition()
+
+    def __await__(self):
+        """
+        Waits for the result in an asyncio event loop (Python 3 only).
+        """
+
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+
+        def transfer():
+            if future.cancelled():
+                return
+            try:
+                future.set_result(self.getResult())
+            except Exception as exception:
+                future.set_exception(exception)
+
+        def finished(future):
+            if future.cancelled():
+                self.cancel()
+
+        future.add_done_callback(finished)
+        self.__addCallback(lambda: loop.call_soon_threadsafe(transfer))
+
+        return future.__await__()
+
+    def getState(self):
+        """
+        Returns the state of the job: 'pending', 'running', 'finished',
+        'failed' or 'cancelled'.
+        """
+
+        return self.__state
+
+    def getProgress(self):
+        """
+        Returns the number of chunks calculated and the total number of
+        chunks as a tuple.
+        """
+
+        return (len(self.__done), self.__numChunks)
+
+    def isDone(self):
+        """
+        Returns True if the job is finished, failed or cancelled.
+        """
+
+        return self.__state in ['finished', 'failed', 'cancelled']
+
+    def cancel(self):
+        """
+        Cancels the job. A running job stops after its current chunk.
+
+        Returns
+        -------
+        out : bool
+            False if the job was already done, True otherwise.
+        """
+
+        with self.__condition:
+            if self.isDone():
+                return False
+            self.__state = 'cancelled'
+            self.__condition.notify_all()
+        self.__runCallbacks()
+
+        return True
+
+    def wait(self, timeout=None):
+        """
+        Waits for the job to be done.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum time to wait in seconds. By default there is no
+            limit.
+
+        Returns
+        -------
+        out : bool
+            True if the job is done.
+        """
+
+        with self.__condition:
+            self.__waitFor(self.isDone, timeout)
+
+            return self.isDone()
+
+    def getResult(self, timeout=None):
+        """
+        Waits for the job to be done and returns its result. The
+        exception raised by a failed job is raised again.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum time to wait in seconds. By default there is no
+            limit.
+
+        Returns
+        -------
+        out : object
+            The result of the job.
+        """
+
+        if not self.wait(timeout):
+            error = "Error: the job is not finished"
+            print(error)
+            raise RuntimeError
+        if self.__state == 'cancelled':
+            error = "Error: the job was cancelled"
+            print(error)
+            raise RuntimeError
+        if self.__state == 'failed':
+            raise self.__exception
+
+        return self.__result
+
+    def iterChunks(self, timeout=None):
+        """
+        Returns the chunks of the job as they are calculated.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum time to wait for every chunk in seconds. By
+            default there is no limit.
+
+        Returns
+        -------
+        out : generator
+            A generator of the chunks, in order. It stops when the job
+            is done; a failed job raises its exception after the last
+            chunk calculated.
+        """
+
+        position = 0
+        while True:
+            with self.__condition:
+                self.__waitFor(lambda: position < len(self.__done) or
+                               self.isDone(), timeout)
+                if position < len(self.__done):
+                    chunk = self.__done[position]
+                elif self.isDone():
+                    break
+                else:
+                    error = "Error: no chunk was calculated in time"
+                    print(error)
+                    raise RuntimeError
+            yield chunk
+            position += 1
+
+        if self.__state == 'failed':
+            raise self.__exception
+
+    def streamChunks(self):
+        """
+        Returns the chunks of the job as they are calculated in an
+        asyncio event loop (Python 3 only).
+
+        Returns
+        -------
+        out : asynchronous iterator
+            An iterator of the chunks for async for. Waiting for every
+            chunk takes a thread of the default executor of the loop.
+        """
+
+        return _ChunkStream(self.iterChunks())
+
+    def run(self):
+        """
+        Calculates the chunks of the job in the calling thread. The
+        JobManager calls it from its worker threads.
+        """
+
+        with self.__condition:
+            if self.__state != 'pending':
+                return
+            self.__state = 'running'
+
+        try:
+            for chunk in self.__chunks:
+                with self.__condition:
+                    if self.__state == 'cancelled':
+                        return
+                    self.__done.append(chunk)
+                    self.__condition.notify_all()
+            result = self.__combine(self.__done)
+        except Exception as exception:
+            with self.__condition:
+                if self.__state == 'cancelled':
+                    return
+                self.__exception = exception
+                self.__state = 'failed'
+                self.__condition.notify_all()
+        else:
+            with self.__condition:
+                if self.__state == 'cancelled':
+                    return
+                self.__result = result
+                self.__state = 'finished'
+                self.__condition.notify_all()
+        self.__runCallbacks()
+
+    def __waitFor(self, predicate, timeout):
+        """
+        Waits until predicate returns True or the timeout expires. The
+        condition must be held.
+        """
+
+        if timeout is not None:
+            deadline = time.time() + timeout
+        while not predicate():
+            if timeout is None:
+                self.__condition.wait()
+            elif time.time() < deadline:
+                self.__condition.wait(deadline - time.time())
+            else:
+                break
+
+    def __addCallback(self, callback):
+        """
+        Calls callback when the job is done (at once if it is done).
+        """
+
+        with self.__condition:
+            if not self.isDone():
+                self.__callbacks.append(callback)
+                return
+        callback()
+
+    def __runCallbacks(self):
+        """
+        Calls the callbacks waiting for the job to be done.
+        """
+
+        with self.__condition:
+            callbacks = self.__callbacks
+            self.__callbacks = []
+        for callback in callbacks:
+            callback()
+
+
+class JobManager(object):
+    """
+    The JobManager class runs jobs on a fixed number of worker threads,
+    in the order they are submitted. The submit methods return at once
+    with a SweepJob that follows the job.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, workers=1):
+        """
+        Initialize a JobManager instance.
+
+        Parameters
+        ----------
+        workers : int, optional
+            The number of worker threads. Default: 1.
+
+        Returns
+        -------
+        out : JobManager
+            A JobManager instance.
+        """
+
+        if int(workers) != workers or workers < 1:
+            error = "JobManager creation error: workers must be a " + \
+                    "positive integer"
+            print(error)
+            raise ValueError
+
+        self.__queue = queue.Queue()
+        self.__threads = []
+        for k in range(int(workers)):
+            thread = threading.Thread(target=_work, args=(self.__queue,))
+            thread.daemon = True
+            thread.start()
+            self.__threads.append(thread)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def getWorkers(self):
+        """
+        Returns the number of worker threads.
+        """
+
+        return len(self.__threads)
+
+    def close(self):
+        """
+        Waits for the submitted jobs and stops the worker threads.
+        """
+
+        for thread in self.__threads:
+            self.__queue.put(None)
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Submits a call to a function (for instance a fit such as
+        ProfileRetrieval.solveProfile or StackOptimizer.optimize) as a
+        job of a single chunk.
+
+        Parameters
+        ----------
+        function : callable
+            The function.
+        *args, **kwargs
+            The arguments of the function.
+
+        Returns
+        -------
+        out : SweepJob
+            The job, whose result is the value returned by the function.
+        """
+
+        def chunks():
+            yield function(*args, **kwargs)
+
+        return self.__submit(SweepJob(chunks(), 1, lambda done: done[0]))
+
+    def submitSpectra(self, pipeline, wlengths):
+        """
+        Submits the calculation of the spectra of a SpectralPipeline.
+
+        Parameters
+        ----------
+        pipeline : SpectralPipeline
+            The pipeline.
+        wlengths : numpy.ndarray
+            The wavelengths of the spectra (one-dimensional).
+
+        Returns
+        -------
+        out : SweepJob
+            The job. The chunks are those of
+            SpectralPipeline.iterateSpectra and the result is a
+            dictionary with keys {'te', 'tm'} as returned by
+            SpectralPipeline.calculateSpectra.
+        """
+
+        if not isinstance(pipeline, sp.SpectralPipeline):
+            error = "Error: a SpectralPipeline instance is expected"
+            print(error)
+            raise TypeError
+        wlengths = np.atleast_1d(np.asarray(wlengths, dtype=np.float64))
+        numChunks = -(-wlengths.size // pipeline.getChunkSize())
+
+        def combine(done):
+            return dict((key, np.concatenate([chunk[key] for chunk in done]))
+                        for key in ['te', 'tm'])
+
+        return self.__submit(SweepJob(pipeline.iterateSpectra(wlengths),
+                                      numChunks, combine))
+
+    def submitF(self, multilayer, z, wlengths, angles, index=0,
+                output='field', chunkSize=64):
+        """
+        Submits the calculation of F (or the emission factors) on a grid
+        of depths, wavelengths and angles. See Multilayer.calculateF.
+
+        Parameters
+        ----------
+        multilayer : Multilayer
+            The multilayer system.
+        z : numpy.ndarray
+            The z coordinates of the emitting dipoles (one-dimensional).
+        wlengths : numpy.ndarray
+            The wavelengths (one-dimensional).
+        angles : numpy.ndarray
+            The propagation angles in radians (one-dimensional).
+        index : int, optional
+            The index of the layer where the propagation angles are
+            given. By default the top medium (index = 0).
+        output : str, optional
+            'field' (default) or 'energy', as in Multilayer.calculateF.
+        chunkSize : int, optional
+            The number of wavelengths of every chunk. Default: 64.
+
+        Returns
+        -------
+        out : SweepJob
+            The job. Every chunk is a dictionary with the key 'wlength'
+            (the wavelengths of the chunk) and the keys of
+            Multilayer.calculateF, with shape (number of depths, number
+            of wavelengths in the chunk, number of angles). The result
+            has the same keys except 'wlength', for all the wavelengths.
+        """
+
+        if not isinstance(multilayer, ml.Multilayer):
+            error = "Error: a Multilayer instance is expected"
+            print(error)
+            raise TypeError
+        if output not in ['field', 'energy']:
+            error = "Error: output must be 'field' or 'energy'"
+            print(error)
+            raise ValueError
+        if int(chunkSize) != chunkSize or chunkSize < 1:
+            error = "Error: chunkSize must be a positive integer"
+            print(error)
+            raise ValueError
+        z, wlengths, angles = [np.atleast_1d(np.asarray(array,
+                                                        dtype=np.float64))
+                               for array in [z, wlengths, angles]]
+        chunkSize = int(chunkSize)
+
+        def chunks():
+            for start in range(0, wlengths.size, chunkSize):
+                chunk = wlengths[start:start + chunkSize]
+                factors = multilayer.calculateF(
+                        z[:, np.newaxis, np.newaxis], chunk[:, np.newaxis],
+                        angles, index, output=output)
+                factors['wlength'] = chunk
+                yield factors
+
+        def combine(done):
+            return dict((key, np.concatenate([chunk[key] for chunk in done],
+                                             axis=1))
+                        for key in done[0] if key != 'wlength')
+
+        return self.__submit(SweepJob(chunks(),
+                                      -(-wlengths.size // chunkSize),
+                                      combine))
+
+    def __submit(self, job):
+        """
+        Puts a job in the queue of the worker threads.
+        """
+
+        if not self.__threads:
+            error = "Error: the job manager has been closed"
+            print(error)
+            raise ValueError
+        self.__queue.put(job)
+
+        return job
+
+
+class _ChunkStream(object):
+    """
+    Asynchronous iterator over the chunks of a job.
+    """
+
+    def __init__(self, chunks):
+        self.__chunks = chunks
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return asyncio.get_event_loop().run_in_executor(None, self.__next)
+
+    def __next(self):
+        try:
+            return next(self.__chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+######################### Auxiliary functions #########################
+
+
+def _work(jobs):
+    """
+    Runs the jobs of a queue until it gives None.
+    """
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        job.run()
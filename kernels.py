@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+"""
+Name          : kernels
+Author        : Joan Juvert <trust.no.one.51@gmail.com>
+Version       : 1.0
+Description   : Compressed tables of the emission factors of a multilayer
+              : for the fast integration of many distributions of
+              : emitters.
+
+Copyright 2012 Joan Juvert
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import distributions as ds
+import multilayers as ml
+import numpy as np
+
+
+############################ Class definitions ########################
+
+
+class EmissionKernel(object):
+    """
+    The EmissionKernel class holds the emission factors
+
+        F_TE(z, lambda, theta) = |Fy|^2
+        F_TM(z, lambda, theta) = |Fx * cos(theta)^2 + Fz * sin(theta)^2|^2
+
+    of a multilayer on a grid of depths, wavelengths and angles, as the
+    matrix saved by the example radcenter_distribution.py with
+    --savematrix. The matrices (one row per depth) are compressed with
+    their singular value decomposition
+
+        F = U * S * V^T
+
+    keeping only the singular values needed for a relative error (in
+    the Frobenius norm) below a given tolerance. F(z, lambda) is smooth
+    in z, so the rank is usually small and the kernel takes much less
+    memory than the full matrices.
+
+    The averages of F over many distributions of emitters are then a
+    matrix product: every distribution is a row of densities on the
+    grid of depths, integrated with the trapezoidal rule. Hundreds of
+    distributions are integrated at once.
+
+    The kernels are saved to and loaded from numpy .npz files (see
+    saveKernel and loadKernel). Use calculateKernel to calculate the
+    kernel of a multilayer.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, zlist, wlengths, angles, factors, tolerance=1e-6):
+        """
+        Initialize an EmissionKernel instance.
+
+        Parameters
+        ----------
+        zlist : numpy.ndarray
+            The depths of the grid, in increasing order.
+        wlengths : numpy.ndarray
+            The wavelengths of the grid.
+        angles : numpy.ndarray
+            The angles of the grid in radians.
+        factors : dictionary
+            The emission factors, with keys {'te', 'tm'}. Each value is
+            an array with shape (number of depths, number of wavelengths,
+            number of angles), or a tuple (left, right) with its
+            compressed form as returned by getFactors, optionally
+            followed by the relative error of the compression.
+        tolerance : float, optional
+            The relative error allowed in the compression of the full
+            arrays. Default: 1e-6.
+
+        Returns
+        -------
+        out : EmissionKernel
+            An EmissionKernel instance.
+        """
+
+        zlist = np.atleast_1d(np.asarray(zlist, dtype=np.float64))
+        if zlist.ndim != 1 or zlist.size < 2 or np.any(np.diff(zlist) <= 0):
+            error = "EmissionKernel creation error: the depths must be " + \
+                    "increasing"
+            print(error)
+            raise ValueError
+        if not 0 <= tolerance < 1:
+            error = "EmissionKernel creation error: the tolerance must be " + \
+                    "in [0, 1)"
+            print(error)
+            raise ValueError
+
+        self.__zlist = zlist
+        self.__wlengths = np.atleast_1d(np.asarray(wlengths,
+                                                   dtype=np.float64))
+        self.__angles = np.atleast_1d(np.asarray(angles, dtype=np.float64))
+        self.__tolerance = tolerance
+        shape = (zlist.size, self.__wlengths.size, self.__angles.size)
+
+        self.__factors = {}
+        self.__errors = {}
+        for key in ['te', 'tm']:
+            value = factors[key]
+            if isinstance(value, tuple):
+                left, right = [np.asarray(array, dtype=np.float64)
+                               for array in value[:2]]
+                residual = float(value[2]) if len(value) > 2 else 0.0
+            else:
+                value = np.asarray(value, dtype=np.float64)
+                if value.shape != shape:
+                    error = "EmissionKernel creation error: the factors " + \
+                            "must have shape (number of depths, number " + \
+                            "of wavelengths, number of angles)"
+                    print(error)
+                    raise ValueError
+                left, right, residual = _compress(
+                        value.reshape(zlist.size, -1), tolerance)
+            if left.shape[0] != zlist.size or \
+                    right.shape[1] != shape[1] * shape[2]:
+                error = "EmissionKernel creation error: the compressed " + \
+                        "factors do not match the grid"
+                print(error)
+                raise ValueError
+            self.__factors[key] = (left, right)
+            self.__errors[key] = residual
+
+        # Trapezoidal weights of the depths
+        self.__weights = np.zeros(zlist.size)
+        self.__weights[1:] += np.diff(zlist) / 2
+        self.__weights[:-1] += np.diff(zlist) / 2
+
+    def getZ(self):
+        """
+        Returns the depths of the grid.
+        """
+
+        return self.__zlist
+
+    def getWavelengths(self):
+        """
+        Returns the wavelengths of the grid.
+        """
+
+        return self.__wlengths
+
+    def getAngles(self):
+        """
+        Returns the angles of the grid in radians.
+        """
+
+        return self.__angles
+
+    def getTolerance(self):
+        """
+        Returns the relative error allowed in the compression.
+        """
+
+        return self.__tolerance
+
+    def getRank(self):
+        """
+        Returns the rank of the compressed factors.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with keys {'te', 'tm'}.
+        """
+
+        return dict((key, value[0].shape[1]) for (key, value) in
+                    self.__factors.items())
+
+    def getError(self):
+        """
+        Returns the relative error of the compressed factors in the
+        Frobenius norm (zero if the kernel was created from compressed
+        factors without their error).
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with keys {'te', 'tm'}.
+        """
+
+        return dict(self.__errors)
+
+    def getFactors(self, key):
+        """
+        Returns the compressed factors of a polarization.
+
+        Parameters
+        ----------
+        key : str
+            'te' or 'tm'.
+
+        Returns
+        -------
+        out : tuple
+            (left, right), with shapes (number of depths, rank) and
+            (rank, number of wavelengths * number of angles). Their
+            product is the matrix of the factors with one row per depth.
+        """
+
+        return self.__factors[key]
+
+    def calculateFactors(self):
+        """
+        Returns the emission factors on the whole grid, decompressed.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with keys {'te', 'tm'}. Each value is an array
+            with shape (number of depths, number of wavelengths, number
+            of angles).
+        """
+
+        shape = (self.__zlist.size, self.__wlengths.size, self.__angles.size)
+        return dict((key, np.dot(left, right).reshape(shape)) for
+                    (key, (left, right)) in self.__factors.items())
+
+    def integrateDistributions(self, distributions):
+        """
+        Averages the emission factors over several distributions of
+        emitters at once.
+
+        Parameters
+        ----------
+        distributions : numpy.ndarray or list
+            The densities of the distributions sampled at the depths of
+            the grid, with shape (number of distributions, number of
+            depths) or (number of depths,) for a single one. A list of
+            Distribution instances is also accepted. The densities need
+            not be normalized.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with keys {'te', 'tm'}. Each value is an array
+            with shape (number of distributions, number of wavelengths,
+            number of angles), without the first axis for a single
+            distribution given as an array.
+        """
+
+        if isinstance(distributions, ds.Distribution):
+            distributions = [distributions]
+        if isinstance(distributions, list) and \
+                all(isinstance(distribution, ds.Distribution)
+                    for distribution in distributions):
+            densities = np.array([distribution.calculateDensity(self.__zlist)
+                                  for distribution in distributions])
+        else:
+            densities = np.asarray(distributions, dtype=np.float64)
+        single = densities.ndim == 1
+        densities = np.atleast_2d(densities)
+        if densities.ndim != 2 or densities.shape[1] != self.__zlist.size:
+            error = "Error: the densities must be sampled at the depths " + \
+                    "of the kernel"
+            print(error)
+            raise ValueError
+
+        weights = densities * self.__weights
+        totals = np.sum(weights, axis=1)
+        if np.any(totals == 0):
+            error = "Error: the distributions must have a non-zero weight " + \
+                    "within the grid"
+            print(error)
+            raise ValueError
+        weights = weights / totals[:, np.newaxis]
+
+        shape = (densities.shape[0], self.__wlengths.size,
+                 self.__angles.size)
+        results = {}
+        for (key, (left, right)) in self.__factors.items():
+            results[key] = np.dot(np.dot(weights, left), right).reshape(shape)
+            if single:
+                results[key] = results[key][0]
+
+        return results
+
+    def saveKernel(self, fname):
+        """
+        Saves the kernel to a numpy .npz file.
+
+        Parameters
+        ----------
+        fname : str
+            The name of the file, used as is (the extension .npz is not
+            added).
+        """
+
+        fhandle = open(fname, 'wb')
+        np.savez(fhandle, zlist=self.__zlist, wlist=self.__wlengths,
+                 angle=self.__angles, tolerance=self.__tolerance,
+                 teleft=self.__factors['te'][0],
+                 teright=self.__factors['te'][1],
+                 tmleft=self.__factors['tm'][0],
+                 tmright=self.__factors['tm'][1],
+                 teerror=self.__errors['te'], tmerror=self.__errors['tm'])
+        fhandle.close()
+
+
+######################### Auxiliary functions #########################
+
+
+def calculateKernel(multilayer, zlist, wlengths, angles, tolerance=1e-6,
+                    index=0):
+    """
+    Calculates the emission factors of a multilayer on a grid and
+    compresses them.
+
+    Parameters
+    ----------
+    multilayer : Multilayer
+        The multilayer system.
+    zlist : numpy.ndarray
+        The depths of the grid, in increasing order.
+    wlengths : numpy.ndarray
+        The wavelengths of the grid.
+    angles : float or numpy.ndarray
+        The angles of the grid in radians.
+    tolerance : float, optional
+        The relative error allowed in the compression. Default: 1e-6.
+    index : int, optional
+        The index of the layer where the angles are given. By default
+        the top medium (index = 0).
+
+    Returns
+    -------
+    out : EmissionKernel
+        The kernel.
+    """
+
+    if not isinstance(multilayer, ml.Multilayer):
+        error = "Error: a Multilayer instance is expected"
+        print(error)
+        raise TypeError
+
+    zlist = np.atleast_1d(np.asarray(zlist, dtype=np.float64))
+    wlengths = np.atleast_1d(np.asarray(wlengths, dtype=np.float64))
+    angles = np.atleast_1d(np.asarray(angles, dtype=np.float64))
+    factors = multilayer.calculateF(
+            zlist[:, np.newaxis, np.newaxis], wlengths[:, np.newaxis], angles,
+            index, output='energy')
+
+    return EmissionKernel(zlist, wlengths, angles, factors, tolerance)
+
+
+def loadKernel(fname):
+    """
+    Loads a kernel saved with EmissionKernel.saveKernel.
+
+    Parameters
+    ----------
+    fname : str
+        The name of the file.
+
+    Returns
+    -------
+    out : EmissionKernel
+        The kernel.
+    """
+
+    data = np.load(fname)
+    kernel = EmissionKernel(
+            data['zlist'], data['wlist'], data['angle'],
+            {'te': (data['teleft'], data['teright'], data['teerror']),
+             'tm': (data['tmleft'], data['tmright'], data['tmerror'])},
+            float(data['tolerance']))
+    data.close()
+
+    return kernel
+
+
+def _compress(matrix, tolerance):
+    """
+    Returns the truncated singular value decomposition of matrix as a
+    tuple (left, right, error), where left has the singular values
+    applied and error is the relative error in the Frobenius norm.
+    """
+
+    u, s, vt = np.linalg.svd(matrix, full_matrices=False)
+    total = np.sum(s ** 2)
+    if total == 0:
+        return (u[:, :1] * 0, vt[:1] * 0, 0.0)
+
+    # Squared norm of the discarded singular values for every rank
+    discarded = np.concatenate((np.cumsum((s ** 2)[::-1])[::-1], [0]))
+    rank = max(1, int(np.argmax(discarded <= tolerance ** 2 * total)))
+
+    return (u[:, :rank] * s[:rank], vt[:rank],
+            float(np.sqrt(discarded[rank] / total)))
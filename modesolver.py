@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+"""
+Name          : modesolver
+Author        : Joan Juvert <trust.no.one.51@gmail.com>
+Version       : 1.0
+Description   : A solver for the guided and leaky modes of multilayer
+              : systems.
+
+Copyright 2012 Joan Juvert
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import multilayers as ml
+import numpy as np
+
+
+############################ Class definitions ########################
+
+
+class ModeSolver(object):
+    """
+    The ModeSolver class finds the complex effective indices of the
+    modes of a Multilayer.
+
+    The modes are the poles of the reflection coefficient of the
+    multilayer, that is, the zeros of the denominator
+
+        D(neff) = (m11 + m12 * p_l) * p_i + m21 + m22 * p_l
+
+    of the coefficients calculated in Multilayer.updateCharMatrix, seen
+    as a function of the complex effective index neff = n * sin(theta)
+    (the normalized in-plane wavevector). The characteristic matrix is
+    an analytic function of neff, and so is D once the sign of the
+    normal component of the wavevector in the top and bottom mediums
+    is fixed. That choice is the Riemann sheet of each medium:
+        - 'proper': the field decays away from the multilayer
+          (Im(kz) >= 0). Guided modes are on the proper sheet of both
+          mediums.
+        - 'improper': the field grows away from the multilayer. Leaky
+          modes radiating into a medium are on its improper sheet.
+
+    The zeros are located within a rectangle of the complex plane. The
+    argument principle is used to count them (the change of the phase
+    of D along the contour of the rectangle is followed with adaptive
+    sampling), the rectangle is subdivided until each piece contains a
+    single zero and the zeros are refined with Newton's method. When
+    several wavelengths are requested, the modes found at one
+    wavelength are used as starting points at the next one and the
+    full search is only repeated if the number of zeros within the
+    rectangle does not match.
+
+    The branch cut of the proper and improper sheets lies on the real
+    axis for |Re(neff)| < Re(n) of the corresponding medium (or close to
+    it if the medium is absorbing). The rectangle must not cross it.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, multilayer, polarization, sheets=('proper', 'proper')):
+        """
+        Initialize a ModeSolver instance.
+
+        Parameters
+        ----------
+        multilayer : Multilayer
+            The multilayer system.
+        polarization : str
+            The polarization of the modes. It may be "te" or "tm", case
+            insensitive.
+        sheets : tuple, optional
+            The sheets ('proper' or 'improper') of the top and bottom
+            mediums respectively. Default: ('proper', 'proper'), which
+            corresponds to guided modes.
+
+        Returns
+        -------
+        out : ModeSolver
+            A ModeSolver instance.
+        """
+
+        if not isinstance(multilayer, ml.Multilayer):
+            error = "ModeSolver creation error: a Multilayer instance " + \
+                    "is expected"
+            print(error)
+            raise TypeError
+        try:
+            polarization = polarization.upper()
+        except AttributeError:
+            error = "ModeSolver creation error: polarization must be " + \
+                    "'te' or 'tm'"
+            print(error)
+            raise AttributeError
+        if (polarization != 'TE') and (polarization != 'TM'):
+            error = "ModeSolver creation error: polarization must be " + \
+                    "'te' or 'tm'"
+            print(error)
+            raise ValueError
+        if len(sheets) != 2 or \
+                any(sheet not in ('proper', 'improper') for sheet in sheets):
+            error = "ModeSolver creation error: sheets must be a pair " + \
+                    "of 'proper' or 'improper'"
+            print(error)
+            raise ValueError
+
+        self.__multilayer = multilayer
+        self.__polarization = polarization
+        self.__sheets = tuple(sheets)
+
+    def getPolarization(self):
+        """
+        Returns the polarization of the modes, "TE" or "TM".
+        """
+
+        return self.__polarization
+
+    def getSheets(self):
+        """
+        Returns a tuple with the sheets of the top and bottom mediums.
+        """
+
+        return self.__sheets
+
+    def calculateDispersion(self, wlengths, neff):
+        """
+        Calculates the dispersion function D(neff), whose zeros are the
+        modes of the multilayer.
+
+        Parameters
+        ----------
+        wlengths : float or numpy.ndarray
+            The wavelengths.
+        neff : complex or numpy.ndarray
+            The complex effective indices, broadcast against wlengths.
+
+        Returns
+        -------
+        out : numpy.ndarray
+            The values of D with the broadcast shape of the arguments.
+        """
+
+        wlengths, neff = np.broadcast_arrays(
+                np.asarray(wlengths, dtype=np.float64),
+                np.asarray(neff, dtype=np.complex128))
+        matrix = self.__multilayer.calculateCharMatrix(
+                wlengths, neff, self.__polarization)
+        indices = self.__multilayer.getRefrIndices(wlengths)
+        p_i = self.__pFactor(indices[..., 0], neff, self.__sheets[0])
+        p_l = self.__pFactor(indices[..., -1], neff, self.__sheets[1])
+
+        return (matrix[..., 0, 0] + matrix[..., 0, 1] * p_l) * p_i + \
+                matrix[..., 1, 0] + matrix[..., 1, 1] * p_l
+
+    def countModes(self, wlength, region):
+        """
+        Counts the modes within a rectangle of the complex plane using
+        the argument principle.
+
+        Parameters
+        ----------
+        wlength : float
+            The wavelength.
+        region : tuple
+            The rectangle (reMin, reMax, imMin, imMax) of the complex
+            plane of effective indices.
+
+        Returns
+        -------
+        out : int
+            The number of modes within the rectangle.
+        """
+
+        region = _checkRegion(region)
+        return self.__contour(wlength, region)[0]
+
+    def findModes(self, wlengths, region, tolerance=1e-10, maxIter=50):
+        """
+        Finds the modes within a rectangle of the complex plane for an
+        array of wavelengths.
+
+        The solutions at each wavelength are used as starting points at
+        the next one, so ordering the wavelengths monotonically keeps
+        the modes continuous and saves most of the work.
+
+        Parameters
+        ----------
+        wlengths : float or numpy.ndarray
+            The wavelengths.
+        region : tuple
+            The rectangle (reMin, reMax, imMin, imMax) of the complex
+            plane of effective indices.
+        tolerance : float, optional
+            The relative tolerance of the effective indices. Default:
+            1e-10.
+        maxIter : int, optional
+            The maximum number of Newton iterations. Default: 50.
+
+        Returns
+        -------
+        out : numpy.ndarray
+            A complex array with shape (wlengths.size, M), where M is
+            the number of different modes found. Each column follows a
+            mode from one wavelength to the next. Modes that are not
+            found within the rectangle at a given wavelength are NaN.
+            The columns are sorted by decreasing real part of the
+            effective index at the first wavelength where they appear.
+        """
+
+        region = _checkRegion(region)
+        wlengths = np.atleast_1d(np.asarray(wlengths, dtype=np.float64))
+        tracks = []
+        previous = np.empty(0, dtype=np.complex128)
+        for (widx, wlength) in enumerate(wlengths):
+            count, points, values = self.__contour(wlength, region)
+            modes = np.empty(0, dtype=np.complex128)
+            if previous.size:
+                modes = self.__refine(wlength, previous, tolerance, maxIter)
+                modes = _unique(modes[_inside(modes, region)], tolerance)
+            if modes.size != count:
+                modes = self.__search(wlength, region, count, points, values,
+                                      tolerance, maxIter)
+            tracks = _assign(tracks, modes, widx)
+            previous = modes
+
+        result = np.empty((wlengths.size, len(tracks)),
+                          dtype=np.complex128)
+        result.fill(np.nan)
+        for (column, track) in enumerate(tracks):
+            for (widx, mode) in track:
+                result[widx, column] = mode
+
+        return result
+
+    def __pFactor(self, n, neff, sheet):
+        """
+        Returns the p factor of a top or bottom medium on the given
+        sheet.
+        """
+
+        kz = np.sqrt(n ** 2 - neff ** 2)
+        flip = (kz.imag < 0) | ((kz.imag == 0) & (kz.real < 0))
+        kz = np.where(flip, -kz, kz)
+        if sheet == 'improper':
+            kz = -kz
+        if self.__polarization == 'TE':
+            return kz
+        else:
+            return kz / n ** 2
+
+    def __contour(self, wlength, region, samples=32, maxLevels=12):
+        """
+        Follows the phase of D along the contour of a rectangle. The
+        sampling is refined until the phase changes less than pi / 4
+        between consecutive points.
+
+        Returns a tuple (count, points, values) with the number of zeros
+        within the rectangle and the (closed) sampled contour.
+        """
+
+        reMin, reMax, imMin, imMax = region
+        corners = np.array([reMin + imMin * 1j, reMax + imMin * 1j,
+                            reMax + imMax * 1j, reMin + imMax * 1j,
+                            reMin + imMin * 1j])
+        steps = np.linspace(0, 1, samples, endpoint=False)
+        points = np.concatenate([
+                corners[side] + (corners[side + 1] - corners[side]) * steps
+                for side in range(4)] + [corners[-1:]])
+        values = self.calculateDispersion(wlength, points)
+
+        for level in range(maxLevels):
+            jumps = np.absolute(np.angle(values[1:] / values[:-1]))
+            coarse = np.nonzero(jumps > np.pi / 4)[0]
+            if coarse.size == 0:
+                break
+            midpoints = (points[coarse] + points[coarse + 1]) / 2
+            midvalues = self.calculateDispersion(wlength, midpoints)
+            points = np.insert(points, coarse + 1, midpoints)
+            values = np.insert(values, coarse + 1, midvalues)
+
+        winding = np.sum(np.angle(values[1:] / values[:-1])) / (2 * np.pi)
+
+        return (int(np.round(winding)), points, values)
+
+    def __refine(self, wlength, guesses, tolerance, maxIter):
+        """
+        Refines all the guesses at once with Newton's method. The
+        derivative of D is obtained from a central difference evaluated
+        in the same batch as D. Guesses that do not converge are
+        returned as NaN.
+        """
+
+        modes = np.array(guesses, dtype=np.complex128)
+        converged = np.zeros(modes.shape, dtype=bool)
+        offsets = np.array([0, 1, -1])
+        for iteration in range(maxIter):
+            steps = 1e-7 * np.maximum(1, np.absolute(modes))
+            points = modes[:, np.newaxis] + \
+                    steps[:, np.newaxis] * offsets
+            values = self.calculateDispersion(wlength, points)
+            derivative = (values[:, 1] - values[:, 2]) / (2 * steps)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                correction = values[:, 0] / derivative
+            correction[converged] = 0
+            modes = modes - correction
+            converged |= np.absolute(correction) <= \
+                    tolerance * np.maximum(1, np.absolute(modes))
+            if np.all(converged | ~np.isfinite(modes)):
+                break
+
+        modes[~converged] = np.nan
+
+        return modes
+
+    def __search(self, wlength, region, count, points, values, tolerance,
+                 maxIter, depth=0):
+        """
+        Finds all the zeros within a rectangle that contains count of
+        them. Rectangles with a single zero are solved with Newton's
+        method starting from the mean position of the zero given by the
+        contour integral of z * D' / D. Otherwise the rectangle is split
+        in two along its longest side.
+        """
+
+        if count <= 0:
+            return np.empty(0, dtype=np.complex128)
+
+        if count == 1:
+            logs = np.log(np.absolute(values[1:] / values[:-1])) + \
+                    np.angle(values[1:] / values[:-1]) * 1j
+            midpoints = (points[1:] + points[:-1]) / 2
+            guess = np.sum(midpoints * logs) / (2 * np.pi * 1j)
+            if not _inside(np.array([guess]), region)[0]:
+                guess = (region[0] + region[1]) / 2.0 + \
+                        (region[2] + region[3]) / 2.0 * 1j
+            mode = self.__refine(wlength, [guess], tolerance, maxIter)
+            if _inside(mode, region)[0]:
+                return mode
+
+        reMin, reMax, imMin, imMax = region
+        if max(reMax - reMin, imMax - imMin) < \
+                tolerance * max(1, abs(reMax), abs(imMax)) or depth > 60:
+            # The zeros cannot be separated any further
+            return np.array([(reMin + reMax) / 2.0 + (imMin + imMax) / 2.0 * 1j]
+                            * count)
+
+        # Split slightly off the middle to avoid symmetric situations
+        # where a zero lies exactly on the new side.
+        if reMax - reMin >= imMax - imMin:
+            cut = reMin + 0.4871 * (reMax - reMin)
+            pieces = [(reMin, cut, imMin, imMax), (cut, reMax, imMin, imMax)]
+        else:
+            cut = imMin + 0.4871 * (imMax - imMin)
+            pieces = [(reMin, reMax, imMin, cut), (reMin, reMax, cut, imMax)]
+
+        modes = []
+        for piece in pieces:
+            pieceCount, piecePoints, pieceValues = \
+                    self.__contour(wlength, piece)
+            modes.append(self.__search(wlength, piece, pieceCount,
+                                       piecePoints, pieceValues, tolerance,
+                                       maxIter, depth + 1))
+
+        return np.concatenate(modes)
+
+
+######################### Auxiliary functions #########################
+
+
+def _checkRegion(region):
+    """
+    Checks that region is a valid rectangle (reMin, reMax, imMin, imMax)
+    and returns it as a tuple of floats.
+    """
+
+    try:
+        region = tuple(float(value) for value in region)
+    except (TypeError, ValueError):
+        error = "Error: the region must be a tuple (reMin, reMax, " + \
+                "imMin, imMax)"
+        print(error)
+        raise TypeError
+    if len(region) != 4 or region[0] >= region[1] or region[2] >= region[3]:
+        error = "Error: the region must be a tuple (reMin, reMax, " + \
+                "imMin, imMax) with reMin < reMax and imMin < imMax"
+        print(error)
+        raise ValueError
+
+    return region
+
+
+def _inside(modes, region):
+    """
+    Returns a boolean array telling which modes lie within the region.
+    """
+
+    reMin, reMax, imMin, imMax = region
+    with np.errstate(invalid='ignore'):
+        return (modes.real >= reMin) & (modes.real <= reMax) & \
+                (modes.imag >= imMin) & (modes.imag <= imMax)
+
+
+def _unique(modes, tolerance):
+    """
+    Removes the NaN and repeated modes (those closer than the tolerance
+    to a previous one).
+    """
+
+    unique = []
+    for mode in modes[np.isfinite(modes)]:
+        if all(abs(mode - other) > 1e3 * tolerance * max(1, abs(mode))
+               for other in unique):
+            unique.append(mode)
+
+    return np.array(unique, dtype=np.complex128)
+
+
+def _assign(tracks, modes, widx):
+    """
+    Appends the modes found at the wavelength with index widx to the
+    tracks (lists of (widx, mode) pairs) that ended closest to them at
+    the previous wavelength. Modes without a match start new tracks.
+    """
+
+    free = [track for track in tracks if track[-1][0] == widx - 1]
+    for mode in sorted(modes, key=lambda mode: -mode.real):
+        if free:
+            distances = [abs(track[-1][1] - mode) for track in free]
+            closest = free.pop(int(np.argmin(distances)))
+            closest.append((widx, mode))
+        else:
+            tracks.append([(widx, mode)])
+
+    return tracks
@@ -27,10 +27,6 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # Some attributes that have a 'get' method could be decorated as
 # properties in order to supress the parantheses in the method call.
 #
-# The reflection coefficients for TE and TM waves, rte and rtm, as well
-# as their ratio -rtm/rte, could be expressed in terms of ellipsometric
-# angles Psi and Delta (see Handbook of ellipsometry, Tompkins)
-#
 #######################################################################
 
 
@@ -122,15 +118,33 @@ class Medium(object):
         # interpolators.
         table = np.loadtxt(filename, 'float', comments, delimiter,
                            converters, skiprows, usecols)
-        wavelengths = table[:, 0]
-        refrIndex = table[:, 1]
-        extCoef = table[:, 2]
+        self.__setstate__({'wavelengths': table[:, 0],
+                           'refrIndex': table[:, 1],
+                           'extCoef': table[:, 2]})
+
+    def __getstate__(self):
+        """
+        Returns the table of refractive indices, from which the medium
+        is rebuilt when unpickled (the interpolators cannot be pickled).
+        """
+
+        return self.__table
+
+    def __setstate__(self, state):
+        """
+        Builds the medium from a table of refractive indices given as a
+        dictionary with the keys 'wavelengths', 'refrIndex' and
+        'extCoef'.
+        """
+
+        self.__table = state
+        wavelengths = state['wavelengths']
         self.__maxWlength = wavelengths.max()
         self.__minWlength = wavelengths.min()
         self.__nInterpolator = interpolation.interp1d(
-                wavelengths, refrIndex, kind='cubic')
+                wavelengths, state['refrIndex'], kind='cubic')
         self.__kInterpolator = interpolation.interp1d(
-                wavelengths, extCoef, kind='cubic')
+                wavelengths, state['extCoef'], kind='cubic')
 
     def getRefrIndex(self, wavelength):
         """
@@ -172,6 +186,20 @@ class Medium(object):
 
         return (self.__minWlength, self.__maxWlength)
 
+    def getTable(self):
+        """
+        Returns the table of refractive indices of the medium.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with the keys 'wavelengths', 'refrIndex' and
+            'extCoef'. Each value is an array with one element per
+            wavelength of the table.
+        """
+
+        return self.__table
+
 
 class Multilayer(object):
     """
@@ -450,15 +478,22 @@ class Multilayer(object):
         of a multilayer. The user typically does not need to call it.
         """
 
-        # We start setting the positions from below
-        reverseIndex = range(len(self.__stack))
-        reverseIndex.reverse()
-        self.__stack[reverseIndex[0]]['position'] = -np.infty
-        self.__stack[reverseIndex[1]]['position'] = 0.0
-        for layerIndex in reverseIndex[2:]:
-            self.__stack[layerIndex]['position'] = self.__stack[
-                    layerIndex + 1]['position'] + \
-                    self.getThickness(layerIndex + 1)
+        # We start setting the positions from below. The bottom medium
+        # is at -infinity and the position of every other layer is the
+        # sum of the thicknesses of the layers below it (excluding the
+        # bottom medium).
+        thicknesses = np.array([layer['thickness'] for layer in
+                                self.__stack[1:-1]])
+        positions = np.empty(len(self.__stack))
+        positions[-1] = -np.infty
+        positions[:-1] = np.cumsum(
+                np.concatenate((thicknesses, [0.0]))[::-1])[::-1]
+        for (layer, position) in zip(self.__stack, positions):
+            layer['position'] = float(position)
+
+        # The positions are also kept in an array in increasing order
+        # for the vectorized lookups of getIndexAtPos.
+        self.__sortedPositions = positions[::-1].copy()
 
     def getPosition(self, layerIndex):
         """
@@ -568,6 +603,29 @@ class Multilayer(object):
             raise IndexError
         return self.__stack[layerIndex]['thickness']
 
+    def getMedium(self, layerIndex):
+        """
+        This method returns the Medium instance of the layer with index
+        'layerindex'. Index 0 corresponds to the top medium.
+
+        Parameters
+        ----------
+        layerIndex : int
+            The index of the layer. Index 0 corresponds to the top
+            medium.
+
+        Returns
+        -------
+        out : Medium
+            The medium of the layer.
+        """
+
+        if layerIndex < 0:
+            error = "Negative index not accepted"
+            print(error)
+            raise IndexError
+        return self.__stack[layerIndex]['medium']
+
     def getMinMaxWlength(self):
         """
         This method returns a tuple (min, max) with the shortest and
@@ -605,25 +663,34 @@ class Multilayer(object):
 
         Parameters
         ----------
-        z : float
-            A z coordinate. z = 0 is at the surface between the bottom
-            medium and the next layer. The position of a layer is the z
-            coordinate of its lower interface. The units are the same as
-            the thickness and wavelengths.
+        z : float or numpy.ndarray
+            A z coordinate or an array of them. z = 0 is at the surface
+            between the bottom medium and the next layer. The position
+            of a layer is the z coordinate of its lower interface. The
+            units are the same as the thickness and wavelengths.
 
         Returns
         -------
-        out : int
-            The index of the layer within which z lies.
+        out : int or numpy.ndarray
+            The index of the layer within which z lies, or an array of
+            indices with the shape of z.
         """
 
-        # For each layer starting at the upper medium, check if the
-        # given z is larger or equal than the position of the layer. If
-        # it is, then z lies in the current layer, otherwise move to the
-        # next one.
-        for index in range(self.numLayers()):
-            if z >= self.getPosition(index):
-                return index
+        if not np.all(np.isfinite(z)):
+            error = "Error: z must be finite"
+            print(error)
+            raise ValueError
+
+        # z lies within the first layer, starting from the top medium,
+        # whose position is smaller or equal than z. The positions are
+        # kept in increasing order, so the number of them that are
+        # smaller or equal than z is found with a binary search.
+        below = np.searchsorted(self.__sortedPositions, z, side='right')
+        indices = self.numLayers() - below
+        if np.ndim(indices) == 0:
+            return int(indices)
+
+        return indices
 
     def setWlength(self, wavelength, rilist=None):
         """
@@ -946,6 +1013,51 @@ class Multilayer(object):
             raise IndexError
         return self.__stack[index]['refindex']
 
+    def getRefrIndices(self, wlengths):
+        """
+        Returns the complex refractive indices of all the layers at an
+        arbitrary array of wavelengths.
+
+        Unlike getRefrIndex, this method does not depend on the working
+        wavelength of the multilayer and does not change its state. The
+        interpolators of each Medium are called only once even if the
+        same Medium appears in several layers.
+
+        Parameters
+        ----------
+        wlengths : float or numpy.ndarray
+            The wavelengths at which the refractive indices are wanted.
+            In the same units as in the files from which the refractive
+            indices were loaded.
+
+        Returns
+        -------
+        out : numpy.ndarray
+            An array of complex128 with shape wlengths.shape + (L,),
+            where L is the number of layers including the top and
+            bottom mediums. The last axis follows the order of the
+            stack (index 0 is the top medium).
+        """
+
+        wlengths = np.asarray(wlengths, dtype=np.float64)
+        minimum, maximum = self.getMinMaxWlength()
+        if wlengths.size and \
+                (wlengths.min() < minimum or wlengths.max() > maximum):
+            error = "Error: Wavelength out of bounds"
+            print(error)
+            raise ValueError
+
+        indices = np.empty(wlengths.shape + (self.numLayers(),),
+                           dtype=np.complex128)
+        cache = {}
+        for (index, layer) in enumerate(self.__stack):
+            medium = layer['medium']
+            if id(medium) not in cache:
+                cache[id(medium)] = medium.getRefrIndex(wlengths)
+            indices[..., index] = cache[id(medium)]
+
+        return indices
+
     def calcMatrices(self, layerIndexes=[]):
         """
         This method calculates the characteristic matrix of the
@@ -1269,6 +1381,1087 @@ class Multilayer(object):
 
         return self.__coefficientsDownUp
 
+    def calculateCoefficients(self, wlengths, angles, polarization, index=0,
+                              thicknesses=None):
+        """
+        Calculates the coefficients r, t, R and T of the multilayer in
+        the up-down direction for whole arrays of wavelengths and
+        propagation angles at once.
+
+        This is the vectorized counterpart of the sequence setWlength,
+        setPropAngle, setPolarization, calcMatrices, updateCharMatrix
+        and getCoefficientsUpDown. The state of the multilayer (working
+        wavelength, angles, matrices and stored coefficients) is not
+        modified. The results are identical to those of the scalar
+        methods.
+
+        Parameters
+        ----------
+        wlengths : float or numpy.ndarray
+            The wavelengths of the light. In the same units as in the
+            files from which the refractive indices were loaded.
+        angles : float or complex or numpy.ndarray
+            The propagation angles in radians. wlengths and angles are
+            broadcast against each other, so a wavelength x angle grid
+            is obtained passing wlengths[:, np.newaxis] and angles.
+        polarization : str
+            The polarization of the light. It may be "te" or "tm", case
+            insensitive.
+        index : int, optional
+            The index of the layer where the propagation angles are
+            given. By default the top medium (index = 0).
+        thicknesses : numpy.ndarray, optional
+            Thicknesses of all the layers (last axis, top and bottom
+            mediums included) to be used instead of the ones stored in
+            the multilayer. The leading axes are broadcast against
+            wlengths and angles, which allows evaluating a batch of
+            thickness variants at once.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with the reflection and transmission
+            coefficients, the reflectance and the transmittance. The
+            keys are {'r', 't', 'R', 'T'} and each value is an array
+            with the broadcast shape of wlengths and angles (and the
+            thicknesses, if given).
+
+        See also
+        --------
+        updateCharMatrix, calculateEllipsometry
+        """
+
+        polarization = _checkPolarization(polarization)
+        batch = self.__batchDirections(wlengths, angles, index)
+        if thicknesses is None:
+            thicknesses = self.__thicknesses()
+        phases = _layerPhases(batch['refindex'], batch['cosine'],
+                              thicknesses, batch['wlength'])
+
+        return _stackCoefficients(batch['refindex'], batch['cosine'], phases,
+                                  polarization)
+
+    def calculateEllipsometry(self, wlengths, angles, index=0, full=False):
+        """
+        Calculates the ellipsometric angles Psi and Delta of the
+        multilayer for whole arrays of wavelengths and angles of
+        incidence.
+
+        The ellipsometric angles are defined through the ratio of the
+        reflection coefficients for TM and TE waves,
+
+            rho = -rtm / rte = tan(Psi) * exp(i * Delta),
+
+        where the minus sign accounts for the convention used for rtm
+        in this module (see updateCharMatrix), so that rho is the usual
+        rp / rs of ellipsometry (Handbook of ellipsometry, Tompkins).
+
+        Both polarizations are evaluated in a single vectorized pass.
+        The refractive indices, propagation angles and phase
+        thicknesses of the layers are calculated only once and shared
+        between TE and TM. The state of the multilayer is not modified.
+
+        Parameters
+        ----------
+        wlengths : float or numpy.ndarray
+            The wavelengths of the light. In the same units as in the
+            files from which the refractive indices were loaded.
+        angles : float or numpy.ndarray
+            The angles of incidence in radians. wlengths and angles are
+            broadcast against each other.
+        index : int, optional
+            The index of the layer where the angles are given. By
+            default the top medium (index = 0).
+        full : bool, optional
+            If True, the reflection coefficients rtm and rte are
+            returned as well. Default: False.
+
+        Returns
+        -------
+        out : tuple
+            (psi, delta) or, if full is True, (psi, delta, rtm, rte).
+            Psi is within [0, pi/2] and Delta within (-pi, pi], both in
+            radians. All the arrays have the broadcast shape of
+            wlengths and angles.
+        """
+
+        batch = self.__batchDirections(wlengths, angles, index)
+        n = batch['refindex']
+        cosines = batch['cosine']
+        phases = _layerPhases(n, cosines, self.__thicknesses(),
+                              batch['wlength'])
+        rte = _stackCoefficients(n, cosines, phases, 'TE')['r']
+        rtm = _stackCoefficients(n, cosines, phases, 'TM')['r']
+
+        rho = -rtm / rte
+        psi = np.arctan(np.absolute(rho))
+        delta = np.angle(rho)
+
+        if full:
+            return (psi, delta, rtm, rte)
+        return (psi, delta)
+
+    def calculateThicknessSweep(self, layer, thicknesses, wlengths, angles,
+                                polarization, index=0):
+        """
+        Calculates the reflection and transmission coefficients of the
+        multilayer for a whole array of thicknesses of one of its
+        layers.
+
+        This is much faster than calling setThickness for every value.
+        The products of the characteristic matrices of the layers above
+        and below the swept layer do not depend on its thickness, so
+        they are calculated only once for every wavelength and angle.
+        The result for each thickness then costs a single product of
+        three 2x2 matrices. The state of the multilayer is not modified.
+
+        Parameters
+        ----------
+        layer : int
+            The index of the swept layer. It cannot be the top or the
+            bottom medium.
+        thicknesses : float or numpy.ndarray
+            The thicknesses of the swept layer.
+        wlengths : float or numpy.ndarray
+            The wavelengths of the light. In the same units as in the
+            files from which the refractive indices were loaded.
+        angles : float or numpy.ndarray
+            The propagation angles in radians, broadcast against
+            wlengths.
+        polarization : str
+            The polarization of the light. It may be "te" or "tm", case
+            insensitive.
+        index : int, optional
+            The index of the layer where the angles are given. By
+            default the top medium (index = 0).
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with keys {'r', 't', 'R', 'T'}. The shape of
+            each value is the broadcast shape of wlengths and angles
+            followed by the shape of thicknesses.
+
+        See also
+        --------
+        calculateCoefficients, setThickness
+        """
+
+        if layer < 0:
+            error = "Negative index not accepted"
+            print(error)
+            raise IndexError
+        if (layer == 0) or (layer >= self.numLayers() - 1):
+            error = "Error in thickness sweep: only the layers between " + \
+                    "the top and bottom mediums can be swept"
+            print(error)
+            raise IndexError
+        thicknesses = np.asarray(thicknesses, dtype=np.float64)
+        if np.any(thicknesses < 0):
+            error = "Negative thickness not accepted"
+            print(error)
+            raise ValueError
+
+        polarization = _checkPolarization(polarization)
+        batch = self.__batchDirections(wlengths, angles, index)
+        n = batch['refindex']
+        cosines = batch['cosine']
+        phases = _layerPhases(n, cosines, self.__thicknesses(),
+                              batch['wlength'])
+        matrices = _layerMatrices(phases, _pFactors(n, cosines, polarization))
+        above = _chainProduct(matrices, range(1, layer))
+        below = _chainProduct(matrices, range(layer + 1, n.shape[-1] - 1))
+
+        # The swept thicknesses take the place of the layer axis
+        n_k = n[..., layer:layer + 1]
+        cos_k = cosines[..., layer:layer + 1]
+        swept = _layerMatrices(
+                _layerPhases(n_k, cos_k, thicknesses.ravel(),
+                             batch['wlength']),
+                _pFactors(n_k, cos_k, polarization))
+        matrix = _matrixProduct(
+                _matrixProduct(above[..., np.newaxis, :, :], swept),
+                below[..., np.newaxis, :, :])
+        coefficients = _matrixCoefficients(
+                matrix, n[..., :1], cosines[..., :1], n[..., -1:],
+                cosines[..., -1:], polarization)
+
+        shape = batch['wlength'].shape + thicknesses.shape
+        for key in coefficients:
+            coefficients[key] = coefficients[key].reshape(shape)
+
+        return coefficients
+
+    def calculateCharMatrix(self, wlengths, neff, polarization):
+        """
+        Calculates the characteristic matrix of the multilayer in the
+        up-down direction for arrays of wavelengths and normalized
+        in-plane wavevectors.
+
+        The propagation direction is given here by the normalized
+        in-plane wavevector neff = n * sin(theta), which is the same in
+        every layer (Snell's law) and may take any complex value. This
+        allows working beyond the critical angle of every medium, e.g.
+        to look for guided modes. The characteristic matrix does not
+        depend on the sign chosen for the normal component of the
+        wavevector within each layer, so it is an analytic function of
+        neff. The state of the multilayer is not modified.
+
+        Parameters
+        ----------
+        wlengths : float or numpy.ndarray
+            The wavelengths of the light. In the same units as in the
+            files from which the refractive indices were loaded.
+        neff : float or complex or numpy.ndarray
+            The normalized in-plane wavevectors (effective indices),
+            broadcast against wlengths.
+        polarization : str
+            The polarization of the light. It may be "te" or "tm", case
+            insensitive.
+
+        Returns
+        -------
+        out : numpy.ndarray
+            The characteristic matrices, with the broadcast shape of
+            wlengths and neff followed by (2, 2).
+
+        See also
+        --------
+        updateCharMatrix, getCharMatrixUpDown
+        """
+
+        polarization = _checkPolarization(polarization)
+        batch = self.__batchWavevectors(wlengths, neff)
+        n = batch['refindex']
+        phases = _layerPhases(n, batch['cosine'], self.__thicknesses(),
+                              batch['wlength'])
+        matrices = _layerMatrices(
+                phases, _pFactors(n, batch['cosine'], polarization))
+
+        return _chainProduct(matrices, range(1, n.shape[-1] - 1))
+
+    def calculateF(self, z, wlengths, angles, index=0, components='xyz',
+                   output='field'):
+        """
+        Calculates Fx, Fy and Fz for whole arrays of dipole positions,
+        wavelengths and propagation angles at once.
+
+        This is the vectorized counterpart of calculateFx, calculateFy
+        and calculateFz and gives identical results, including their
+        treatment of the propagation angles 0 and pi/2. Unlike those
+        methods, the state of the multilayer is not modified.
+
+        The reflection and transmission coefficients of the
+        submultilayers above and below every layer are obtained from
+        cumulative products of the characteristic matrices, so they are
+        calculated once per wavelength and angle and shared by all the
+        dipole positions. Fx and Fz share the same TM matrices.
+
+        Parameters
+        ----------
+        z : float or numpy.ndarray
+            The z coordinates of the emitting dipoles.
+        wlengths : float or numpy.ndarray
+            The wavelengths of the light. In the same units as in the
+            files from which the refractive indices were loaded.
+        angles : float or numpy.ndarray
+            The propagation angles in radians.
+        index : int, optional
+            The index of the layer where the propagation angles are
+            given. By default the top medium (index = 0).
+        components : str, optional
+            The components to calculate, any combination of 'x', 'y'
+            and 'z'. Default: 'xyz'.
+        output : str, optional
+            'field' (default) for the components of F, or 'energy' for
+            the emission factors |Fy|^2 (TE) and |Fx * cos(A)^2 + Fz *
+            sin(A)^2|^2 (TM), where A is the propagation angle in the
+            top medium. The energy factors are evaluated in blocks of
+            dipole positions, so the complex components of F are never
+            stored for the whole grid. components is then ignored.
+
+        z, wlengths and angles are broadcast against each other. For
+        instance, F(z, lambda) for a fixed angle is obtained passing
+        z[:, np.newaxis] and wlengths.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with the keys 'fx', 'fy' and/or 'fz' (according
+            to components). Each value is a complex128 array with the
+            broadcast shape of z, wlengths and angles. With output =
+            'energy', the keys are 'te' and 'tm' and the values are
+            float64 arrays.
+        """
+
+        if output not in ['field', 'energy']:
+            error = "Error: output must be 'field' or 'energy'"
+            print(error)
+            raise ValueError
+        if output == 'energy':
+            batch = self.__batchDirections(wlengths, angles, index)
+            return self.__energyFactors(batch, z)
+
+        components = components.lower()
+        if (not components) or \
+                any(component not in 'xyz' for component in components):
+            error = "Error: components must be a combination of 'x', " + \
+                    "'y' and 'z'"
+            print(error)
+            raise ValueError
+
+        batch = self.__batchDirections(wlengths, angles, index)
+
+        return self.__fieldFactors(batch, z, components)
+
+    def calculateEmission(self, z, wlengths, angles, index=0,
+                          orientation='isotropic'):
+        """
+        Calculates the energy emitted as TE and TM waves by an ensemble
+        of dipoles with a given distribution of orientations, relative
+        to the same ensemble in an infinite medium.
+
+        Dipoles with different orientations radiate incoherently, so
+        their contributions are added in intensity. A fraction v of the
+        dipoles oscillates along z and the rest lies in the plane of the
+        interfaces with a random azimuth:
+
+            TE = (1 - v) / 2 * |Fy|^2
+            TM = (1 - v) / 2 * |Fx|^2 * cos(A)^2 + v * |Fz|^2 * sin(A)^2
+
+        where A is the propagation angle in the top medium. For randomly
+        oriented dipoles v = 1/3 and TE = TM = 1/3 in a homogeneous
+        medium. Note that this is not the coherent combination
+        |Fx * cos(A)^2 + Fz * sin(A)^2|^2 used in the examples and in
+        calculateDepthIntegral.
+
+        The three components of F are obtained at once, with the TM
+        coefficients shared by Fx and Fz (see calculateF).
+
+        Parameters
+        ----------
+        z : float or numpy.ndarray
+            The z coordinates of the emitting dipoles.
+        wlengths : float or numpy.ndarray
+            The wavelengths of the light. In the same units as in the
+            files from which the refractive indices were loaded.
+        angles : float or numpy.ndarray
+            The propagation angles in radians.
+        index : int, optional
+            The index of the layer where the propagation angles are
+            given. By default the top medium (index = 0).
+        orientation : str or float, optional
+            The orientation of the dipoles: 'isotropic' (default),
+            'parallel' or 'perpendicular' to the interfaces, or the
+            fraction v of dipoles perpendicular to the interfaces.
+
+        z, wlengths and angles are broadcast against each other.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with keys {'te', 'tm'}. Each value is an array
+            with the broadcast shape of z, wlengths and angles.
+
+        See also
+        --------
+        calculateF
+        """
+
+        vertical = _checkOrientation(orientation)
+        batch = self.__batchDirections(wlengths, angles, index)
+        f = self.__fieldFactors(batch, z, 'xyz')
+        theta0 = batch['propangle0']
+        te = (1 - vertical) / 2.0 * np.absolute(f['fy']) ** 2
+        tm = (1 - vertical) / 2.0 * np.absolute(f['fx']) ** 2 * \
+                np.absolute(np.cos(theta0)) ** 2 + \
+                vertical * np.absolute(f['fz']) ** 2 * \
+                np.absolute(np.sin(theta0)) ** 2
+
+        return {'te': te, 'tm': tm}
+
+    def calculateFGradient(self, z, wlengths, angles, layers, index=0):
+        """
+        Calculates Fx, Fy and Fz and their derivatives with respect to
+        the thicknesses of the given layers, for whole arrays of dipole
+        positions, wavelengths and propagation angles at once.
+
+        The derivatives are analytic: the derivatives of the
+        characteristic matrices are propagated through the same
+        cumulative products used by calculateF. They are taken with
+        every dipole attached to the layer that contains it, i.e. at a
+        fixed distance from its lower interface (from the upper
+        interface for the bottom medium), so that a dipole moves
+        together with its layer when a layer below it grows.
+
+        Parameters
+        ----------
+        z : float or numpy.ndarray
+            The z coordinates of the emitting dipoles.
+        wlengths : float or numpy.ndarray
+            The wavelengths of the light. In the same units as in the
+            files from which the refractive indices were loaded.
+        angles : float or numpy.ndarray
+            The propagation angles in radians.
+        layers : list
+            The indices of the layers whose thicknesses are varied. Only
+            the layers between the top and bottom mediums are allowed.
+        index : int, optional
+            The index of the layer where the propagation angles are
+            given. By default the top medium (index = 0).
+
+        z, wlengths and angles are broadcast against each other.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with the keys 'fx', 'fy' and 'fz', as returned
+            by calculateF, and 'dfx', 'dfy' and 'dfz' with the
+            derivatives. The derivatives have an additional first axis
+            that follows the order of layers.
+
+        See also
+        --------
+        calculateF
+        """
+
+        layers = list(layers)
+        if any(layer <= 0 or layer >= self.numLayers() - 1
+               for layer in layers):
+            error = "Error: only the thicknesses of the layers between " + \
+                    "the top and bottom mediums can be varied"
+            print(error)
+            raise IndexError
+
+        batch = self.__batchDirections(wlengths, angles, index)
+        results = self.__fieldFactors(batch, z, 'xyz')
+        n = batch['refindex']
+        cosines = batch['cosine']
+        wlengths = batch['wlength']
+        thicknesses = self.__thicknesses()
+        phases = _layerPhases(n, cosines, thicknesses, wlengths)
+        etas = 2 * np.pi * np.sqrt(
+                n ** 2 - (n[..., :1] * batch['sine'][..., :1]) ** 2) / \
+                wlengths[..., np.newaxis]
+
+        z = np.asarray(z, dtype=np.float64)
+        shape = np.broadcast(z, wlengths).shape
+        z = np.broadcast_to(z, shape)
+        layerIndices = np.asarray(self.getIndexAtPos(z))
+        field = {'etas': etas, 'z': z, 'layers': layerIndices,
+                 'positions': self.__positionArray()}
+        inside = layerIndices > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xGains = cosines / cosines[..., :1]
+            zGains = batch['sine'] / batch['sine'][..., :1]
+        xGains[..., 0] = 1
+        zGains[..., 0] = 1
+        # The amplitudes and their derivatives are shared by Fx and Fz
+        components = {'TE': [('fy', 1, 1, None)],
+                      'TM': [('fx', xGains, -1, batch['grazing']),
+                             ('fz', zGains, 1, batch['normal'])]}
+        for polarization in ['TE', 'TM']:
+            for (key, gains, sign, mask) in components[polarization]:
+                results['d' + key] = np.empty((len(layers),) + shape,
+                                              dtype=np.complex128)
+            amplitudes = _fieldAmplitudes(n, cosines, phases, etas,
+                                          thicknesses, polarization)
+            for (k, layer) in enumerate(layers):
+                down, up = _fieldAmplitudeDerivatives(
+                        n, cosines, phases, etas, thicknesses, wlengths,
+                        polarization, layer)
+                # The distance to the upper interface of the layer
+                # changes with its thickness, and the distance to the
+                # top medium changes for the dipoles at or below it.
+                down[..., layer] += 1j * etas[..., layer] * \
+                        amplitudes[0][..., layer]
+                field['amplitudes'] = (down, up)
+                for (key, gains, sign, mask) in components[polarization]:
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        derivative = _evaluateField(field, gains, sign)
+                    derivative -= 1j * np.broadcast_to(etas[..., 0],
+                                                       shape) * \
+                        results[key] * (layerIndices >= layer)
+                    if mask is not None:
+                        derivative[inside & np.broadcast_to(mask, shape)] = 0
+                    results['d' + key][k] = derivative
+
+        return results
+
+    def calculateDepthIntegral(self, distribution, wlengths, angles,
+                               index=0):
+        """
+        Calculates the emission factors averaged over a distribution of
+        emitters along the z axis.
+
+        The emission factors are those used throughout the examples:
+        |Fy|^2 for TE waves and |Fx * cos(A)^2 + Fz * sin(A)^2|^2 for TM
+        waves, where A is the propagation angle in the top medium. They
+        are averaged with the density rho(z) of the distribution:
+
+            integral(rho(z) * |F(z)|^2 dz) / integral(rho(z) dz)
+
+        Within each layer F(z) is a sum of two exponentials of z (see
+        calculateF), so |F(z)|^2 is a sum of three, and the integrals
+        are calculated in closed form by the distribution (see the
+        distributions module). The cost does not depend on the number
+        of points that would be needed to sample F along z.
+
+        Parameters
+        ----------
+        distribution : Distribution
+            The distribution of emitters (see the distributions module).
+        wlengths : float or numpy.ndarray
+            The wavelengths of the light. In the same units as in the
+            files from which the refractive indices were loaded.
+        angles : float or numpy.ndarray
+            The propagation angles in radians.
+        index : int, optional
+            The index of the layer where the propagation angles are
+            given. By default the top medium (index = 0).
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with keys {'te', 'tm'}. Each value is an array
+            with the broadcast shape of wlengths and angles.
+
+        See also
+        --------
+        calculateF, calculateDepthIntegrals
+        """
+
+        results = self.calculateDepthIntegrals([distribution], wlengths,
+                                               angles, index)
+
+        return {'te': results['te'][..., 0], 'tm': results['tm'][..., 0]}
+
+    def calculateDepthIntegrals(self, distributions, wlengths, angles,
+                                index=0):
+        """
+        Same as calculateDepthIntegral for several distributions of
+        emitters at once. The field amplitudes are calculated only once
+        for all the distributions, which only change the closed-form
+        integrals within each layer.
+
+        Parameters
+        ----------
+        distributions : list
+            The distributions of emitters (see the distributions
+            module).
+        wlengths : float or numpy.ndarray
+            The wavelengths of the light. In the same units as in the
+            files from which the refractive indices were loaded.
+        angles : float or numpy.ndarray
+            The propagation angles in radians.
+        index : int, optional
+            The index of the layer where the propagation angles are
+            given. By default the top medium (index = 0).
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with keys {'te', 'tm'}. Each value is an array
+            with the broadcast shape of wlengths and angles plus a last
+            axis with the distributions, in the given order.
+
+        See also
+        --------
+        calculateDepthIntegral
+        """
+
+        batch = self.__batchDirections(wlengths, angles, index)
+        n = batch['refindex']
+        cosines = batch['cosine']
+        wlengths = batch['wlength']
+        thicknesses = self.__thicknesses()
+        phases = _layerPhases(n, cosines, thicknesses, wlengths)
+        etas = 2 * np.pi * np.sqrt(
+                n ** 2 - (n[..., :1] * batch['sine'][..., :1]) ** 2) / \
+                wlengths[..., np.newaxis]
+        positions = self.__positionArray()
+        last = self.numLayers() - 1
+
+        # Gains of the downward and upward waves of each layer. For TM
+        # waves they combine Fx * cos(A)^2 and Fz * sin(A)^2. The angles
+        # 0 and pi/2, where calculateFx and calculateFz use constant
+        # values, make those terms vanish.
+        theta0 = batch['propangle0'][..., np.newaxis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xGains = cosines / cosines[..., :1] * np.cos(theta0) ** 2
+            zGains = batch['sine'] / batch['sine'][..., :1] * \
+                    np.sin(theta0) ** 2
+        xGains[..., 0] = np.cos(theta0[..., 0]) ** 2
+        zGains[..., 0] = np.sin(theta0[..., 0]) ** 2
+        xGains = np.where(theta0 == np.pi / 2, 0, xGains)
+        zGains = np.where(theta0 == 0, 0, zGains)
+        gains = {'TE': (1, 1), 'TM': (xGains + zGains, zGains - xGains)}
+
+        weights = np.array([distribution.getWeight() for distribution in
+                            distributions], dtype=np.float64)
+        eta0 = etas[..., 0]
+        results = {}
+        for polarization in ['TE', 'TM']:
+            amplitudesDown, amplitudesUp = _fieldAmplitudes(
+                    n, cosines, phases, etas, thicknesses, polarization)
+            amplitudesDown = amplitudesDown * gains[polarization][0]
+            amplitudesUp = amplitudesUp * gains[polarization][1]
+            total = np.zeros(wlengths.shape + (len(distributions),))
+            for (k, distribution) in enumerate(distributions):
+                zmin, zmax = distribution.getSupport()
+                for layer in range(last + 1):
+                    top = np.inf if layer == 0 else positions[layer - 1]
+                    lower = max(zmin, positions[layer])
+                    upper = min(zmax, top)
+                    if lower >= upper:
+                        continue
+
+                    # Within the layer F(z) = U * exp(i * (eta0 - eta) * u)
+                    # + V * exp(i * (eta0 + eta) * u), with u = z - center.
+                    center = (lower + upper) / 2.0
+                    if layer == 0:
+                        top = positions[0]
+                    eta = etas[..., layer]
+                    common = np.exp(eta0 * (center - positions[0]) * 1j)
+                    down = amplitudesDown[..., layer] * common * \
+                            np.exp(-eta * (center - top) * 1j)
+                    if layer == last:
+                        up = np.zeros(down.shape, dtype=np.complex128)
+                    else:
+                        up = amplitudesUp[..., layer] * common * \
+                                np.exp(eta * (center - positions[layer]) * 1j)
+
+                    rates = np.stack((
+                            2 * (eta.imag - eta0.imag),
+                            -2 * (eta.imag + eta0.imag),
+                            -2 * eta0.imag - 2j * eta.real), axis=-1)
+                    integrals = distribution.calculateIntegral(
+                            rates, lower, upper, center)
+                    total[..., k] += \
+                            np.absolute(down) ** 2 * integrals[..., 0].real + \
+                            np.absolute(up) ** 2 * integrals[..., 1].real + \
+                            2 * (down * np.conj(up) * integrals[..., 2]).real
+            results[polarization.lower()] = total / weights
+
+        return results
+
+    def calculateFWavevector(self, z, wlengths, neff, side='top',
+                             components='xyz'):
+        """
+        Calculates Fx, Fy and Fz for light leaving the multilayer through
+        the top or the bottom medium, with the direction of the light
+        given by the normalized in-plane wavevector.
+
+        The in-plane wavevector neff = n * sin(theta) is the same in
+        every layer, so it describes the emission into either side
+        without reference to a particular layer, including directions
+        that are evanescent in the exit medium (neff larger than its
+        refractive index). The normal components of the wavevectors are
+        taken with non-negative imaginary part in every layer, so the
+        waves in an evanescent medium on the other side decay away from
+        the multilayer (the Snell's law of calculateF gives growing
+        waves there).
+
+        For the bottom side, F is calculated on the upside down
+        multilayer, i.e. the bottom medium takes the role of the top
+        medium in calculateF. Normal (neff = 0) and grazing (neff equal
+        to the refractive index of the exit medium) emission are
+        handled as in calculateFx and calculateFz.
+
+        Parameters
+        ----------
+        z : float or numpy.ndarray
+            The z coordinates of the emitting dipoles.
+        wlengths : float or numpy.ndarray
+            The wavelengths of the light. In the same units as in the
+            files from which the refractive indices were loaded.
+        neff : float or complex or numpy.ndarray
+            The normalized in-plane wavevectors.
+        side : str, optional
+            The exit medium, 'top' or 'bottom'. Default: 'top'.
+        components : str, optional
+            The components to calculate, any combination of 'x', 'y'
+            and 'z'. Default: 'xyz'.
+
+        z, wlengths and neff are broadcast against each other.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with the keys 'fx', 'fy' and/or 'fz' (according
+            to components). Each value is a complex128 array with the
+            broadcast shape of z, wlengths and neff.
+
+        See also
+        --------
+        calculateF
+        """
+
+        components = components.lower()
+        if (not components) or \
+                any(component not in 'xyz' for component in components):
+            error = "Error: components must be a combination of 'x', " + \
+                    "'y' and 'z'"
+            print(error)
+            raise ValueError
+        if _checkSide(side) == 'bottom':
+            return self.__flipped().calculateFWavevector(
+                    self.getPosition(0) - np.asarray(z, dtype=np.float64),
+                    wlengths, neff, 'top', components)
+
+        batch = self.__batchWavevectors(wlengths, neff)
+
+        return self.__fieldFactors(batch, z, components)
+
+    def calculateExtraction(self, z, wlengths, nodes=24, side='top'):
+        """
+        Calculates the far-field emission pattern of dipoles within the
+        multilayer and the fraction of their power extracted into the
+        top (or bottom) medium.
+
+        The power radiated per unit solid angle, averaged over the
+        azimuth, is obtained from F:
+            - dipoles perpendicular to the interfaces (TM waves only):
+              3 / (8 * pi) * |Fz|^2 * sin(theta)^2
+            - dipoles parallel to the interfaces:
+              3 / (16 * pi) * |Fy|^2 (TE waves) and
+              3 / (16 * pi) * |Fx|^2 * cos(theta)^2 (TM waves)
+        where theta is the propagation angle in the exit medium, times
+        n_exit / n_dipole. The pattern is normalized to the total power
+        emitted by the same dipole in an infinite medium with the
+        refractive index of the layer that contains it, so a dipole in
+        a homogeneous medium has an efficiency of 0.5 on each side.
+
+        The efficiency is integrated over the escape cone with
+        Gauss-Legendre quadrature in theta. The interval [0, pi/2] is
+        split at the critical angles of the layers with a smaller
+        refractive index than the exit medium, where the integrand is
+        not smooth, and each piece gets the given number of nodes. The
+        error is estimated comparing with a rule of half as many nodes,
+        so it is rather an upper bound of the error: if it is small
+        enough, fewer nodes will usually do.
+
+        F is obtained from calculateFWavevector, so that the waves in
+        an evanescent medium on the other side decay away from the
+        multilayer.
+
+        Parameters
+        ----------
+        z : float or numpy.ndarray
+            The z coordinates of the emitting dipoles.
+        wlengths : float or numpy.ndarray
+            The wavelengths of the light, broadcast against z. In the
+            same units as in the files from which the refractive indices
+            were loaded.
+        nodes : int, optional
+            The number of nodes per piece of the interval of
+            integration. Default: 24.
+        side : str, optional
+            The exit medium, 'top' or 'bottom'. Default: 'top'. The exit
+            medium must be transparent.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with the keys:
+                - angles: the propagation angles in the exit medium at
+                  the quadrature nodes, with the broadcast shape of z
+                  and wlengths plus a last axis for the nodes.
+                - weights: the quadrature weights of the solid angle
+                  (including 2 * pi * sin(theta)), with the same shape.
+                - perpendicular, parallel, isotropic: dictionaries for
+                  dipoles perpendicular and parallel to the interfaces
+                  and for randomly oriented dipoles ((perpendicular + 2
+                  * parallel) / 3) with the keys {'te', 'tm',
+                  'efficiency', 'error'}. 'te' and 'tm' are the
+                  emission patterns at the nodes and 'efficiency' and
+                  'error' the extracted power and the estimate of its
+                  absolute error, with the broadcast shape of z and
+                  wlengths.
+
+        See also
+        --------
+        calculateFWavevector
+        """
+
+        side = _checkSide(side)
+        if int(nodes) != nodes or nodes < 2:
+            error = "Error: at least two nodes are needed"
+            print(error)
+            raise ValueError
+
+        z, wlengths = np.broadcast_arrays(
+                np.asarray(z, dtype=np.float64),
+                np.asarray(wlengths, dtype=np.float64))
+        n = self.getRefrIndices(wlengths)
+        if side == 'bottom':
+            n = n[..., ::-1]
+
+        # Tolerate the rounding errors of the interpolation of k = 0
+        if np.any(np.absolute(n[..., 0].imag) > 1e-12):
+            error = "Error: the exit medium must be transparent"
+            print(error)
+            raise ValueError
+        layers = np.asarray(self.getIndexAtPos(z))[..., np.newaxis]
+        if side == 'bottom':
+            layers = self.numLayers() - 1 - layers
+        emitter = np.sum(np.where(np.arange(self.numLayers()) == layers,
+                                  n, 0), axis=-1).real
+        exit = n[..., 0].real
+
+        # Pieces of the interval of integration, split at the critical
+        # angles of the layers with a smaller refractive index than the
+        # exit medium at any wavelength.
+        critical = []
+        for layer in range(1, self.numLayers()):
+            ratio = n[..., layer].real / exit
+            if np.any(ratio < 1) and not any(np.array_equal(ratio, other)
+                                             for other in critical):
+                critical.append(ratio)
+        limits = [np.zeros(exit.shape)] + \
+                [np.arcsin(np.minimum(ratio, 1)) for ratio in critical] + \
+                [np.full(exit.shape, np.pi / 2)]
+        limits = np.sort(np.stack(limits, axis=-1), axis=-1)
+
+        # Gauss-Legendre rules of nodes and nodes // 2 points in every
+        # piece, evaluated at once. The integrand has square root
+        # singularities at the critical angles, which are removed with
+        # the change of variable theta = lower + length * (1 - cos(pi *
+        # t)) / 2.
+        rules = [np.polynomial.legendre.leggauss(int(nodes)),
+                 np.polynomial.legendre.leggauss(int(nodes) // 2)]
+        lower = limits[..., :-1, np.newaxis]
+        length = limits[..., 1:, np.newaxis] - lower
+        angles = []
+        weights = []
+        for (x, w) in rules:
+            t = (x + 1) / 2
+            angles.append((lower + length * (1 - np.cos(np.pi * t)) /
+                           2).reshape(exit.shape + (-1,)))
+            weights.append((length * np.pi / 4 * np.sin(np.pi * t) *
+                            w).reshape(exit.shape + (-1,)))
+        split = angles[0].shape[-1]
+        theta = np.concatenate(angles, axis=-1)
+
+        fields = self.calculateFWavevector(
+                z[..., np.newaxis], wlengths[..., np.newaxis],
+                exit[..., np.newaxis] * np.sin(theta), side)
+
+        # Azimuthally averaged power per unit solid angle
+        factor = (exit / emitter)[..., np.newaxis] / np.pi
+        patterns = {
+                'perpendicular': {
+                    'te': np.zeros(theta.shape),
+                    'tm': 3 / 8.0 * factor * np.absolute(fields['fz']) ** 2 *
+                    np.sin(theta) ** 2},
+                'parallel': {
+                    'te': 3 / 16.0 * factor * np.absolute(fields['fy']) ** 2,
+                    'tm': 3 / 16.0 * factor * np.absolute(fields['fx']) ** 2 *
+                    np.cos(theta) ** 2}}
+        patterns['isotropic'] = dict(
+                (polarization, (patterns['perpendicular'][polarization] +
+                                2 * patterns['parallel'][polarization]) / 3)
+                for polarization in ['te', 'tm'])
+
+        solid = [2 * np.pi * np.sin(theta[..., :split]) * weights[0],
+                 2 * np.pi * np.sin(theta[..., split:]) * weights[1]]
+        results = {'angles': theta[..., :split], 'weights': solid[0]}
+        for (orientation, pattern) in patterns.items():
+            total = pattern['te'] + pattern['tm']
+            fine = np.sum(solid[0] * total[..., :split], axis=-1)
+            coarse = np.sum(solid[1] * total[..., split:], axis=-1)
+            results[orientation] = {
+                    'te': pattern['te'][..., :split],
+                    'tm': pattern['tm'][..., :split],
+                    'efficiency': fine,
+                    'error': np.absolute(fine - coarse)}
+
+        return results
+
+    def __flipped(self):
+        """
+        Returns the upside down multilayer. The position z of this
+        multilayer corresponds to getPosition(0) - z in the flipped one.
+        """
+
+        stack = [[self.__stack[index]['medium'],
+                  self.__stack[index]['thickness']]
+                 for index in range(self.numLayers() - 2, 0, -1)]
+
+        return Multilayer([self.__stack[-1]['medium']] + stack +
+                          [self.__stack[0]['medium']])
+
+    def __fieldFactors(self, batch, z, components):
+        """
+        Calculates the components of F for a batch of directions given
+        by __batchDirections or __batchWavevectors. See calculateF.
+        """
+
+        n = batch['refindex']
+        cosines = batch['cosine']
+        wlengths = batch['wlength']
+        phases = _layerPhases(n, cosines, self.__thicknesses(), wlengths)
+        etas = 2 * np.pi * np.sqrt(
+                n ** 2 - (n[..., :1] * batch['sine'][..., :1]) ** 2) / \
+                wlengths[..., np.newaxis]
+
+        z = np.asarray(z, dtype=np.float64)
+        shape = np.broadcast(z, wlengths).shape
+        z = np.broadcast_to(z, shape)
+        layerIndices = np.asarray(self.getIndexAtPos(z))
+        field = {'etas': etas, 'z': z, 'layers': layerIndices,
+                 'positions': self.__positionArray()}
+
+        results = {}
+        if 'y' in components:
+            field['amplitudes'] = _fieldAmplitudes(
+                    n, cosines, phases, etas, self.__thicknesses(), 'TE')
+            results['fy'] = _evaluateField(field, 1, 1)
+        if ('x' in components) or ('z' in components):
+            field['amplitudes'] = _fieldAmplitudes(
+                    n, cosines, phases, etas, self.__thicknesses(), 'TM')
+            # The grazing and normal directions in the top medium are
+            # handled as in calculateFx and calculateFz to avoid NaN
+            # results. If the dipole oscilates along x (z) there is no
+            # light propagating along x (z).
+            inside = layerIndices > 0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                if 'x' in components:
+                    gains = cosines / cosines[..., :1]
+                    gains[..., 0] = 1
+                    results['fx'] = _evaluateField(field, gains, -1)
+                    results['fx'][inside & np.broadcast_to(
+                            batch['grazing'], shape)] = 1
+                if 'z' in components:
+                    gains = batch['sine'] / batch['sine'][..., :1]
+                    gains[..., 0] = 1
+                    results['fz'] = _evaluateField(field, gains, 1)
+                    results['fz'][inside & np.broadcast_to(
+                            batch['normal'], shape)] = 1
+
+        return results
+
+    def __energyFactors(self, batch, z):
+        """
+        Calculates the TE and TM emission factors for a batch of
+        directions given by __batchDirections. See calculateF.
+        """
+
+        n = batch['refindex']
+        cosines = batch['cosine']
+        wlengths = batch['wlength']
+        thicknesses = self.__thicknesses()
+        phases = _layerPhases(n, cosines, thicknesses, wlengths)
+        etas = 2 * np.pi * np.sqrt(
+                n ** 2 - (n[..., :1] * batch['sine'][..., :1]) ** 2) / \
+                wlengths[..., np.newaxis]
+
+        z = np.asarray(z, dtype=np.float64)
+        shape = np.broadcast(z, wlengths).shape
+        z = np.broadcast_to(z, shape)
+        field = {'etas': etas, 'z': z,
+                 'layers': np.asarray(self.getIndexAtPos(z)),
+                 'positions': self.__positionArray()}
+
+        # Fx * cos(A)^2 + Fz * sin(A)^2 as a single field, with the
+        # gains of calculateDepthIntegral. The angles 0 and pi/2 make
+        # the terms of the constant Fx and Fz of calculateF vanish.
+        theta0 = batch['propangle0'][..., np.newaxis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xGains = cosines / cosines[..., :1] * np.cos(theta0) ** 2
+            zGains = batch['sine'] / batch['sine'][..., :1] * \
+                    np.sin(theta0) ** 2
+        xGains[..., 0] = np.cos(theta0[..., 0]) ** 2
+        zGains[..., 0] = np.sin(theta0[..., 0]) ** 2
+        xGains = np.where(theta0 == np.pi / 2, 0, xGains)
+        zGains = np.where(theta0 == 0, 0, zGains)
+        gains = {'TE': (1, 1), 'TM': (xGains + zGains, zGains - xGains)}
+
+        results = {}
+        for polarization in ['TE', 'TM']:
+            field['amplitudes'] = _fieldAmplitudes(
+                    n, cosines, phases, etas, thicknesses, polarization)
+            results[polarization.lower()] = _evaluateIntensity(
+                    field, gains[polarization])
+
+        return results
+
+    def __batchWavevectors(self, wlengths, neff):
+        """
+        Same as __batchDirections, but the propagation direction is
+        given by the normalized in-plane wavevector neff. The cosines
+        are obtained from the principal square root of n^2 - neff^2 and
+        the key 'propangle0' is not included.
+        """
+
+        wlengths, neff = np.broadcast_arrays(
+                np.asarray(wlengths, dtype=np.float64),
+                np.asarray(neff, dtype=np.complex128))
+        n = self.getRefrIndices(wlengths)
+        cosines = np.sqrt(n ** 2 - neff[..., np.newaxis] ** 2) / n
+
+        return {'wlength': wlengths, 'refindex': n, 'cosine': cosines,
+                'sine': neff[..., np.newaxis] / n,
+                'normal': neff == 0, 'grazing': cosines[..., 0] == 0}
+
+    def __positionArray(self):
+        """
+        Returns a numpy.ndarray with the position of every layer.
+        """
+
+        return self.__sortedPositions[::-1]
+
+    def __thicknesses(self):
+        """
+        Returns a numpy.ndarray with the thickness of every layer,
+        including the infinite thickness of the top and bottom mediums.
+        """
+
+        return np.array([layer['thickness'] for layer in self.__stack])
+
+    def __batchDirections(self, wlengths, angles, index):
+        """
+        Broadcasts wavelengths and propagation angles and returns a
+        dictionary with the following keys:
+            - wlength: the broadcast wavelengths.
+            - refindex: the refractive index of every layer (last axis).
+            - cosine: the cosine of the propagation angle in every
+              layer (last axis).
+            - sine: the sine of the propagation angle in every layer
+              (last axis).
+            - propangle0: the propagation angle in the top medium.
+            - normal, grazing: masks of the propagation angles 0 and
+              pi/2 in the top medium.
+
+        Snell's law is applied exactly as in setPropAngle so that the
+        batch methods reproduce the scalar ones.
+        """
+
+        if index < 0:
+            error = "Negative index not accepted"
+            print(error)
+            raise IndexError
+        if index >= self.numLayers():
+            error = "Layer %i does not exist" % index
+            print(error)
+            raise IndexError
+
+        wlengths, angles = np.broadcast_arrays(
+                np.asarray(wlengths, dtype=np.float64),
+                np.asarray(angles, dtype=np.complex128))
+        n = self.getRefrIndices(wlengths)
+        n_i = n[..., index:index + 1]
+        same = n == n_i
+        sines = n_i * np.sin(angles[..., np.newaxis]) / n
+        propangles = np.where(same, angles[..., np.newaxis], np.arcsin(sines))
+        sines = np.where(same, np.sin(angles[..., np.newaxis]), sines)
+
+        return {'wlength': wlengths, 'refindex': n,
+                'cosine': np.cos(propangles), 'sine': sines,
+                'propangle0': propangles[..., 0],
+                'normal': propangles[..., 0] == 0,
+                'grazing': propangles[..., 0] == np.pi / 2}
+
     def calculateFx(self, z, wlength, angle, index=0):
         """
         Calculates Fx(z; lambda, theta) of the multilayer.
@@ -1795,3 +2988,561 @@ class Multilayer(object):
                 fz = numerator * factor / denominator
 
         return np.complex128(fz)
+
+
+######################### Vectorized helpers ##########################
+
+
+def _checkPolarization(polarization):
+    """
+    Returns the polarization in upper case after checking that it is
+    either 'TE' or 'TM'. Mirrors the checks of setPolarization.
+    """
+
+    try:
+        polarization = polarization.upper()
+    except AttributeError:
+        error = "Error: polarization must be 'te' or 'tm'"
+        print(error)
+        raise AttributeError
+    if (polarization != 'TE') and (polarization != 'TM'):
+        error = "Error: polarization must be 'te' or 'tm'"
+        print(error)
+        raise ValueError
+
+    return polarization
+
+
+def _checkOrientation(orientation):
+    """
+    Returns the fraction of dipoles perpendicular to the interfaces for
+    an orientation given as 'isotropic', 'parallel', 'perpendicular'
+    (case insensitive) or directly as a fraction between 0 and 1.
+    """
+
+    fractions = {'isotropic': 1 / 3.0, 'parallel': 0.0,
+                 'perpendicular': 1.0}
+    if isinstance(orientation, str):
+        if orientation.lower() not in fractions:
+            error = "Error: the orientation must be 'isotropic', " + \
+                    "'parallel', 'perpendicular' or a fraction"
+            print(error)
+            raise ValueError
+        return fractions[orientation.lower()]
+    if not 0 <= orientation <= 1:
+        error = "Error: the fraction of perpendicular dipoles must be " + \
+                "between 0 and 1"
+        print(error)
+        raise ValueError
+
+    return float(orientation)
+
+
+def _checkSide(side):
+    """
+    Checks that side is 'top' or 'bottom' (case insensitive) and returns
+    it in lower case.
+    """
+
+    side = str(side).lower()
+    if side not in ['top', 'bottom']:
+        error = "Error: the side must be 'top' or 'bottom'"
+        print(error)
+        raise ValueError
+
+    return side
+
+
+def _layerPhases(n, cosines, thicknesses, wlengths):
+    """
+    Returns the cosine and sine of the phase thickness
+    b = 2 * pi * n * d * cos(theta) / lambda of every layer.
+
+    These do not depend on the polarization and are shared by the TE
+    and TM characteristic matrices. The infinite top and bottom mediums
+    are given a zero phase so that their matrices are the identity.
+
+    Parameters
+    ----------
+    n, cosines : numpy.ndarray
+        Refractive indices and cosines of the propagation angles, with
+        the layers along the last axis.
+    thicknesses : numpy.ndarray
+        The thickness of each layer, broadcastable against n.
+    wlengths : numpy.ndarray
+        The wavelengths, with the shape of n without the last axis.
+
+    Returns
+    -------
+    out : tuple
+        (cos(b), sin(b)) with the shape of n.
+    """
+
+    thicknesses = np.where(np.isinf(thicknesses), 0.0, thicknesses)
+    b = 2 * np.pi * n * thicknesses * cosines / \
+            np.asarray(wlengths)[..., np.newaxis]
+
+    return (np.cos(b), np.sin(b))
+
+
+def _pFactors(n, cosines, polarization):
+    """
+    Returns the factor p of every layer: n * cos(theta) for TE waves and
+    cos(theta) / n for TM waves.
+    """
+
+    if polarization == 'TE':
+        return n * cosines
+    else:
+        return cosines / n
+
+
+def _layerMatrices(phases, p):
+    """
+    Builds the characteristic matrices of the layers from their phases
+    (see _layerPhases) and p factors (see _pFactors). The result has the
+    broadcast shape of the phases and p followed by (2, 2).
+    """
+
+    cosb, sinb = phases
+    shape = np.broadcast(cosb, p).shape
+    matrices = np.empty(shape + (2, 2), dtype=np.complex128)
+    matrices[..., 0, 0] = cosb
+    matrices[..., 0, 1] = -1j * sinb / p
+    matrices[..., 1, 0] = -1j * p * sinb
+    matrices[..., 1, 1] = cosb
+
+    return matrices
+
+
+def _matrixProduct(a, b):
+    """
+    Returns the product of two stacks of 2x2 matrices (shape (..., 2,
+    2)) with broadcasting over the leading axes.
+    """
+
+    shape = np.broadcast(a[..., 0, 0], b[..., 0, 0]).shape
+    product = np.empty(shape + (2, 2), dtype=np.complex128)
+    product[..., 0, 0] = a[..., 0, 0] * b[..., 0, 0] + \
+            a[..., 0, 1] * b[..., 1, 0]
+    product[..., 0, 1] = a[..., 0, 0] * b[..., 0, 1] + \
+            a[..., 0, 1] * b[..., 1, 1]
+    product[..., 1, 0] = a[..., 1, 0] * b[..., 0, 0] + \
+            a[..., 1, 1] * b[..., 1, 0]
+    product[..., 1, 1] = a[..., 1, 0] * b[..., 0, 1] + \
+            a[..., 1, 1] * b[..., 1, 1]
+
+    return product
+
+
+def _chainProduct(matrices, layers):
+    """
+    Returns the ordered product of the matrices of the given layers
+    (matrices has the layers along the third to last axis). An empty
+    sequence of layers gives the identity.
+    """
+
+    product = np.zeros(matrices.shape[:-3] + (2, 2), dtype=np.complex128)
+    product[..., 0, 0] = 1
+    product[..., 1, 1] = 1
+    for layer in layers:
+        product = _matrixProduct(product, matrices[..., layer, :, :])
+
+    return product
+
+
+def _matrixCoefficients(matrix, n_i, cos_i, n_l, cos_l, polarization):
+    """
+    Calculates the coefficients r, t, R and T from a characteristic
+    matrix, following exactly the expressions of updateCharMatrix.
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray
+        Characteristic matrices with shape (..., 2, 2).
+    n_i, cos_i : numpy.ndarray
+        Refractive index and cosine of the propagation angle in the
+        input medium.
+    n_l, cos_l : numpy.ndarray
+        Refractive index and cosine of the propagation angle in the exit
+        medium.
+    polarization : str
+        'TE' or 'TM'.
+
+    Returns
+    -------
+    out : dictionary
+        The keys are {'r', 't', 'R', 'T'}.
+    """
+
+    p_i = _pFactors(n_i, cos_i, polarization)
+    p_l = _pFactors(n_l, cos_l, polarization)
+    a = (matrix[..., 0, 0] + matrix[..., 0, 1] * p_l) * p_i
+    b = matrix[..., 1, 0] + matrix[..., 1, 1] * p_l
+
+    r = (a - b) / (a + b)
+    t = 2 * p_i / (a + b)
+    if polarization == 'TM':
+        # Express t in terms of the electric field (see updateCharMatrix)
+        t = t * n_i / n_l
+    p_i = n_i * cos_i
+    p_l = n_l * cos_l
+
+    return {'r': r, 't': t, 'R': np.absolute(r) ** 2,
+            'T': np.absolute(t) ** 2 * p_l / p_i}
+
+
+def _stackCoefficients(n, cosines, phases, polarization):
+    """
+    Calculates the up-down coefficients of a whole stack for a batch of
+    wavelengths and angles. The layers are along the last axis of n,
+    cosines and the phases.
+    """
+
+    matrices = _layerMatrices(phases, _pFactors(n, cosines, polarization))
+    matrix = _chainProduct(matrices, range(1, n.shape[-1] - 1))
+
+    return _matrixCoefficients(matrix, n[..., 0], cosines[..., 0],
+                               n[..., -1], cosines[..., -1], polarization)
+
+
+def _fieldAmplitudes(n, cosines, phases, etas, thicknesses, polarization):
+    """
+    Calculates the amplitudes of the downward and upward waves that
+    build F(z) inside every layer of the stack.
+
+    Within layer j, F(z) is written as
+
+        F(z) = exp(i * eta_0 * (z - z_0)) * g_j *
+               (A_j * exp(-i * eta_j * (z - z_{j-1})) +
+                s * B_j * exp(i * eta_j * (z - z_j)))
+
+    where z_j is the position of layer j, g_j a geometrical gain that
+    depends on the dipole orientation and s is -1 for Fx and +1 for Fy
+    and Fz. For the top medium A_0 = 1 and B_0 = r_01; for the bottom
+    medium A_N = t_1N and B_N = 0; for the other layers
+
+        A_j = t_1j / (1 - r_jj+1 * r_jj-1 * exp(2i * eta_j * d_j))
+        B_j = A_j * r_jj+1 * exp(i * eta_j * d_j),
+
+    which is the expression used by calculateFx, calculateFy and
+    calculateFz. The coefficients of the submultilayers above and
+    below every layer are obtained from cumulative products of the
+    characteristic matrices.
+
+    Parameters
+    ----------
+    n, cosines : numpy.ndarray
+        Refractive indices and cosines of the propagation angles, with
+        the layers along the last axis.
+    phases : tuple
+        The output of _layerPhases.
+    etas : numpy.ndarray
+        The normal component of the wavevector in every layer.
+    thicknesses : numpy.ndarray
+        The thickness of every layer.
+    polarization : str
+        'TE' or 'TM'.
+
+    Returns
+    -------
+    out : tuple
+        (A, B), two complex128 arrays with the shape of n.
+    """
+
+    numLayers = n.shape[-1]
+    last = numLayers - 1
+    matrices = _layerMatrices(phases, _pFactors(n, cosines, polarization))
+    amplitudesDown = np.zeros(n.shape, dtype=np.complex128)
+    amplitudesUp = np.zeros(n.shape, dtype=np.complex128)
+
+    # Top and bottom mediums.
+    coefficients = _matrixCoefficients(
+            _chainProduct(matrices, range(1, last)), n[..., 0],
+            cosines[..., 0], n[..., last], cosines[..., last], polarization)
+    amplitudesDown[..., 0] = 1
+    amplitudesUp[..., 0] = coefficients['r']
+    amplitudesDown[..., last] = coefficients['t']
+
+    # Reflection coefficient from each layer towards the bottom medium.
+    # They are stored temporarily in amplitudesUp.
+    below = _chainProduct(matrices, [])
+    for layer in range(last - 1, 0, -1):
+        amplitudesUp[..., layer] = _matrixCoefficients(
+                below, n[..., layer], cosines[..., layer], n[..., last],
+                cosines[..., last], polarization)['r']
+        below = _matrixProduct(matrices[..., layer, :, :], below)
+
+    # Transmission from the top medium and reflection from each layer
+    # towards the top medium.
+    above = _chainProduct(matrices, [])
+    aboveReversed = _chainProduct(matrices, [])
+    for layer in range(1, last):
+        t1j = _matrixCoefficients(
+                above, n[..., 0], cosines[..., 0], n[..., layer],
+                cosines[..., layer], polarization)['t']
+        rjjm1 = _matrixCoefficients(
+                aboveReversed, n[..., layer], cosines[..., layer], n[..., 0],
+                cosines[..., 0], polarization)['r']
+        rjjp1 = amplitudesUp[..., layer]
+        exponential = np.exp(etas[..., layer] * thicknesses[layer] * 1j)
+        amplitudesDown[..., layer] = t1j / \
+                (1 - rjjp1 * rjjm1 * exponential ** 2)
+        amplitudesUp[..., layer] = amplitudesDown[..., layer] * rjjp1 * \
+                exponential
+        above = _matrixProduct(above, matrices[..., layer, :, :])
+        aboveReversed = _matrixProduct(matrices[..., layer, :, :],
+                                       aboveReversed)
+
+    return (amplitudesDown, amplitudesUp)
+
+
+def _coefficientDerivatives(matrix, derivative, n_i, cos_i, n_l, cos_l,
+                            polarization):
+    """
+    Returns the derivatives of the coefficients r and t of
+    _matrixCoefficients given the derivative of the characteristic
+    matrix, as a tuple (r, t, dr, dt).
+    """
+
+    p_i = _pFactors(n_i, cos_i, polarization)
+    p_l = _pFactors(n_l, cos_l, polarization)
+    a = (matrix[..., 0, 0] + matrix[..., 0, 1] * p_l) * p_i
+    b = matrix[..., 1, 0] + matrix[..., 1, 1] * p_l
+    da = (derivative[..., 0, 0] + derivative[..., 0, 1] * p_l) * p_i
+    db = derivative[..., 1, 0] + derivative[..., 1, 1] * p_l
+
+    r = (a - b) / (a + b)
+    t = 2 * p_i / (a + b)
+    if polarization == 'TM':
+        t = t * n_i / n_l
+    dr = 2 * (b * da - a * db) / (a + b) ** 2
+    dt = -t * (da + db) / (a + b)
+
+    return (r, t, dr, dt)
+
+
+def _fieldAmplitudeDerivatives(n, cosines, phases, etas, thicknesses,
+                               wlengths, polarization, varied):
+    """
+    Calculates the derivatives of the amplitudes of _fieldAmplitudes
+    with respect to the thickness of the layer varied, at fixed
+    positions of the interfaces of every layer relative to its own
+    lower interface (the phases of F(z) are handled by the caller).
+
+    The derivative of the characteristic matrix of the varied layer is
+    propagated through the products of matrices with the product rule,
+    following exactly the steps of _fieldAmplitudes.
+
+    Returns
+    -------
+    out : tuple
+        (dA, dB), two complex128 arrays with the shape of n.
+    """
+
+    numLayers = n.shape[-1]
+    last = numLayers - 1
+    p = _pFactors(n, cosines, polarization)
+    matrices = _layerMatrices(phases, p)
+
+    # Only the matrix of the varied layer depends on its thickness
+    cosb, sinb = phases
+    rate = 2 * np.pi * n[..., varied] * cosines[..., varied] / \
+            np.asarray(wlengths)
+    tangents = np.zeros(matrices.shape, dtype=np.complex128)
+    tangents[..., varied, 0, 0] = -sinb[..., varied] * rate
+    tangents[..., varied, 0, 1] = -1j * cosb[..., varied] / \
+            p[..., varied] * rate
+    tangents[..., varied, 1, 0] = -1j * p[..., varied] * \
+            cosb[..., varied] * rate
+    tangents[..., varied, 1, 1] = -sinb[..., varied] * rate
+
+    def identity():
+        return (_chainProduct(matrices, []),
+                np.zeros(matrices.shape[:-3] + (2, 2), dtype=np.complex128))
+
+    def multiply(first, second):
+        return (_matrixProduct(first[0], second[0]),
+                _matrixProduct(first[1], second[0]) +
+                _matrixProduct(first[0], second[1]))
+
+    def layer(index):
+        return (matrices[..., index, :, :], tangents[..., index, :, :])
+
+    amplitudesDown = np.zeros(n.shape, dtype=np.complex128)
+    amplitudesUp = np.zeros(n.shape, dtype=np.complex128)
+    reflections = np.zeros(n.shape, dtype=np.complex128)
+
+    # Top and bottom mediums
+    whole = identity()
+    for index in range(1, last):
+        whole = multiply(whole, layer(index))
+    coefficients = _coefficientDerivatives(
+            whole[0], whole[1], n[..., 0], cosines[..., 0], n[..., last],
+            cosines[..., last], polarization)
+    amplitudesUp[..., 0] = coefficients[2]
+    amplitudesDown[..., last] = coefficients[3]
+
+    # Reflection coefficient from each layer towards the bottom medium
+    below = identity()
+    for index in range(last - 1, 0, -1):
+        coefficients = _coefficientDerivatives(
+                below[0], below[1], n[..., index], cosines[..., index],
+                n[..., last], cosines[..., last], polarization)
+        reflections[..., index] = coefficients[0]
+        amplitudesUp[..., index] = coefficients[2]
+        below = multiply(layer(index), below)
+
+    # Transmission from the top medium and reflection from each layer
+    # towards the top medium
+    above = identity()
+    aboveReversed = identity()
+    for index in range(1, last):
+        t1j, dt1j = _coefficientDerivatives(
+                above[0], above[1], n[..., 0], cosines[..., 0],
+                n[..., index], cosines[..., index], polarization)[1::2]
+        rjjm1, drjjm1 = _coefficientDerivatives(
+                aboveReversed[0], aboveReversed[1], n[..., index],
+                cosines[..., index], n[..., 0], cosines[..., 0],
+                polarization)[::2]
+        rjjp1 = reflections[..., index]
+        drjjp1 = amplitudesUp[..., index]
+        exponential = np.exp(etas[..., index] * thicknesses[index] * 1j)
+        dexponential = 1j * etas[..., index] * exponential if \
+                index == varied else 0
+        denominator = 1 - rjjp1 * rjjm1 * exponential ** 2
+        ddenominator = -(drjjp1 * rjjm1 * exponential ** 2 +
+                         rjjp1 * drjjm1 * exponential ** 2 +
+                         2 * rjjp1 * rjjm1 * exponential * dexponential)
+        down = t1j / denominator
+        ddown = dt1j / denominator - t1j * ddenominator / denominator ** 2
+        amplitudesDown[..., index] = ddown
+        amplitudesUp[..., index] = ddown * rjjp1 * exponential + \
+                down * drjjp1 * exponential + down * rjjp1 * dexponential
+        above = multiply(above, layer(index))
+        aboveReversed = multiply(layer(index), aboveReversed)
+
+    return (amplitudesDown, amplitudesUp)
+
+
+def _evaluateField(field, gains, sign):
+    """
+    Evaluates F(z) from the amplitudes of _fieldAmplitudes.
+
+    Parameters
+    ----------
+    field : dictionary
+        A dictionary with the keys:
+            - amplitudes: the output of _fieldAmplitudes.
+            - etas: the normal component of the wavevector in every
+              layer (layers along the last axis).
+            - z: the dipole positions, already broadcast to the shape
+              of the result.
+            - layers: the index of the layer of every dipole position.
+            - positions: the position of every layer.
+    gains : float or numpy.ndarray
+        The geometrical gain g_j of every layer (last axis).
+    sign : int
+        -1 for Fx, +1 for Fy and Fz.
+
+    Returns
+    -------
+    out : numpy.ndarray
+        F(z) with the shape of field['z'].
+    """
+
+    amplitudesDown, amplitudesUp = field['amplitudes']
+    etas = field['etas']
+    z = field['z']
+    layers = field['layers']
+    positions = field['positions']
+    last = etas.shape[-1] - 1
+    shape = z.shape
+    gains = np.broadcast_to(gains, etas.shape)
+
+    result = np.empty(shape, dtype=np.complex128)
+    for layer in np.unique(layers):
+        selection = layers == layer
+        zs = z[selection]
+
+        def pick(array):
+            return np.broadcast_to(array[..., layer], shape)[selection]
+
+        if layer == 0:
+            top = bottom = positions[0]
+        else:
+            top = positions[layer - 1]
+            bottom = positions[layer]
+        eta = pick(etas)
+        value = pick(amplitudesDown) * np.exp(-eta * (zs - top) * 1j)
+        if layer != last:
+            value += sign * pick(amplitudesUp) * \
+                    np.exp(eta * (zs - bottom) * 1j)
+        eta0 = np.broadcast_to(etas[..., 0], shape)[selection]
+        result[selection] = pick(gains) * value * \
+                np.exp(eta0 * (zs - positions[0]) * 1j)
+
+    return result
+
+
+def _evaluateIntensity(field, gains, blockSize=65536):
+    """
+    Evaluates |F(z)|^2 from the amplitudes of _fieldAmplitudes, with
+    separate gains for the downward and upward waves of every layer.
+
+    The dipole positions of every layer are processed in blocks of at
+    most blockSize elements, so the complex values of F are only stored
+    for one block at a time.
+
+    Parameters
+    ----------
+    field : dictionary
+        See _evaluateField.
+    gains : tuple
+        (gDown, gUp), the gains of the downward and upward waves of
+        every layer (last axis).
+    blockSize : int, optional
+        The maximum number of dipole positions evaluated at once.
+
+    Returns
+    -------
+    out : numpy.ndarray
+        |F(z)|^2 as a float64 array with the shape of field['z'].
+    """
+
+    amplitudesDown, amplitudesUp = field['amplitudes']
+    etas = field['etas']
+    z = field['z']
+    layers = field['layers']
+    positions = field['positions']
+    last = etas.shape[-1] - 1
+    shape = z.shape
+    gainsDown = np.broadcast_to(gains[0], etas.shape)
+    gainsUp = np.broadcast_to(gains[1], etas.shape)
+
+    result = np.empty(shape, dtype=np.float64)
+    for layer in np.unique(layers):
+        if layer == 0:
+            top = bottom = positions[0]
+        else:
+            top = positions[layer - 1]
+            bottom = positions[layer]
+        selection = np.flatnonzero(layers == layer)
+        for start in range(0, selection.size, blockSize):
+            block = np.unravel_index(selection[start:start + blockSize],
+                                     shape)
+
+            def pick(array, layer=layer):
+                return np.broadcast_to(array[..., layer], shape)[block]
+
+            zs = z[block]
+            eta = pick(etas)
+            value = pick(gainsDown) * pick(amplitudesDown) * \
+                    np.exp(-eta * (zs - top) * 1j)
+            if layer != last:
+                value += pick(gainsUp) * pick(amplitudesUp) * \
+                        np.exp(eta * (zs - bottom) * 1j)
+            value *= np.exp(pick(etas, 0) * (zs - positions[0]) * 1j)
+            result[block] = value.real ** 2 + value.imag ** 2
+
+    return result
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""
+Name          : optimizer
+Author        : Joan Juvert <trust.no.one.51@gmail.com>
+Version       : 1.0
+Description   : Design of the thicknesses of a multilayer that maximize
+              : the emission of a distribution of emitters.
+
+Copyright 2012 Joan Juvert
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import distributions as ds
+import multilayers as ml
+import numpy as np
+from scipy.optimize import minimize
+
+
+############################ Class definitions ########################
+
+
+class StackOptimizer(object):
+    """
+    The StackOptimizer class finds the thicknesses of some layers of a
+    multilayer that maximize the emission of a distribution of emitters
+    observed at a set of angles over a band of wavelengths. The
+    objective is the average
+
+        J = <s(lambda) * w(theta) * (|Fy|^2 + |Fx * cos(theta)^2 +
+                                                Fz * sin(theta)^2|^2)>
+
+    over the distribution of emitters, the band and the angles, where s
+    is the intrinsic spectrum, w are the weights of the angles and theta
+    is the propagation angle in the top medium. Only the TE or the TM
+    term may be used instead of their sum.
+
+    The emitters are attached to the layers that contain them when the
+    optimizer is created: every emitter keeps its distance to the lower
+    interface of its layer (to the upper interface for the bottom
+    medium) when the thicknesses change. The layers holding emitters
+    cannot become thinner than the emitters' distance to their lower
+    interface.
+
+    The depth average is calculated with Gauss-Legendre quadrature over
+    the part of the distribution within every layer, and the gradient of
+    J with respect to the thicknesses with the analytic derivatives of
+    Multilayer.calculateFGradient. All the wavelengths, angles and depths
+    are evaluated at once. The optimization itself uses the L-BFGS-B
+    method, which supports bounds on the thicknesses.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, multilayer, distribution, wlengths, angles,
+                 spectrum=None, weights=None, polarization='both', nodes=16,
+                 index=0):
+        """
+        Initialize a StackOptimizer instance.
+
+        Parameters
+        ----------
+        multilayer : Multilayer
+            The multilayer system. Its thicknesses are changed by the
+            optimization.
+        distribution : Distribution
+            The distribution of emitters along the z axis of the
+            multilayer as it is now (see the distributions module).
+        wlengths : numpy.ndarray
+            The wavelengths of the band, in increasing order.
+        angles : float or numpy.ndarray
+            The detector angles in radians.
+        spectrum : numpy.ndarray, optional
+            The intrinsic spectrum of the emitters at wlengths. By
+            default it is flat.
+        weights : numpy.ndarray, optional
+            The weights of the angles. By default all equal.
+        polarization : str, optional
+            'te', 'tm' or 'both'. Default: 'both'.
+        nodes : int, optional
+            The number of quadrature nodes of the depth average within
+            every layer. Default: 16.
+        index : int, optional
+            The index of the layer where the angles are given. By
+            default the top medium (index = 0).
+
+        Returns
+        -------
+        out : StackOptimizer
+            A StackOptimizer instance.
+        """
+
+        if not isinstance(multilayer, ml.Multilayer):
+            error = "StackOptimizer creation error: a Multilayer " + \
+                    "instance is expected"
+            print(error)
+            raise TypeError
+        if not isinstance(distribution, ds.Distribution):
+            error = "StackOptimizer creation error: a Distribution " + \
+                    "instance is expected"
+            print(error)
+            raise TypeError
+        if polarization not in ['te', 'tm', 'both']:
+            error = "StackOptimizer creation error: polarization must be " + \
+                    "'te', 'tm' or 'both'"
+            print(error)
+            raise ValueError
+        if int(nodes) != nodes or nodes < 1:
+            error = "StackOptimizer creation error: nodes must be a " + \
+                    "positive integer"
+            print(error)
+            raise ValueError
+
+        wlengths = np.atleast_1d(np.asarray(wlengths, dtype=np.float64))
+        if wlengths.ndim != 1 or np.any(np.diff(wlengths) <= 0):
+            error = "StackOptimizer creation error: the wavelengths must " + \
+                    "be increasing"
+            print(error)
+            raise ValueError
+        angles = np.atleast_1d(np.asarray(angles, dtype=np.float64))
+        if spectrum is None:
+            spectrum = np.ones(wlengths.size)
+        if weights is None:
+            weights = np.ones(angles.size)
+        spectrum = np.asarray(spectrum, dtype=np.float64)
+        weights = np.asarray(weights, dtype=np.float64)
+        if spectrum.shape != wlengths.shape or weights.shape != angles.shape:
+            error = "StackOptimizer creation error: the spectrum and the " + \
+                    "weights must match the wavelengths and the angles"
+            print(error)
+            raise ValueError
+
+        if index < 0 or index >= multilayer.numLayers():
+            error = "StackOptimizer creation error: layer %i does not " + \
+                    "exist"
+            print(error % index)
+            raise IndexError
+
+        # The TM term weights Fx and Fz with the propagation angle in the
+        # top medium, as calculateF and calculateDepthIntegral do
+        n = multilayer.getRefrIndices(wlengths[:, np.newaxis])
+        sines = n[..., index] * np.sin(angles) / n[..., 0]
+        topAngles = np.where(n[..., index] == n[..., 0],
+                             angles.astype(np.complex128), np.arcsin(sines))
+
+        self.__multilayer = multilayer
+        self.__wlengths = wlengths
+        self.__angles = angles
+        self.__topAngles = topAngles
+        self.__polarization = polarization
+        self.__index = index
+
+        # Band and angle weights, normalized to give averages
+        if wlengths.size > 1:
+            band = np.zeros(wlengths.size)
+            band[1:] += np.diff(wlengths) / 2
+            band[:-1] += np.diff(wlengths) / 2
+        else:
+            band = np.ones(1)
+        band = band * spectrum
+        self.__band = band / np.sum(band)
+        self.__weights = weights / np.sum(weights)
+
+        # Depth nodes, attached to the layers that contain them
+        self.__layers, self.__offsets, self.__depthWeights = \
+            _depthNodes(multilayer, distribution, int(nodes))
+
+    def getAngles(self):
+        """
+        Returns the detector angles in radians.
+        """
+
+        return self.__angles
+
+    def getWavelengths(self):
+        """
+        Returns the wavelengths of the band.
+        """
+
+        return self.__wlengths
+
+    def calculateObjective(self, layers=[]):
+        """
+        Calculates the objective J for the current thicknesses of the
+        multilayer and its gradient with respect to the thicknesses of
+        the given layers.
+
+        Parameters
+        ----------
+        layers : list, optional
+            The indices of the layers of the gradient. By default none.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with the keys:
+                - objective: the value of J.
+                - gradient: an array with the derivatives of J, in the
+                  order of layers.
+        """
+
+        multilayer = self.__multilayer
+        layers = list(layers)
+        z = np.array([_anchor(multilayer, layer) for layer in
+                      self.__layers]) + self.__offsets
+        factors = multilayer.calculateFGradient(
+                z[:, np.newaxis, np.newaxis],
+                self.__wlengths[:, np.newaxis], self.__angles, layers,
+                self.__index)
+
+        # Weight of every depth, wavelength and angle
+        weights = self.__depthWeights[:, np.newaxis, np.newaxis] * \
+            self.__band[:, np.newaxis] * self.__weights
+
+        objective = 0.0
+        gradient = np.zeros(len(layers))
+        if self.__polarization in ['te', 'both']:
+            objective += np.sum(weights * np.absolute(factors['fy']) ** 2)
+            gradient += 2 * np.sum(
+                    weights * (factors['fy'].conj() * factors['dfy']).real,
+                    axis=(1, 2, 3))
+        if self.__polarization in ['tm', 'both']:
+            cosines = np.cos(self.__topAngles) ** 2
+            sines = np.sin(self.__topAngles) ** 2
+            field = factors['fx'] * cosines + factors['fz'] * sines
+            derivative = factors['dfx'] * cosines + factors['dfz'] * sines
+            objective += np.sum(weights * np.absolute(field) ** 2)
+            gradient += 2 * np.sum(
+                    weights * (field.conj() * derivative).real,
+                    axis=(1, 2, 3))
+
+        return {'objective': objective, 'gradient': gradient}
+
+    def optimize(self, layers, bounds=None, maxIterations=200,
+                 tolerance=1e-10):
+        """
+        Maximizes J over the thicknesses of the given layers, keeping the
+        rest fixed. The multilayer is left with the optimal thicknesses.
+
+        Parameters
+        ----------
+        layers : list
+            The indices of the layers whose thicknesses are optimized.
+            Only the layers between the top and bottom mediums are
+            allowed.
+        bounds : list, optional
+            A (minimum, maximum) tuple for every layer. None means no
+            limit. By default the thicknesses are only required to be
+            positive.
+        maxIterations : int, optional
+            The maximum number of iterations. Default: 200.
+        tolerance : float, optional
+            The relative tolerance of J for the convergence. Default:
+            1e-10.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with the keys:
+                - thicknesses: the optimal thicknesses, in the order of
+                  layers.
+                - objective: the optimal value of J.
+                - initial: the value of J for the initial thicknesses.
+                - iterations: the number of iterations.
+                - success: whether the optimization converged.
+                - message: the description of the result.
+        """
+
+        multilayer = self.__multilayer
+        layers = list(layers)
+        if not layers or any(layer <= 0 or layer >= multilayer.numLayers() - 1
+                             for layer in layers):
+            error = "Error: only the thicknesses of the layers between " + \
+                    "the top and bottom mediums can be optimized"
+            print(error)
+            raise IndexError
+        if bounds is None:
+            bounds = [(None, None)] * len(layers)
+        if len(bounds) != len(layers):
+            error = "Error: there must be a (minimum, maximum) tuple for " + \
+                    "every layer"
+            print(error)
+            raise ValueError
+
+        # The layers cannot be thinner than the emitters they hold
+        limits = []
+        for (layer, (lower, upper)) in zip(layers, bounds):
+            offsets = self.__offsets[self.__layers == layer]
+            minimum = max([0.0] + list(offsets))
+            lower = minimum if lower is None else max(lower, minimum)
+            if upper is not None and upper < lower:
+                error = "Error: the bounds of the layer %d leave out " \
+                        "the emitters it holds" % layer
+                print(error)
+                raise ValueError
+            limits.append((lower, upper))
+
+        initial = self.calculateObjective()['objective']
+        if initial <= 0:
+            error = "Error: the emission of the initial multilayer is zero"
+            print(error)
+            raise ValueError
+
+        def function(thicknesses):
+            for (layer, thickness) in zip(layers, thicknesses):
+                multilayer.setThickness(thickness, layer)
+            result = self.calculateObjective(layers)
+            return (-result['objective'] / initial,
+                    -result['gradient'] / initial)
+
+        start = [multilayer.getThickness(layer) for layer in layers]
+        start = [min(max(thickness, lower), np.inf if upper is None else
+                     upper) for (thickness, (lower, upper)) in
+                 zip(start, limits)]
+        result = minimize(function, start, jac=True, method='L-BFGS-B',
+                          bounds=limits,
+                          options={'maxiter': maxIterations,
+                                   'ftol': tolerance})
+        for (layer, thickness) in zip(layers, result.x):
+            multilayer.setThickness(thickness, layer)
+
+        return {'thicknesses': np.array(result.x),
+                'objective': self.calculateObjective()['objective'],
+                'initial': initial, 'iterations': result.nit,
+                'success': result.success, 'message': result.message}
+
+
+######################### Auxiliary functions #########################
+
+
+def _anchor(multilayer, layer):
+    """
+    Returns the z coordinate of the interface the emitters of a layer
+    are attached to: its lower interface, or the upper one for the
+    bottom medium.
+    """
+
+    last = multilayer.numLayers() - 1
+    return multilayer.getPosition(min(layer, last - 1))
+
+
+def _depthNodes(multilayer, distribution, nodes):
+    """
+    Returns the Gauss-Legendre nodes of the depth average within every
+    layer as a tuple (layers, offsets, weights): the layer of every
+    node, its distance to the anchor of the layer and its weight
+    (density times quadrature weight, normalized).
+    """
+
+    zmin, zmax = distribution.getSupport()
+    last = multilayer.numLayers() - 1
+    edges = [-np.inf] + [multilayer.getPosition(layer)
+                         for layer in range(last - 1, -1, -1)] + [np.inf]
+    points, weights = np.polynomial.legendre.leggauss(nodes)
+
+    layers = []
+    offsets = []
+    values = []
+    for (k, (lower, upper)) in enumerate(zip(edges[:-1], edges[1:])):
+        lower = max(lower, zmin)
+        upper = min(upper, zmax)
+        if upper <= lower:
+            continue
+        layer = last - k
+        z = (upper + lower) / 2 + (upper - lower) / 2 * points
+        layers.extend([layer] * nodes)
+        offsets.extend(z - _anchor(multilayer, layer))
+        values.extend(weights * (upper - lower) / 2 *
+                      distribution.calculateDensity(z))
+
+    values = np.array(values)
+    return (np.array(layers), np.array(offsets), values / np.sum(values))
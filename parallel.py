@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Name          : parallel
+Author        : Joan Juvert <trust.no.one.51@gmail.com>
+Version       : 1.0
+Description   : Evaluation of wavelength, angle and depth grids of a
+              : multilayer on a pool of worker processes.
+
+Copyright 2012 Joan Juvert
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import multilayers as ml
+import multiprocessing
+import numpy as np
+import os
+import tempfile
+from numpy.lib.format import open_memmap
+
+
+# The multilayer of every worker process of a pool, set once by
+# _initialize.
+_worker = {}
+
+
+############################ Class definitions ########################
+
+
+class SweepExecutor(object):
+    """
+    The SweepExecutor class evaluates the emission factors of a
+    multilayer on grids of depths, wavelengths and angles using several
+    worker processes.
+
+    The (wavelength, angle) pairs of the grid are partitioned into
+    chunks. Every chunk is evaluated with Multilayer.calculateF for all
+    the depths at once, so the matrices of every pair are calculated
+    only once, and the workers write it in place into the arrays of the
+    results, which are memory maps of .npy files shared by all the
+    processes. Only the chunks of the grid travel to the workers.
+
+    The multilayer (with the tables of refractive indices of its
+    mediums) is pickled and sent to every worker when the executor is
+    created. The workers hold a snapshot: later changes of the
+    multilayer are not seen by the executor. The worker processes are
+    kept until close is called (or the with block that created the
+    executor ends).
+
+    With a single worker the chunks are evaluated in the calling
+    process, without a pool.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, multilayer, workers=None, chunkSize=64):
+        """
+        Initialize a SweepExecutor instance.
+
+        Parameters
+        ----------
+        multilayer : Multilayer
+            The multilayer system.
+        workers : int, optional
+            The number of worker processes. By default the number of
+            CPUs.
+        chunkSize : int, optional
+            The number of (wavelength, angle) pairs of every chunk.
+            Default: 64.
+
+        Returns
+        -------
+        out : SweepExecutor
+            A SweepExecutor instance.
+        """
+
+        if not isinstance(multilayer, ml.Multilayer):
+            error = "SweepExecutor creation error: a Multilayer instance " + \
+                    "is expected"
+            print(error)
+            raise TypeError
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if int(workers) != workers or workers < 1:
+            error = "SweepExecutor creation error: workers must be a " + \
+                    "positive integer"
+            print(error)
+            raise ValueError
+        if int(chunkSize) != chunkSize or chunkSize < 1:
+            error = "SweepExecutor creation error: chunkSize must be a " + \
+                    "positive integer"
+            print(error)
+            raise ValueError
+
+        self.__workers = int(workers)
+        self.__chunkSize = int(chunkSize)
+        self.__multilayer = multilayer
+        self.__pool = None
+        if self.__workers > 1:
+            self.__pool = multiprocessing.Pool(self.__workers, _initialize,
+                                               (multilayer,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def getWorkers(self):
+        """
+        Returns the number of worker processes.
+        """
+
+        return self.__workers
+
+    def getChunkSize(self):
+        """
+        Returns the number of (wavelength, angle) pairs of every chunk.
+        """
+
+        return self.__chunkSize
+
+    def close(self):
+        """
+        Terminates the worker processes.
+        """
+
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+    def calculateF(self, z, wlengths, angles, index=0, output='field',
+                   directory=None):
+        """
+        Calculates F (or the emission factors) on a grid of depths,
+        wavelengths and angles. See Multilayer.calculateF.
+
+        The workers write their chunks in place into arrays mapped to
+        .npy files, so the results are not sent back through pipes and
+        are never copied. Without a directory the files are temporary:
+        they are removed as soon as the results are complete and live on
+        only as the memory maps returned (on systems where an open file
+        can be removed).
+
+        Parameters
+        ----------
+        z : numpy.ndarray
+            The z coordinates of the emitting dipoles (one-dimensional).
+        wlengths : numpy.ndarray
+            The wavelengths (one-dimensional).
+        angles : numpy.ndarray
+            The propagation angles in radians (one-dimensional).
+        index : int, optional
+            The index of the layer where the propagation angles are
+            given. By default the top medium (index = 0).
+        output : str, optional
+            'field' (default) or 'energy', as in Multilayer.calculateF.
+        directory : str, optional
+            An existing directory where the results are kept as .npy
+            files named after the keys (fx.npy, etc.), which can be
+            loaded later with numpy.load. By default the results are
+            not kept.
+
+        Returns
+        -------
+        out : dictionary
+            The same keys as Multilayer.calculateF. Each value is an
+            array with shape (number of depths, number of wavelengths,
+            number of angles): a memory map when the results are
+            written to files, i.e. with several workers or a directory.
+        """
+
+        if output not in ['field', 'energy']:
+            error = "Error: output must be 'field' or 'energy'"
+            print(error)
+            raise ValueError
+        if self.__pool is None and self.__workers > 1:
+            error = "Error: the executor has been closed"
+            print(error)
+            raise ValueError
+        grids = [np.atleast_1d(np.asarray(array, dtype=np.float64))
+                 for array in [z, wlengths, angles]]
+        if any(array.ndim != 1 for array in grids):
+            error = "Error: the depths, wavelengths and angles must be " + \
+                    "one-dimensional arrays"
+            print(error)
+            raise ValueError
+        z, wlengths, angles = grids
+
+        # Output buffers, in memory only if nobody else writes to them
+        shape = (z.size, wlengths.size, angles.size)
+        if output == 'field':
+            dtypes = {'fx': np.complex128, 'fy': np.complex128,
+                      'fz': np.complex128}
+        else:
+            dtypes = {'te': np.float64, 'tm': np.float64}
+        temporary = None
+        files = None
+        if directory is None and self.__pool is not None:
+            temporary = tempfile.mkdtemp(prefix='multilayers')
+            directory = temporary
+        if directory is None:
+            results = dict((key, np.empty(shape, dtype=dtype)) for
+                           (key, dtype) in dtypes.items())
+        else:
+            files = dict((key, os.path.join(directory, key + '.npy')) for
+                         key in dtypes)
+            results = dict((key, open_memmap(files[key], 'w+', dtype,
+                                             shape)) for
+                           (key, dtype) in dtypes.items())
+
+        pairs = np.array(np.meshgrid(wlengths, angles, indexing='ij'))
+        pairs = pairs.reshape(2, -1)
+        tasks = [(z, pairs[0, start:start + self.__chunkSize],
+                  pairs[1, start:start + self.__chunkSize], index, output,
+                  start, files)
+                 for start in range(0, pairs.shape[1], self.__chunkSize)]
+
+        try:
+            if self.__pool is None:
+                # Without the global of the workers, so that executors
+                # in several threads do not share their multilayers
+                for task in tasks:
+                    _store(_calculate(self.__multilayer, task), results,
+                           task[5])
+            else:
+                # The workers write to their own maps of the files
+                self.__pool.map(_evaluate, tasks)
+        finally:
+            if temporary is not None:
+                for fname in files.values():
+                    try:
+                        os.remove(fname)
+                    except OSError:
+                        pass
+                try:
+                    os.rmdir(temporary)
+                except OSError:
+                    pass
+
+        return results
+
+
+######################### Auxiliary functions #########################
+
+
+def _initialize(multilayer):
+    """
+    Keeps the multilayer of a worker process.
+    """
+
+    _worker['multilayer'] = multilayer
+
+
+def _calculate(multilayer, task):
+    """
+    Evaluates a chunk of the grid.
+    """
+
+    z, wlengths, angles, index, output = task[:5]
+    return multilayer.calculateF(
+            z[:, np.newaxis], wlengths, angles, index, output=output)
+
+
+def _evaluate(task):
+    """
+    Evaluates a chunk of the grid in a worker process and writes it to
+    the files of the results.
+    """
+
+    start, files = task[5:]
+    results = dict((key, open_memmap(fname, 'r+')) for
+                   (key, fname) in files.items())
+    _store(_calculate(_worker['multilayer'], task), results, start)
+    for value in results.values():
+        value.flush()
+
+
+def _store(chunk, results, start):
+    """
+    Copies a chunk of the (wavelength, angle) pairs into the results.
+    """
+
+    for (key, value) in chunk.items():
+        target = results[key].reshape(results[key].shape[0], -1)
+        target[:, start:start + value.shape[1]] = value
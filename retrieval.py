@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Name          : retrieval
+Author        : Joan Juvert <trust.no.one.51@gmail.com>
+Version       : 1.0
+Description   : Retrieval of the distribution of emitters along the z
+              : axis of a multilayer from angle-resolved spectra.
+
+Copyright 2012 Joan Juvert
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import distributions as ds
+import multilayers as ml
+import numpy as np
+from scipy.optimize import nnls
+
+
+############################ Class definitions ########################
+
+
+class ProfileRetrieval(object):
+    """
+    The ProfileRetrieval class finds the distribution of emitters along
+    the z axis of a multilayer that best explains a set of measured TE
+    and TM spectra at several angles.
+
+    The density of emitters is described as constant within each of a
+    set of depth bins. The spectra are then linear in the densities:
+
+        I_TE(lambda, theta) = s(lambda) * sum_k(K_TE(lambda, theta, k) *
+                                                rho_k)
+
+    and the same for TM, where s is the intrinsic spectrum and the
+    kernel K_TE is the integral of |Fy|^2 over the bin k (|Fx *
+    cos(theta)^2 + Fz * sin(theta)^2|^2 for TM), as in the example
+    radcenter_distribution.py. The kernel is calculated in closed form
+    with Multilayer.calculateDepthIntegrals, once for all the
+    wavelengths, angles and bins, and kept for the next measurements. It
+    is recalculated only if the thicknesses of the multilayer change.
+
+    The densities are the solution of the regularized non-negative least
+    squares problem
+
+        minimize |(K * rho - I) / sigma|^2 + alpha^2 * |L * rho|^2
+        subject to rho >= 0
+
+    where sigma are the uncertainties of the measurements and L is the
+    identity or the first or second order difference operator (which
+    favour small or smooth profiles).
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, multilayer, edges, wlengths, angles, index=0):
+        """
+        Initialize a ProfileRetrieval instance.
+
+        Parameters
+        ----------
+        multilayer : Multilayer
+            The multilayer system.
+        edges : numpy.ndarray
+            The edges of the depth bins (z coordinates), in increasing
+            order.
+        wlengths : numpy.ndarray
+            The wavelengths of the measured spectra.
+        angles : float or numpy.ndarray
+            The detection angles in radians.
+        index : int, optional
+            The index of the layer where the angles are given. By
+            default the top medium (index = 0).
+
+        Returns
+        -------
+        out : ProfileRetrieval
+            A ProfileRetrieval instance.
+        """
+
+        if not isinstance(multilayer, ml.Multilayer):
+            error = "ProfileRetrieval creation error: a Multilayer " + \
+                    "instance is expected"
+            print(error)
+            raise TypeError
+        edges = np.asarray(edges, dtype=np.float64)
+        if edges.ndim != 1 or edges.size < 2 or np.any(np.diff(edges) <= 0):
+            error = "ProfileRetrieval creation error: the edges of the " + \
+                    "bins must be increasing"
+            print(error)
+            raise ValueError
+
+        self.__multilayer = multilayer
+        self.__edges = edges
+        self.__wlengths = np.atleast_1d(np.asarray(wlengths,
+                                                   dtype=np.float64))
+        self.__angles = np.atleast_1d(np.asarray(angles, dtype=np.float64))
+        self.__index = index
+
+        # The kernel and the thicknesses of the multilayer for which it
+        # was calculated.
+        self.__kernel = None
+        self.__thicknesses = None
+
+    def getEdges(self):
+        """
+        Returns the edges of the depth bins.
+        """
+
+        return self.__edges
+
+    def getCenters(self):
+        """
+        Returns the centers of the depth bins.
+        """
+
+        return (self.__edges[1:] + self.__edges[:-1]) / 2
+
+    def getKernel(self):
+        """
+        Returns the kernel, calculating it if needed.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with keys {'te', 'tm'}. Each value is an array
+            with shape (number of wavelengths, number of angles, number
+            of bins).
+        """
+
+        multilayer = self.__multilayer
+        thicknesses = [multilayer.getThickness(index)
+                       for index in range(1, multilayer.numLayers() - 1)]
+        if self.__kernel is None or thicknesses != self.__thicknesses:
+            bins = [ds.UniformDistribution(lower, upper) for (lower, upper)
+                    in zip(self.__edges[:-1], self.__edges[1:])]
+            factors = multilayer.calculateDepthIntegrals(
+                    bins, self.__wlengths[:, np.newaxis], self.__angles,
+                    self.__index)
+            widths = np.diff(self.__edges)
+            self.__kernel = {'te': factors['te'] * widths,
+                             'tm': factors['tm'] * widths}
+            self.__thicknesses = thicknesses
+
+        return self.__kernel
+
+    def solveProfile(self, measurement, regularization=0.0, order=2,
+                     sigma=None, spectrum=None):
+        """
+        Finds the densities of emitters in the depth bins.
+
+        Parameters
+        ----------
+        measurement : dictionary
+            The measured spectra, with the keys 'te' and/or 'tm'. Each
+            value is an array with shape (number of wavelengths, number
+            of angles).
+        regularization : float, optional
+            The regularization parameter alpha. Default: 0.
+        order : int, optional
+            The order of the differences penalized by the
+            regularization: 0 (the densities themselves), 1 or 2.
+            Default: 2.
+        sigma : dictionary, optional
+            The uncertainties of the measurements, with the same keys
+            and shapes as measurement. By default all equal to 1.
+        spectrum : numpy.ndarray, optional
+            The intrinsic spectrum of the emitters at the wavelengths of
+            the measurement. By default 1, i.e. the measurements are the
+            modification factors of the spectrum.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with the keys:
+                - density: the density of emitters in every bin.
+                - fit: the spectra given by the densities, with the same
+                  keys as measurement.
+                - residual: the norm of the weighted residuals of the
+                  fit (without the regularization term).
+        """
+
+        keys = [key for key in ['te', 'tm'] if key in measurement]
+        if not keys:
+            error = "Error: the measurement must have TE and/or TM spectra"
+            print(error)
+            raise ValueError
+        if order not in [0, 1, 2]:
+            error = "Error: the order of the regularization must be 0, 1 " + \
+                    "or 2"
+            print(error)
+            raise ValueError
+        if regularization < 0:
+            error = "Error: the regularization parameter cannot be negative"
+            print(error)
+            raise ValueError
+
+        kernel = self.getKernel()
+        shape = kernel['te'].shape[:2]
+        if spectrum is None:
+            spectrum = 1.0
+        spectrum = np.broadcast_to(
+                np.asarray(spectrum, dtype=np.float64)[..., np.newaxis],
+                shape)[..., np.newaxis]
+
+        rows = []
+        values = []
+        for key in keys:
+            data = np.asarray(measurement[key], dtype=np.float64)
+            if data.shape != shape:
+                error = "Error: the measured spectra must have shape " + \
+                        "(number of wavelengths, number of angles)"
+                print(error)
+                raise ValueError
+            weight = 1.0 if sigma is None else \
+                    1 / np.asarray(sigma[key], dtype=np.float64)
+            weight = np.broadcast_to(weight, shape)
+            rows.append((kernel[key] * spectrum *
+                         weight[..., np.newaxis]).reshape(
+                                 -1, kernel[key].shape[-1]))
+            values.append((data * weight).ravel())
+        matrix = np.concatenate(rows)
+        values = np.concatenate(values)
+
+        bins = matrix.shape[1]
+        penalty = np.diff(np.eye(bins), order, axis=0) * regularization
+        density = nnls(np.concatenate((matrix, penalty)),
+                       np.concatenate((values, np.zeros(penalty.shape[0]))))[0]
+
+        fit = {}
+        for key in keys:
+            fit[key] = np.dot(kernel[key] * spectrum, density)
+
+        return {'density': density, 'fit': fit,
+                'residual': np.linalg.norm(np.dot(matrix, density) - values)}
@@ -0,0 +1,603 @@
+# -*- coding: utf-8 -*-
+"""
+Name          : server
+Author        : Joan Juvert <trust.no.one.51@gmail.com>
+Version       : 1.0
+Description   : Local simulation server that keeps the mediums, the stacks
+              : and the results loaded between requests.
+
+Copyright 2012 Joan Juvert
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A script that calculates a few spectra spends most of its time
+importing scipy and loading the tables of refractive indices. A
+SimulationServer does it once: it runs as a long-lived process that
+keeps the mediums loaded, the stacks built and the latest results, and
+answers the requests of any number of clients.
+
+The protocol is JSON over HTTP on the local host. Every request is a
+POST with a JSON object {"method": name, "params": {...}} and the
+answer is {"result": ...} or {"error": message}. The methods are:
+
+    loadMedium      {"name", "fname", "delimiter" (optional)}
+    getMediums      {}
+    calculateCoefficients, calculateF, calculateEmission
+                    {"stack", and the arguments of the functions of the
+                     same name of the functional module}
+
+The clients can only load the files of the medium directory given to
+the server, by their names relative to it, and none if it has no such
+directory. The server itself loads any file with loadMedium.
+
+A stack is a list of [name] or [name, thickness] lists, from the top
+medium to the bottom medium, with the names of loaded mediums. The
+arrays of the results are encoded as {"shape", "data"}, or {"shape",
+"real", "imag"} if they are complex, with the data flattened in C
+order. SimulationClient does the encoding and decoding:
+
+    server = SimulationServer(('127.0.0.1', 8151), workers=4,
+                              mediumDir='examples')
+    server.loadMedium('air', 'examples/air.dat')
+    ...
+    server.serveForever()
+
+    client = SimulationClient(('127.0.0.1', 8151))
+    client.call('loadMedium', name='sio2', fname='sio2.dat')
+    results = client.call('calculateF', stack=[['air'], ['sio2', 100],
+                          ['si']], z=z, wlengths=wlengths, angles=angles)
+
+The requests are served by a fixed pool of worker threads. The
+calculations use the functional module, so they do not share any state
+and run concurrently.
+"""
+
+import functional as fn
+import json
+import multilayers as ml
+import numpy as np
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+try:
+    import queue
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.request import Request, urlopen
+except ImportError:
+    import Queue as queue
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urllib2 import Request, urlopen
+
+
+# The _ThreadOutput installed as the standard output while the
+# requests are answered, and the number of its users. The lock
+# serializes the replacement and the restoration of the standard output.
+_output = {'stdout': None, 'users': 0}
+_outputLock = threading.Lock()
+
+# The functions of the calculation methods.
+_methods = {'calculateCoefficients': fn.calculateCoefficients,
+            'calculateF': fn.calculateF,
+            'calculateEmission': fn.calculateEmission}
+
+
+############################ Class definitions ########################
+
+
+class SimulationServer(object):
+    """
+    The SimulationServer class keeps mediums, stacks and results in
+    memory and serves calculations to local clients.
+
+    The stacks built from the requests and the results of the latest
+    requests (up to cacheSize of each) are kept and reused by identical
+    requests. Loading a medium again under the same name discards them.
+
+    The errors are answered with the message printed by the function
+    that failed, which is not printed by the server. To keep it, the
+    standard output is replaced while the server answers requests, and
+    restored when it stops.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, address=('127.0.0.1', 0), workers=4, cacheSize=128,
+                 mediumDir=None):
+        """
+        Initialize a SimulationServer instance. The server does not
+        answer requests until serveForever or start is called.
+
+        Parameters
+        ----------
+        address : tuple, optional
+            The (host, port) where the server listens. By default a free
+            port of the local host.
+        workers : int, optional
+            The number of worker threads. Default: 4.
+        cacheSize : int, optional
+            The number of stacks and of results kept. Default: 128.
+        mediumDir : str, optional
+            The directory of the files that the clients can load with
+            the loadMedium method, given by their names relative to it.
+            By default the clients cannot load mediums.
+
+        Returns
+        -------
+        out : SimulationServer
+            A SimulationServer instance.
+        """
+
+        if int(workers) != workers or workers < 1:
+            error = "SimulationServer creation error: workers must be a " + \
+                    "positive integer"
+            print(error)
+            raise ValueError
+        if int(cacheSize) != cacheSize or cacheSize < 0:
+            error = "SimulationServer creation error: cacheSize must be a " + \
+                    "non-negative integer"
+            print(error)
+            raise ValueError
+
+        if mediumDir is not None:
+            mediumDir = os.path.realpath(mediumDir)
+            if not os.path.isdir(mediumDir):
+                error = "SimulationServer creation error: %s is not a " + \
+                        "directory"
+                print(error % mediumDir)
+                raise ValueError
+
+        self.__mediumDir = mediumDir
+        self.__mediums = {}
+        self.__stacks = OrderedDict()
+        self.__results = OrderedDict()
+        self.__generation = 0
+        self.__cacheSize = int(cacheSize)
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__server = _PooledHTTPServer(address, _Handler, int(workers))
+        self.__server.simulation = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def getAddress(self):
+        """
+        Returns the (host, port) where the server listens.
+        """
+
+        return self.__server.server_address[:2]
+
+    def getWorkers(self):
+        """
+        Returns the number of worker threads.
+        """
+
+        return self.__server.getWorkers()
+
+    def getMediumDir(self):
+        """
+        Returns the directory of the mediums that the clients can load,
+        or None.
+        """
+
+        return self.__mediumDir
+
+    def getMediums(self):
+        """
+        Returns the names of the loaded mediums, sorted.
+        """
+
+        with self.__lock:
+            return sorted(self.__mediums.keys())
+
+    def loadMedium(self, name, fname, delimiter=None):
+        """
+        Loads a medium from a file of refractive indices (see Medium).
+
+        Parameters
+        ----------
+        name : str
+            The name of the medium in the stacks of the requests.
+        fname : str
+            The name of the file.
+        delimiter : str, optional
+            The column separator of the file. By default any whitespace.
+        """
+
+        medium = ml.Medium(fname, delimiter=delimiter)
+        with self.__lock:
+            if name in self.__mediums:
+                self.__stacks.clear()
+                self.__results.clear()
+            # The requests already running must not cache what they
+            # built with the old medium
+            self.__generation += 1
+            self.__mediums[name] = medium
+
+    def handleRequest(self, request):
+        """
+        Answers a request of the protocol.
+
+        Parameters
+        ----------
+        request : dictionary
+            The request, with the keys 'method' and 'params'.
+
+        Returns
+        -------
+        out : dictionary
+            The answer, with the key 'result' or 'error'.
+        """
+
+        method = None
+        output = _installOutput()
+        output.local.buffer = []
+        try:
+            method = request['method']
+            params = dict((str(key), value) for (key, value) in
+                          request.get('params', {}).items())
+            if method == 'loadMedium':
+                params['fname'] = self.__mediumFile(params.get('fname'))
+                self.loadMedium(**params)
+                return {'result': None}
+            if method == 'getMediums':
+                return {'result': self.getMediums()}
+            if method not in _methods:
+                return {'error': "unknown method %s" % method}
+
+            key = json.dumps([method, params], sort_keys=True)
+            with self.__lock:
+                if key in self.__results:
+                    self.__results[key] = self.__results.pop(key)
+                    return {'result': self.__results[key]}
+                generation = self.__generation
+            stack = self.__stack(params.pop('stack'), generation)
+            for (name, value) in params.items():
+                if isinstance(value, list):
+                    params[name] = np.array(value, dtype=np.float64)
+                elif not isinstance(value, (int, float)):
+                    params[name] = str(value)
+            result = _encode(_methods[method](stack, **params))
+        except Exception as exception:
+            printed = [line.strip() for line in
+                       "".join(output.local.buffer).splitlines()
+                       if line.strip()]
+            if printed:
+                return {'error': printed[-1]}
+            message = "%s in %s" % (type(exception).__name__, method)
+            if str(exception):
+                message += ": %s" % exception
+            return {'error': message}
+        finally:
+            output.local.buffer = None
+            _restoreOutput()
+
+        with self.__lock:
+            if generation == self.__generation:
+                self.__results[key] = result
+                while len(self.__results) > self.__cacheSize:
+                    self.__results.popitem(last=False)
+
+        return {'result': result}
+
+    def serveForever(self):
+        """
+        Answers the requests until close is called from another thread.
+        """
+
+        _installOutput()
+        try:
+            self.__server.serve_forever()
+        finally:
+            _restoreOutput()
+
+    def start(self):
+        """
+        Answers the requests in a background thread.
+        """
+
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.serveForever)
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def close(self):
+        """
+        Stops answering requests and releases the address.
+        """
+
+        if self.__thread is not None:
+            self.__server.shutdown()
+            self.__thread.join()
+            self.__thread = None
+        self.__server.server_close()
+
+    def __mediumFile(self, fname):
+        """
+        Returns the path of a file of the medium directory given by its
+        name relative to it. Files outside the directory are rejected.
+        """
+
+        if self.__mediumDir is None:
+            error = "Error: the server does not load mediums"
+            print(error)
+            raise ValueError
+        path = os.path.realpath(os.path.join(self.__mediumDir, fname))
+        if not path.startswith(os.path.join(self.__mediumDir, '')):
+            error = "Error: %s is not in the medium directory" % fname
+            print(error)
+            raise ValueError
+
+        return path
+
+    def __stack(self, description, generation):
+        """
+        Returns the stack of a list of [name] or [name, thickness]
+        lists, building it the first time. The stack is not kept if a
+        medium has been loaded since the given generation.
+        """
+
+        if not isinstance(description, list) or len(description) < 2 or \
+                any(not isinstance(layer, list) or len(layer) not in [1, 2]
+                    for layer in description):
+            error = "Error: a stack must be a list of [name] or " + \
+                    "[name, thickness] lists"
+            print(error)
+            raise ValueError
+        key = tuple(tuple(layer) for layer in description)
+        with self.__lock:
+            if key in self.__stacks:
+                self.__stacks[key] = self.__stacks.pop(key)
+                return self.__stacks[key]
+            unknown = [layer[0] for layer in description
+                       if layer[0] not in self.__mediums]
+            if unknown:
+                error = "Error: unknown medium %s" % unknown[0]
+                print(error)
+                raise ValueError
+            mediums = [self.__mediums[layer[0]] if len(layer) == 1 else
+                       [self.__mediums[layer[0]], float(layer[1])]
+                       for layer in description]
+        stack = fn.freezeStack(mediums)
+        with self.__lock:
+            if generation == self.__generation:
+                self.__stacks[key] = stack
+                while len(self.__stacks) > self.__cacheSize:
+                    self.__stacks.popitem(last=False)
+
+        return stack
+
+
+class SimulationClient(object):
+    """
+    The SimulationClient class sends requests to a SimulationServer.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, address, timeout=60.0):
+        """
+        Initialize a SimulationClient instance.
+
+        Parameters
+        ----------
+        address : tuple
+            The (host, port) of the server.
+        timeout : float, optional
+            The maximum time to wait for an answer in seconds. Default:
+            60.
+
+        Returns
+        -------
+        out : SimulationClient
+            A SimulationClient instance.
+        """
+
+        self.__url = "http://%s:%d/" % tuple(address)
+        self.__timeout = timeout
+
+    def call(self, method, **params):
+        """
+        Calls a method of the server.
+
+        Parameters
+        ----------
+        method : str
+            The name of the method.
+        **params
+            The parameters of the method. The arrays are sent as lists.
+
+        Returns
+        -------
+        out : object
+            The result, with the arrays decoded as numpy arrays.
+        """
+
+        params = dict((key, np.asarray(value).tolist() if
+                       isinstance(value, np.ndarray) else value) for
+                      (key, value) in params.items())
+        body = json.dumps({'method': method, 'params': params})
+        request = Request(self.__url, body.encode('utf-8'),
+                          {'Content-Type': 'application/json'})
+        fhandle = urlopen(request, timeout=self.__timeout)
+        answer = json.loads(fhandle.read().decode('utf-8'))
+        fhandle.close()
+        if 'error' in answer:
+            error = "Error: the server answered: %s" % answer['error']
+            print(error)
+            raise ValueError
+
+        return _decode(answer['result'])
+
+
+class _ThreadOutput(object):
+    """
+    Standard output that keeps what a thread prints while it answers a
+    request, and passes the rest through.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            self.stream.write(text)
+        else:
+            buffer.append(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class _PooledHTTPServer(HTTPServer):
+    """
+    HTTP server that answers the requests on a pool of worker threads.
+    """
+
+    def __init__(self, address, handler, workers):
+        HTTPServer.__init__(self, address, handler)
+        self.__requests = queue.Queue()
+        self.__threads = []
+        for k in range(workers):
+            thread = threading.Thread(target=self.__work)
+            thread.daemon = True
+            thread.start()
+            self.__threads.append(thread)
+
+    def getWorkers(self):
+        return len(self.__threads)
+
+    def process_request(self, request, client_address):
+        self.__requests.put((request, client_address))
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        for thread in self.__threads:
+            self.__requests.put(None)
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+
+    def __work(self):
+        while True:
+            item = self.__requests.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Handler of the requests of the protocol.
+    """
+
+    def do_POST(self):
+        try:
+            length = int(self.headers['Content-Length'])
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+        except (TypeError, ValueError):
+            answer = {'error': "malformed request"}
+        else:
+            answer = self.server.simulation.handleRequest(request)
+
+        body = json.dumps(answer).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+######################### Auxiliary functions #########################
+
+
+def _installOutput():
+    """
+    Installs a _ThreadOutput as the standard output, or reuses the one
+    already installed, and returns it. Every call must be paired with a
+    call to _restoreOutput.
+    """
+
+    with _outputLock:
+        if _output['users'] == 0:
+            _output['stdout'] = _ThreadOutput(sys.stdout)
+            sys.stdout = _output['stdout']
+        _output['users'] += 1
+
+        return _output['stdout']
+
+
+def _restoreOutput():
+    """
+    Restores the standard output replaced by _installOutput once its
+    last user is done.
+    """
+
+    with _outputLock:
+        _output['users'] -= 1
+        if _output['users'] == 0:
+            if sys.stdout is _output['stdout']:
+                sys.stdout = _output['stdout'].stream
+            _output['stdout'] = None
+
+
+def _encode(value):
+    """
+    Converts the arrays of a result to lists for JSON.
+    """
+
+    if isinstance(value, dict):
+        return dict((key, _encode(item)) for (key, item) in value.items())
+    value = np.asarray(value)
+    if np.iscomplexobj(value):
+        return {'shape': list(value.shape),
+                'real': value.real.ravel().tolist(),
+                'imag': value.imag.ravel().tolist()}
+
+    return {'shape': list(value.shape), 'data': value.ravel().tolist()}
+
+
+def _decode(value):
+    """
+    Converts the lists of an encoded result back to arrays.
+    """
+
+    if not isinstance(value, dict):
+        return value
+    if 'shape' not in value:
+        return dict((key, _decode(item)) for (key, item) in value.items())
+    if 'real' in value:
+        array = np.array(value['real']) + 1j * np.array(value['imag'])
+    else:
+        array = np.array(value['data'], dtype=np.float64)
+
+    return array.reshape(value['shape'])
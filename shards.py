@@ -0,0 +1,517 @@
+# -*- coding: utf-8 -*-
+"""
+Name          : shards
+Author        : Joan Juvert <trust.no.one.51@gmail.com>
+Version       : 1.0
+Description   : Sweeps of a multilayer partitioned into shards on a shared
+              : directory, calculated by any number of workers on any
+              : number of machines.
+
+Copyright 2012 Joan Juvert
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+A sweep directory holds the multilayer (pickled), the grid of depths,
+wavelengths and angles and one file per shard of the (wavelength, angle)
+pairs of the grid:
+
+    multilayer.pkl, manifest.json, grid.npz
+    pending/      the shards waiting for a worker
+    claimed/      the shards being calculated
+    results/      the results of the finished shards (.npz)
+
+The shards are numbered in the order of the grid.
+
+A worker claims a shard by moving its file from pending to claimed,
+which is atomic: when several workers try to claim the same shard only
+one of them succeeds and the rest try the next one. The results are
+written to a temporary file and renamed, so a result file is always
+complete. Any number of workers can run at the same time, on one
+machine or on several machines sharing the directory:
+
+    createSweep('sweep', multilayer, z, wlengths, angles)   # once
+    ShardedSweep('sweep').runWorker()                      # every worker
+    results = ShardedSweep('sweep').mergeResults()         # at the end
+
+The sweep directory is also a checkpoint of a long sweep run by a
+single process: resumeSweep creates the directory the first time and
+calculates only the shards without results when it is run again after
+an interruption. The directory records a fingerprint of the multilayer
+(see stackFingerprint) and the grid, so a directory left by a different
+multilayer or grid is rejected instead of being resumed.
+"""
+
+import hashlib
+import json
+import multilayers as ml
+import numpy as np
+import os
+import pickle
+import shutil
+import tempfile
+
+
+############################ Class definitions ########################
+
+
+class ShardedSweep(object):
+    """
+    The ShardedSweep class gives access to a sweep directory made by
+    createSweep: it calculates its shards as a worker, reports its
+    progress and merges the results.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, directory):
+        """
+        Initialize a ShardedSweep instance.
+
+        Parameters
+        ----------
+        directory : str
+            The sweep directory.
+
+        Returns
+        -------
+        out : ShardedSweep
+            A ShardedSweep instance.
+        """
+
+        fname = os.path.join(directory, 'grid.npz')
+        if not os.path.isfile(fname):
+            error = "ShardedSweep creation error: %s is not a sweep " \
+                    "directory" % directory
+            print(error)
+            raise ValueError
+
+        data = np.load(fname)
+        self.__directory = directory
+        self.__z = data['z']
+        self.__wlengths = data['wlengths']
+        self.__angles = data['angles']
+        self.__index = int(data['index'])
+        self.__output = str(data['output'])
+        self.__shards = [tuple(shard) for shard in data['shards']]
+        self.__fingerprint = str(data['fingerprint'])
+        data.close()
+
+    def getDirectory(self):
+        """
+        Returns the sweep directory.
+        """
+
+        return self.__directory
+
+    def getGrid(self):
+        """
+        Returns the depths, wavelengths and angles of the grid as a
+        tuple.
+        """
+
+        return (self.__z, self.__wlengths, self.__angles)
+
+    def getIndex(self):
+        """
+        Returns the index of the layer where the angles are given.
+        """
+
+        return self.__index
+
+    def getOutput(self):
+        """
+        Returns the output of the sweep, 'field' or 'energy'.
+        """
+
+        return self.__output
+
+    def getFingerprint(self):
+        """
+        Returns the fingerprint of the multilayer of the sweep.
+        """
+
+        return self.__fingerprint
+
+    def getNumShards(self):
+        """
+        Returns the number of shards.
+        """
+
+        return len(self.__shards)
+
+    def getStatus(self):
+        """
+        Returns the number of pending, claimed and finished shards.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with keys {'pending', 'claimed', 'finished'}.
+        """
+
+        return {'pending': len(self.__listShards('pending')),
+                'claimed': len(self.__listShards('claimed')),
+                'finished': len(self.__listShards('results'))}
+
+    def runWorker(self, maxShards=None):
+        """
+        Claims and calculates pending shards until there are none left.
+
+        Parameters
+        ----------
+        maxShards : int, optional
+            The maximum number of shards to calculate. By default there
+            is no limit.
+
+        Returns
+        -------
+        out : int
+            The number of shards calculated.
+        """
+
+        fhandle = open(os.path.join(self.__directory, 'multilayer.pkl'),
+                       'rb')
+        multilayer = pickle.load(fhandle)
+        fhandle.close()
+
+        count = 0
+        while maxShards is None or count < maxShards:
+            shard = self.__claimShard()
+            if shard is None:
+                break
+            start, stop = self.__shards[shard]
+            pairs = self.__pairs(start, stop)
+            results = multilayer.calculateF(
+                    self.__z[:, np.newaxis], pairs[0], pairs[1],
+                    self.__index, output=self.__output)
+
+            # Written under a temporary name, so that it is never seen
+            # half written
+            fname = self.__shardName('results', shard)
+            temporary = "%s.%d.tmp" % (fname, os.getpid())
+            fhandle = open(temporary, 'wb')
+            np.savez(fhandle, **results)
+            fhandle.close()
+            os.rename(temporary, fname)
+            os.remove(self.__shardName('claimed', shard))
+            count += 1
+
+        return count
+
+    def requeueShards(self):
+        """
+        Returns the claimed shards without results to the pending ones,
+        for instance after a worker has been killed. No worker must be
+        running.
+
+        Returns
+        -------
+        out : int
+            The number of shards returned.
+        """
+
+        finished = set(self.__listShards('results'))
+        count = 0
+        for shard in self.__listShards('claimed'):
+            if shard not in finished:
+                os.rename(self.__shardName('claimed', shard),
+                          self.__shardName('pending', shard))
+                count += 1
+
+        return count
+
+    def mergeResults(self):
+        """
+        Assembles the results of all the shards.
+
+        Returns
+        -------
+        out : dictionary
+            The same keys as Multilayer.calculateF. Each value is an
+            array with shape (number of depths, number of wavelengths,
+            number of angles).
+        """
+
+        finished = set(self.__listShards('results'))
+        if len(finished) < len(self.__shards):
+            error = "Error: %d of %d shards are not finished" % \
+                    (len(self.__shards) - len(finished), len(self.__shards))
+            print(error)
+            raise ValueError
+
+        shape = (self.__z.size, self.__wlengths.size * self.__angles.size)
+        results = {}
+        for (shard, (start, stop)) in enumerate(self.__shards):
+            data = np.load(self.__shardName('results', shard))
+            for key in data.files:
+                if key not in results:
+                    results[key] = np.empty(shape, dtype=data[key].dtype)
+                results[key][:, start:stop] = data[key]
+            data.close()
+
+        return dict((key, value.reshape(self.__z.size, self.__wlengths.size,
+                                        self.__angles.size))
+                    for (key, value) in results.items())
+
+    def __claimShard(self):
+        """
+        Claims a pending shard and returns its number, or None if there
+        are none left.
+        """
+
+        for shard in self.__listShards('pending'):
+            try:
+                os.rename(self.__shardName('pending', shard),
+                          self.__shardName('claimed', shard))
+            except OSError:
+                # Claimed by another worker
+                continue
+            return shard
+
+        return None
+
+    def __listShards(self, state):
+        """
+        Returns the numbers of the shards in a subdirectory, sorted.
+        """
+
+        names = os.listdir(os.path.join(self.__directory, state))
+        return sorted(int(name.split('.')[0]) for name in names
+                      if name.endswith('.shard') or name.endswith('.npz'))
+
+    def __shardName(self, state, shard):
+        """
+        Returns the name of the file of a shard in a subdirectory.
+        """
+
+        extension = 'npz' if state == 'results' else 'shard'
+        return os.path.join(self.__directory, state,
+                            "%06d.%s" % (shard, extension))
+
+    def __pairs(self, start, stop):
+        """
+        Returns the wavelengths and angles of a range of (wavelength,
+        angle) pairs of the grid, in the order of the grid.
+        """
+
+        pairs = np.arange(start, stop)
+        return (self.__wlengths[pairs // self.__angles.size],
+                self.__angles[pairs % self.__angles.size])
+
+
+######################### Auxiliary functions #########################
+
+
+def createSweep(directory, multilayer, z, wlengths, angles, index=0,
+                output='field', shardSize=256):
+    """
+    Creates a sweep directory with all its shards pending.
+
+    Parameters
+    ----------
+    directory : str
+        The sweep directory. It is created if it does not exist, and it
+        must be empty otherwise. It is built under a temporary name in
+        the same parent directory and renamed when it is complete.
+    multilayer : Multilayer
+        The multilayer system.
+    z : numpy.ndarray
+        The z coordinates of the emitting dipoles (one-dimensional).
+    wlengths : numpy.ndarray
+        The wavelengths (one-dimensional).
+    angles : numpy.ndarray
+        The propagation angles in radians (one-dimensional).
+    index : int, optional
+        The index of the layer where the propagation angles are given.
+        By default the top medium (index = 0).
+    output : str, optional
+        'field' (default) or 'energy', as in Multilayer.calculateF.
+    shardSize : int, optional
+        The number of (wavelength, angle) pairs of every shard. Default:
+        256.
+
+    Returns
+    -------
+    out : ShardedSweep
+        The sweep.
+    """
+
+    if not isinstance(multilayer, ml.Multilayer):
+        error = "Error: a Multilayer instance is expected"
+        print(error)
+        raise TypeError
+    if output not in ['field', 'energy']:
+        error = "Error: output must be 'field' or 'energy'"
+        print(error)
+        raise ValueError
+    if int(shardSize) != shardSize or shardSize < 1:
+        error = "Error: shardSize must be a positive integer"
+        print(error)
+        raise ValueError
+    grids = [np.atleast_1d(np.asarray(array, dtype=np.float64))
+             for array in [z, wlengths, angles]]
+    if any(array.ndim != 1 for array in grids):
+        error = "Error: the depths, wavelengths and angles must be " + \
+                "one-dimensional arrays"
+        print(error)
+        raise ValueError
+    z, wlengths, angles = grids
+    if os.path.isdir(directory) and os.listdir(directory):
+        error = "Error: the directory %s is not empty" % directory
+        print(error)
+        raise ValueError
+
+    numPairs = wlengths.size * angles.size
+    starts = np.arange(0, numPairs, int(shardSize))
+    shards = np.column_stack((starts, np.minimum(starts + int(shardSize),
+                                                 numPairs)))
+
+    # Built under a temporary name next to the directory and renamed at
+    # the end, so that an interruption never leaves a half-built sweep
+    # directory
+    parent, name = os.path.split(os.path.abspath(directory))
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    temporary = tempfile.mkdtemp(prefix='.%s.' % name, dir=parent)
+    try:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temporary, 0o777 & ~umask)
+        fingerprint = stackFingerprint(multilayer)
+        fhandle = open(os.path.join(temporary, 'multilayer.pkl'), 'wb')
+        pickle.dump(multilayer, fhandle, 2)
+        fhandle.close()
+        manifest = {'fingerprint': fingerprint,
+                    'thicknesses': [multilayer.getThickness(layer) for layer in
+                                    range(1, multilayer.numLayers() - 1)],
+                    'shape': [z.size, wlengths.size, angles.size],
+                    'index': index, 'output': output,
+                    'shardSize': int(shardSize), 'numShards': len(shards)}
+        fhandle = open(os.path.join(temporary, 'manifest.json'), 'w')
+        json.dump(manifest, fhandle, indent=4, separators=(',', ': '),
+                  sort_keys=True)
+        fhandle.close()
+        for state in ['claimed', 'results', 'pending']:
+            os.mkdir(os.path.join(temporary, state))
+        for shard in range(len(shards)):
+            open(os.path.join(temporary, 'pending', "%06d.shard" % shard),
+                 'w').close()
+        np.savez(os.path.join(temporary, 'grid.npz'), z=z, wlengths=wlengths,
+                 angles=angles, index=index, output=output, shards=shards,
+                 fingerprint=fingerprint)
+
+        # An empty directory is removed first, because os.rename only
+        # replaces it on POSIX systems
+        if os.path.isdir(directory):
+            os.rmdir(directory)
+        os.rename(temporary, directory)
+    except BaseException:
+        shutil.rmtree(temporary, ignore_errors=True)
+        raise
+
+    return ShardedSweep(directory)
+
+
+def resumeSweep(directory, multilayer, z, wlengths, angles, index=0,
+                output='field', shardSize=256):
+    """
+    Calculates a sweep keeping a checkpoint in a sweep directory. The
+    directory is created by the first call; the following calls with the
+    same multilayer and grid only calculate the shards without results
+    (including those left claimed by an interrupted run).
+
+    Parameters
+    ----------
+    directory : str
+        The sweep directory. It must not exist or be empty the first
+        time.
+    multilayer : Multilayer
+        The multilayer system.
+    z : numpy.ndarray
+        The z coordinates of the emitting dipoles (one-dimensional).
+    wlengths : numpy.ndarray
+        The wavelengths (one-dimensional).
+    angles : numpy.ndarray
+        The propagation angles in radians (one-dimensional).
+    index : int, optional
+        The index of the layer where the propagation angles are given.
+        By default the top medium (index = 0).
+    output : str, optional
+        'field' (default) or 'energy', as in Multilayer.calculateF.
+    shardSize : int, optional
+        The number of (wavelength, angle) pairs of every shard, used
+        only when the directory is created. Default: 256.
+
+    Returns
+    -------
+    out : dictionary
+        The same keys as Multilayer.calculateF. Each value is an array
+        with shape (number of depths, number of wavelengths, number of
+        angles).
+    """
+
+    if not os.path.isfile(os.path.join(directory, 'grid.npz')):
+        sweep = createSweep(directory, multilayer, z, wlengths, angles,
+                            index, output, shardSize)
+    else:
+        sweep = ShardedSweep(directory)
+        if sweep.getFingerprint() != stackFingerprint(multilayer):
+            error = "Error: the checkpoint in %s belongs to a different " \
+                    "multilayer" % directory
+            print(error)
+            raise ValueError
+        grids = [np.atleast_1d(np.asarray(array, dtype=np.float64))
+                 for array in [z, wlengths, angles]]
+        if any(grid.shape != saved.shape or np.any(grid != saved)
+               for (grid, saved) in zip(grids, sweep.getGrid())) or \
+                index != sweep.getIndex() or output != sweep.getOutput():
+            error = "Error: the checkpoint in %s belongs to a different " \
+                    "grid" % directory
+            print(error)
+            raise ValueError
+        sweep.requeueShards()
+
+    sweep.runWorker()
+
+    return sweep.mergeResults()
+
+
+def stackFingerprint(multilayer):
+    """
+    Returns a fingerprint of a multilayer: the SHA-1 hash of the tables
+    of refractive indices of its mediums and its thicknesses, as a
+    hexadecimal string. Two multilayers have the same fingerprint if
+    they give the same results.
+
+    Parameters
+    ----------
+    multilayer : Multilayer
+        The multilayer system.
+
+    Returns
+    -------
+    out : str
+        The fingerprint.
+    """
+
+    digest = hashlib.sha1()
+    for layer in range(multilayer.numLayers()):
+        table = multilayer.getMedium(layer).getTable()
+        for key in ['wavelengths', 'refrIndex', 'extCoef']:
+            digest.update(np.ascontiguousarray(table[key],
+                                               dtype=np.float64).tobytes())
+        digest.update(repr(float(multilayer.getThickness(layer))).encode())
+
+    return digest.hexdigest()
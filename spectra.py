@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+"""
+Name          : spectra
+Author        : Joan Juvert <trust.no.one.51@gmail.com>
+Version       : 1.0
+Description   : Observed TE and TM emission spectra of a distribution of
+              : emitters within a multilayer, and recovery of the
+              : intrinsic spectrum from the observed ones.
+
+Copyright 2012 Joan Juvert
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import distributions as ds
+import multilayers as ml
+import numpy as np
+
+
+############################ Class definitions ########################
+
+
+class SpectralPipeline(object):
+    """
+    The SpectralPipeline class calculates the spectra observed at a set
+    of detector angles from the intrinsic spectrum of the emitters and
+    their distribution along the z axis of a multilayer:
+
+        I_TE(lambda, theta) = s(lambda) * <|Fy|^2>
+        I_TM(lambda, theta) = s(lambda) * <|Fx * cos(theta)^2 +
+                                            Fz * sin(theta)^2|^2>
+
+    where s is the intrinsic spectrum and <> denotes the average over the
+    distribution of emitters (see Multilayer.calculateDepthIntegral).
+    This is the calculation of the example radcenter_distribution.py
+    for any number of angles.
+
+    The wavelengths are processed in chunks of fixed size, so the
+    memory used does not grow with the number of wavelengths (except
+    for the results themselves if they are collected). For every chunk
+    the refractive indices and the field amplitudes of all the angles
+    are calculated at once and shared by all the depths, whose
+    contribution is integrated in closed form.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, multilayer, distribution, angles, spectrum=None,
+                 chunkSize=256, index=0):
+        """
+        Initialize a SpectralPipeline instance.
+
+        Parameters
+        ----------
+        multilayer : Multilayer
+            The multilayer system.
+        distribution : Distribution
+            The distribution of emitters along the z axis (see the
+            distributions module).
+        angles : float or numpy.ndarray
+            The detector angles in radians.
+        spectrum : callable or numpy.ndarray, optional
+            The intrinsic spectrum of the emitters: a function s(lambda)
+            accepting numpy arrays, or a table with the wavelengths in
+            the first column and the intensities in the second, which is
+            interpolated linearly (and is zero outside it). By default
+            s = 1 and the results are the modification factors of the
+            spectrum.
+        chunkSize : int, optional
+            The number of wavelengths processed at once. Default: 256.
+        index : int, optional
+            The index of the layer where the angles are given. By
+            default the top medium (index = 0).
+
+        Returns
+        -------
+        out : SpectralPipeline
+            A SpectralPipeline instance.
+        """
+
+        if not isinstance(multilayer, ml.Multilayer):
+            error = "SpectralPipeline creation error: a Multilayer " + \
+                    "instance is expected"
+            print(error)
+            raise TypeError
+        if not isinstance(distribution, ds.Distribution):
+            error = "SpectralPipeline creation error: a Distribution " + \
+                    "instance is expected"
+            print(error)
+            raise TypeError
+        if int(chunkSize) != chunkSize or chunkSize < 1:
+            error = "SpectralPipeline creation error: chunkSize must be " + \
+                    "a positive integer"
+            print(error)
+            raise ValueError
+
+        self.__multilayer = multilayer
+        self.__distribution = distribution
+        self.__angles = np.atleast_1d(np.asarray(angles, dtype=np.float64))
+        self.__spectrum = _spectrum(spectrum)
+        self.__chunkSize = int(chunkSize)
+        self.__index = index
+
+    def getAngles(self):
+        """
+        Returns the detector angles in radians.
+        """
+
+        return self.__angles
+
+    def getChunkSize(self):
+        """
+        Returns the number of wavelengths processed at once.
+        """
+
+        return self.__chunkSize
+
+    def iterateSpectra(self, wlengths):
+        """
+        Calculates the observed spectra chunk by chunk.
+
+        Parameters
+        ----------
+        wlengths : numpy.ndarray
+            The wavelengths of the spectra (one-dimensional).
+
+        Returns
+        -------
+        out : generator
+            A generator of dictionaries, one per chunk of wavelengths,
+            with the keys:
+                - wlength: the wavelengths of the chunk.
+                - te, tm: the observed spectra, with shape (number of
+                  wavelengths in the chunk, number of angles).
+        """
+
+        wlengths = np.atleast_1d(np.asarray(wlengths, dtype=np.float64))
+        if wlengths.ndim != 1:
+            error = "Error: the wavelengths must be a one-dimensional array"
+            print(error)
+            raise ValueError
+
+        for start in range(0, wlengths.size, self.__chunkSize):
+            chunk = wlengths[start:start + self.__chunkSize]
+            factors = self.__multilayer.calculateDepthIntegral(
+                    self.__distribution, chunk[:, np.newaxis], self.__angles,
+                    self.__index)
+            intensity = self.__spectrum(chunk)[:, np.newaxis]
+            yield {'wlength': chunk, 'te': intensity * factors['te'],
+                   'tm': intensity * factors['tm']}
+
+    def calculateSpectra(self, wlengths):
+        """
+        Calculates the observed spectra.
+
+        Parameters
+        ----------
+        wlengths : numpy.ndarray
+            The wavelengths of the spectra (one-dimensional).
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with keys {'te', 'tm'}. Each value is an array
+            with shape (number of wavelengths, number of angles).
+        """
+
+        wlengths = np.atleast_1d(np.asarray(wlengths, dtype=np.float64))
+        results = {'te': np.empty((wlengths.size, self.__angles.size)),
+                   'tm': np.empty((wlengths.size, self.__angles.size))}
+        start = 0
+        for chunk in self.iterateSpectra(wlengths):
+            stop = start + chunk['wlength'].size
+            results['te'][start:stop] = chunk['te']
+            results['tm'][start:stop] = chunk['tm']
+            start = stop
+
+        return results
+
+    def writeSpectra(self, fname, wlengths, fmt='%.6e', delimiter='\t'):
+        """
+        Writes the observed spectra to a text file as they are
+        calculated, without keeping them in memory.
+
+        The first column holds the wavelengths, followed by the TE and
+        then the TM spectra of every angle. The header lists the angles
+        in the same format as bphysics.wdfile.
+
+        Parameters
+        ----------
+        fname : str
+            The name of the file.
+        wlengths : numpy.ndarray
+            The wavelengths of the spectra (one-dimensional).
+        fmt : str, optional
+            The format of the numbers. Default: '%.6e'.
+        delimiter : str, optional
+            The column separator. Default: tab.
+        """
+
+        angles = ["%.6g" % angle for angle in self.__angles]
+        comments = "# Observed TE and TM spectra of a distribution of\n" + \
+                "# emitters. Angles (rad): " + " ".join(angles) + "\n" + \
+                "# wlength" + delimiter + \
+                delimiter.join(["TE(%s)" % angle for angle in angles] +
+                               ["TM(%s)" % angle for angle in angles])
+
+        fhandle = open(fname, "w")
+        fhandle.write("".join([comments, '\n']))
+        for chunk in self.iterateSpectra(wlengths):
+            np.savetxt(fhandle, np.column_stack((chunk['wlength'],
+                                                 chunk['te'], chunk['tm'])),
+                       fmt, delimiter)
+        fhandle.close()
+
+
+class SpectralUnfolding(object):
+    """
+    The SpectralUnfolding class recovers the intrinsic spectrum of the
+    emitters from the spectra measured at a set of detector angles. It
+    is the inverse of SpectralPipeline: the measured spectra are
+
+        I_TE(lambda, theta) = s(lambda) * K_TE(lambda, theta)
+
+    and the same for TM, where K are the emission factors averaged over
+    the distribution of emitters. At every wavelength, s is the
+    regularized least squares solution over all the angles and
+    polarizations,
+
+        s(lambda) = sum(K * I / sigma^2) / (sum(K^2 / sigma^2) + alpha^2)
+
+    where sigma are the uncertainties of the measurements. The
+    regularization parameter alpha keeps s bounded at the wavelengths
+    where the emission factors vanish (where the measurement carries no
+    information about s), and has no effect where they are large.
+
+    The emission factors are calculated once with
+    Multilayer.calculateDepthIntegral and kept for the next spectra.
+    They are recalculated only if the thicknesses of the multilayer
+    change. Many spectra measured on the same multilayer are unfolded
+    at once.
+
+    All the attributes are private and accessed through the provided
+    methods.
+    """
+
+    def __init__(self, multilayer, distribution, wlengths, angles, index=0):
+        """
+        Initialize a SpectralUnfolding instance.
+
+        Parameters
+        ----------
+        multilayer : Multilayer
+            The multilayer system.
+        distribution : Distribution
+            The distribution of emitters along the z axis (see the
+            distributions module).
+        wlengths : numpy.ndarray
+            The wavelengths of the measured spectra (one-dimensional).
+        angles : float or numpy.ndarray
+            The detector angles in radians.
+        index : int, optional
+            The index of the layer where the angles are given. By
+            default the top medium (index = 0).
+
+        Returns
+        -------
+        out : SpectralUnfolding
+            A SpectralUnfolding instance.
+        """
+
+        if not isinstance(multilayer, ml.Multilayer):
+            error = "SpectralUnfolding creation error: a Multilayer " + \
+                    "instance is expected"
+            print(error)
+            raise TypeError
+        if not isinstance(distribution, ds.Distribution):
+            error = "SpectralUnfolding creation error: a Distribution " + \
+                    "instance is expected"
+            print(error)
+            raise TypeError
+        wlengths = np.atleast_1d(np.asarray(wlengths, dtype=np.float64))
+        if wlengths.ndim != 1:
+            error = "SpectralUnfolding creation error: the wavelengths " + \
+                    "must be a one-dimensional array"
+            print(error)
+            raise ValueError
+
+        self.__multilayer = multilayer
+        self.__distribution = distribution
+        self.__wlengths = wlengths
+        self.__angles = np.atleast_1d(np.asarray(angles, dtype=np.float64))
+        self.__index = index
+
+        # The kernel and the thicknesses of the multilayer for which it
+        # was calculated.
+        self.__kernel = None
+        self.__thicknesses = None
+
+    def getAngles(self):
+        """
+        Returns the detector angles in radians.
+        """
+
+        return self.__angles
+
+    def getWavelengths(self):
+        """
+        Returns the wavelengths of the measured spectra.
+        """
+
+        return self.__wlengths
+
+    def getKernel(self):
+        """
+        Returns the emission factors averaged over the distribution of
+        emitters, calculating them if needed.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with keys {'te', 'tm'}. Each value is an array
+            with shape (number of wavelengths, number of angles).
+        """
+
+        multilayer = self.__multilayer
+        thicknesses = [multilayer.getThickness(index)
+                       for index in range(1, multilayer.numLayers() - 1)]
+        if self.__kernel is None or thicknesses != self.__thicknesses:
+            self.__kernel = multilayer.calculateDepthIntegral(
+                    self.__distribution, self.__wlengths[:, np.newaxis],
+                    self.__angles, self.__index)
+            self.__thicknesses = thicknesses
+
+        return self.__kernel
+
+    def unfoldSpectra(self, measurement, regularization=0.0, sigma=None):
+        """
+        Recovers the intrinsic spectra from the measured spectra.
+
+        Parameters
+        ----------
+        measurement : dictionary
+            The measured spectra, with the keys 'te' and/or 'tm'. Each
+            value is an array with shape (number of wavelengths, number
+            of angles), or (number of spectra, number of wavelengths,
+            number of angles) for many spectra at once.
+        regularization : float, optional
+            The regularization parameter alpha, in the units of the
+            emission factors divided by sigma. Default: 0.
+        sigma : dictionary, optional
+            The uncertainties of the measurements, with the same keys as
+            measurement and shapes that broadcast against them. By
+            default all equal to 1.
+
+        Returns
+        -------
+        out : dictionary
+            A dictionary with the keys:
+                - spectrum: the intrinsic spectra, with shape (number of
+                  wavelengths,) or (number of spectra, number of
+                  wavelengths).
+                - fit: the spectra given by the intrinsic spectra, with
+                  the same keys and shapes as measurement.
+        """
+
+        keys = [key for key in ['te', 'tm'] if key in measurement]
+        if not keys:
+            error = "Error: the measurement must have TE and/or TM spectra"
+            print(error)
+            raise ValueError
+        if regularization < 0:
+            error = "Error: the regularization parameter cannot be negative"
+            print(error)
+            raise ValueError
+
+        kernel = self.getKernel()
+        shape = kernel['te'].shape
+        numerator = 0.0
+        denominator = regularization ** 2
+        for key in keys:
+            data = np.asarray(measurement[key], dtype=np.float64)
+            if data.shape[-2:] != shape or data.ndim > 3:
+                error = "Error: the measured spectra must have shape " + \
+                        "([number of spectra,] number of wavelengths, " + \
+                        "number of angles)"
+                print(error)
+                raise ValueError
+            weight = 1.0 if sigma is None else \
+                1 / np.asarray(sigma[key], dtype=np.float64) ** 2
+            numerator = numerator + np.sum(kernel[key] * data * weight,
+                                           axis=-1)
+            denominator = denominator + np.sum(
+                    kernel[key] ** 2 * np.broadcast_to(weight, data.shape),
+                    axis=-1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            spectrum = np.where(denominator > 0, numerator / denominator, 0)
+
+        fit = {}
+        for key in keys:
+            fit[key] = spectrum[..., np.newaxis] * kernel[key]
+
+        return {'spectrum': spectrum, 'fit': fit}
+
+
+######################### Auxiliary functions #########################
+
+
+def _spectrum(spectrum):
+    """
+    Returns the intrinsic spectrum as a function of the wavelength.
+    """
+
+    if spectrum is None:
+        return lambda wlengths: np.ones(np.shape(wlengths))
+    if callable(spectrum):
+        return lambda wlengths: np.asarray(spectrum(wlengths),
+                                           dtype=np.float64)
+
+    table = np.asarray(spectrum, dtype=np.float64)
+    if table.ndim != 2 or table.shape[1] < 2 or table.shape[0] < 2:
+        error = "Error: the spectrum must be a function or a table with " + \
+                "the wavelengths and intensities in the first two columns"
+        print(error)
+        raise ValueError
+    order = np.argsort(table[:, 0])
+    wlist = table[order, 0]
+    values = table[order, 1]
+
+    return lambda wlengths: np.interp(wlengths, wlist, values, 0, 0)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import multilayers as ml
+import tempfile
+from os.path import join
+
+
+def writeMedium(fname, n, k):
+    """
+    Writes a medium with a constant refractive index and extinction
+    coefficient.
+
+    Parameters
+    ----------
+    fname : str
+        Name of the file.
+    n : float
+        Refractive index.
+    k : float
+        Extinction coefficient.
+    """
+
+    fhandle = open(fname, "w")
+    fhandle.write("#Test medium\n#wl\tn\tk\n")
+    for wlength in [300, 350, 400, 500, 600, 700, 800]:
+        fhandle.write("%d;%f;%f\n" % (wlength, n, k))
+    fhandle.close()
+
+
+def writeMediums(mediums):
+    """
+    Writes media with constant refractive indices and extinction
+    coefficients to a new temporary directory, which the caller removes.
+
+    Parameters
+    ----------
+    mediums : list
+        A (name, n, k) tuple for each medium, which is written to the
+        file name.txt.
+
+    Returns
+    -------
+    directory : str
+        The temporary directory.
+    """
+
+    directory = tempfile.mkdtemp(prefix='ml_')
+    for (name, n, k) in mediums:
+        writeMedium(join(directory, name + ".txt"), n, k)
+
+    return directory
+
+
+def loadMedium(directory, name):
+    """
+    Loads a medium written by writeMediums.
+
+    Parameters
+    ----------
+    directory : str
+        The directory returned by writeMediums.
+    name : str
+        Name of the medium.
+
+    Returns
+    -------
+    medium : Medium
+    """
+
+    return ml.Medium(join(directory, name + ".txt"), delimiter=';')
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import helpers
+import colour as co
+import multilayers as ml
+import numpy as np
+import shutil
+
+
+class TestColorimeter(unittest.TestCase):
+    """
+    Test the Colorimeter class.
+    """
+
+    def setUp(self):
+        """
+        Prepare the ground with common data for the tests that follow.
+        """
+
+        self.mediumDir = helpers.writeMediums([('ambient', 1.0, 0.0),
+                                               ('oxide', 1.46, 0.0),
+                                               ('silicon', 4.0, 0.05)])
+
+        self.ambient = helpers.loadMedium(self.mediumDir, 'ambient')
+        self.oxide = helpers.loadMedium(self.mediumDir, 'oxide')
+        self.silicon = helpers.loadMedium(self.mediumDir, 'silicon')
+        self.system = ml.Multilayer([
+                self.ambient,
+                [self.oxide, 300],
+                self.silicon])
+
+    def tearDown(self):
+        """
+        Clean up.
+        """
+
+        shutil.rmtree(self.mediumDir)
+
+    def test_init(self):
+        """
+        Test the initialization and the white points of the standard
+        illuminants.
+        """
+
+        self.assertRaises(ValueError, co.Colorimeter, [500, 400])
+        self.assertRaises(ValueError, co.Colorimeter, [900, 1000])
+        self.assertRaises(ValueError, co.Colorimeter, None, 'hola')
+        self.assertRaises(ValueError, co.Colorimeter, [400, 500], [1])
+
+        # Tabulated chromaticities of the illuminants
+        for (illuminant, x, y) in [('d65', 0.3127, 0.3290),
+                                   ('A', 0.4476, 0.4074)]:
+            colorimeter = co.Colorimeter(illuminant=illuminant)
+            xyy = co.xyzToxyY(colorimeter.getWhitePoint())
+            self.assertAlmostEqual(xyy[0], x, 3)
+            self.assertAlmostEqual(xyy[1], y, 3)
+            self.assertAlmostEqual(xyy[2], 100, 12)
+
+    def test_conversions(self):
+        """
+        Test the colour coordinates of simple spectra.
+        """
+
+        colorimeter = co.Colorimeter()
+        wlengths = colorimeter.getWlengths()
+        spectra = np.array([np.ones(wlengths.size), np.zeros(wlengths.size),
+                            0.5 * np.ones(wlengths.size)])
+        lab = colorimeter.calculateLab(spectra)
+        np.testing.assert_array_almost_equal(lab[0], [100, 0, 0], 10)
+        np.testing.assert_array_almost_equal(lab[1], [0, 0, 0], 10)
+        self.assertAlmostEqual(lab[2, 0], 116 * 0.5 ** (1 / 3.0) - 16, 10)
+        xyy = colorimeter.calculatexyY(spectra)
+        np.testing.assert_array_almost_equal(xyy[1], [1 / 3.0, 1 / 3.0, 0])
+        self.assertRaises(ValueError, colorimeter.calculateXYZ, [1, 2])
+
+    def test_calculateColour(self):
+        """
+        Test the colour of a multilayer against the spectra obtained
+        from calculateCoefficients, for several angles and thickness
+        variants at once.
+        """
+
+        colorimeter = co.Colorimeter(np.arange(380, 790, 10))
+        wlengths = colorimeter.getWlengths()
+        self.assertRaises(ValueError, colorimeter.calculateColour,
+                          self.system, 0, None, 0, None, 'hola')
+
+        angles = np.array([0, 0.5, 1.0])
+        variants = np.array([[np.inf, 100, np.inf], [np.inf, 300, np.inf]])
+        lab = colorimeter.calculateColour(self.system,
+                angles[:, np.newaxis], thicknesses=variants)
+        self.assertEqual(lab.shape, (3, 2, 3))
+        for (i, angle) in enumerate(angles):
+            for (j, thickness) in enumerate([100, 300]):
+                self.system.setThickness(thickness, 1)
+                spectrum = (self.system.calculateCoefficients(
+                        wlengths, angle, 'te')['R'] +
+                        self.system.calculateCoefficients(
+                        wlengths, angle, 'tm')['R']) / 2
+                np.testing.assert_array_almost_equal(lab[i, j],
+                        colorimeter.calculateLab(spectrum), 12)
+
+        xyz = colorimeter.calculateColour(self.system, 0.3, 'te',
+                                          space='XYZ')
+        spectrum = self.system.calculateCoefficients(wlengths, 0.3, 'te')['R']
+        np.testing.assert_array_almost_equal(xyz,
+                colorimeter.calculateXYZ(spectrum), 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import helpers
+import decayrates as dr
+import multilayers as ml
+import numpy as np
+import shutil
+
+
+class TestDecayRates(unittest.TestCase):
+    """
+    Test the DecayRates class.
+    """
+
+    def setUp(self):
+        """
+        Prepare the ground with common data for the tests that follow.
+        """
+
+        self.mediumDir = helpers.writeMediums([('air', 1.0, 0.0),
+                                               ('glass', 1.5, 0.0),
+                                               ('core', 2.0, 0.0),
+                                               ('metal', 0.2, 3.0)])
+
+        self.air = helpers.loadMedium(self.mediumDir, 'air')
+        self.glass = helpers.loadMedium(self.mediumDir, 'glass')
+        self.core = helpers.loadMedium(self.mediumDir, 'core')
+        self.metal = helpers.loadMedium(self.mediumDir, 'metal')
+        self.channels = ['total', 'top', 'bottom', 'guided', 'lossy']
+
+    def tearDown(self):
+        """
+        Clean up.
+        """
+
+        shutil.rmtree(self.mediumDir)
+
+    def test_init(self):
+        """
+        Test the initialization and the argument checks.
+        """
+
+        system = ml.Multilayer([self.air, self.glass])
+        self.assertRaises(TypeError, dr.DecayRates, 'hola')
+        self.assertRaises(ValueError, dr.DecayRates, system, -1)
+        self.assertRaises(ValueError, dr.DecayRates, system, 1e-6, 0)
+        rates = dr.DecayRates(system, 1e-5)
+        self.assertEqual(rates.getTolerance(), 1e-5)
+        self.assertRaises(ValueError, rates.calculateRates, 0, 500)
+
+    def test_homogeneous(self):
+        """
+        A dipole in a homogeneous medium decays at the reference rate
+        and radiates half of its power upwards.
+        """
+
+        system = ml.Multilayer([self.glass, [self.glass, 100], self.glass])
+        results = dr.DecayRates(system).calculateRates([50, -30, 150], 500)
+        for orientation in ['perpendicular', 'parallel', 'isotropic']:
+            rates = results[orientation]
+            self.assertEqual(rates['total'].shape, (3,))
+            np.testing.assert_array_almost_equal(rates['total'], 1, 6)
+            np.testing.assert_array_almost_equal(rates['top'], 0.5, 6)
+            np.testing.assert_array_almost_equal(rates['bottom'], 0.5, 6)
+            np.testing.assert_array_almost_equal(rates['guided'], 0, 6)
+            np.testing.assert_array_almost_equal(rates['lossy'], 0, 6)
+
+    def test_interface(self):
+        """
+        All the power of a dipole close to a lossless interface is
+        radiated, and far from it the rate tends to the reference rate.
+        """
+
+        system = ml.Multilayer([self.air, self.glass])
+        z = np.array([[-20.0], [-150.0], [-5000.0]])
+        wlengths = np.array([400.0, 600.0])
+        results = dr.DecayRates(system).calculateRates(z, wlengths)
+        for orientation in ['perpendicular', 'parallel']:
+            rates = results[orientation]
+            self.assertEqual(rates['total'].shape, (3, 2))
+            np.testing.assert_array_almost_equal(
+                    rates['total'], rates['top'] + rates['bottom'], 5)
+            np.testing.assert_array_almost_equal(rates['guided'], 0, 6)
+            np.testing.assert_array_almost_equal(rates['lossy'], 0, 5)
+            self.assertTrue(np.all(np.absolute(rates['total'][2] - 1) <
+                                   0.01))
+
+        # The power radiated into the top medium does not depend on the
+        # distance to the interface.
+        top = results['isotropic']['top']
+        np.testing.assert_array_almost_equal(top - top[0], 0, 6)
+
+    def test_waveguide(self):
+        """
+        A dipole within the core of a lossless waveguide couples part
+        of its power to the guided modes and loses none.
+        """
+
+        system = ml.Multilayer([self.air, [self.core, 600], self.glass])
+        z = np.array([100.0, 300.0, 500.0])
+        results = dr.DecayRates(system).calculateRates(z, [500, 600, 700])
+        for orientation in ['perpendicular', 'parallel']:
+            rates = results[orientation]
+            self.assertTrue(np.all(rates['guided'] > 0.01))
+            np.testing.assert_array_almost_equal(
+                    rates['total'], rates['top'] + rates['bottom'] +
+                    rates['guided'], 5)
+        self.assertTrue(np.all(results['error'] < 1e-4))
+
+    def test_mirror(self):
+        """
+        A metallic mirror absorbs part of the power, and a dipole very
+        close to it is quenched.
+        """
+
+        system = ml.Multilayer([self.glass, self.metal])
+        results = dr.DecayRates(system).calculateRates([10, 100], 500)
+        for orientation in ['perpendicular', 'parallel']:
+            rates = results[orientation]
+            np.testing.assert_array_equal(rates['bottom'], 0)
+            self.assertTrue(np.all(rates['lossy'] > 0))
+            self.assertTrue(rates['lossy'][0] > rates['lossy'][1])
+            np.testing.assert_array_almost_equal(
+                    rates['total'], rates['top'] + rates['guided'] +
+                    rates['lossy'], 10)
+
+    def test_extraction(self):
+        """
+        The power radiated into the top and bottom mediums agrees with
+        the integral of the far-field pattern of the multilayer.
+        """
+
+        system = ml.Multilayer([self.glass, [self.core, 300], self.air])
+        z = np.array([50.0, 250.0, 800.0])
+        results = dr.DecayRates(system, 1e-9).calculateRates(z, 500)
+        for side in ['top', 'bottom']:
+            extraction = system.calculateExtraction(z, 500, 48, side)
+            for orientation in ['perpendicular', 'parallel', 'isotropic']:
+                np.testing.assert_array_almost_equal(
+                        extraction[orientation]['efficiency'],
+                        results[orientation][side], 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import distributions as ds
+import numpy as np
+from scipy.integrate import quad
+
+
+class TestDistributions(unittest.TestCase):
+    """
+    Test the distributions of emitters.
+    """
+
+    def numericalIntegral(self, distribution, q, lower, upper, reference):
+        """
+        The integral of rho(z) * exp(q * (z - reference)) calculated
+        with scipy.integrate.quad.
+        """
+
+        zmin, zmax = distribution.getSupport()
+        lower = max(lower, zmin)
+        upper = min(upper, zmax)
+
+        def integrand(z, part):
+            value = distribution.calculateDensity(z) * \
+                    np.exp(q * (z - reference))
+            return value.real if part == 0 else value.imag
+
+        return quad(integrand, lower, upper, (0,), limit=200)[0] + \
+                quad(integrand, lower, upper, (1,), limit=200)[0] * 1j
+
+    def test_init(self):
+        """
+        Test the initialization and the argument checks.
+        """
+
+        self.assertRaises(ValueError, ds.UniformDistribution, 10, 0)
+        self.assertRaises(ValueError, ds.UniformDistribution, 0, np.inf)
+        self.assertRaises(TypeError, ds.UniformDistribution, 'hola', 1)
+        self.assertRaises(ValueError, ds.GaussianDistribution, 0, 0)
+        self.assertRaises(ValueError, ds.TabulatedDistribution, [0, 1],
+                          [1, 2, 3])
+        self.assertRaises(ValueError, ds.TabulatedDistribution, [1, 0],
+                          [1, 2])
+        self.assertRaises(ValueError, ds.TabulatedDistribution, [0, 1],
+                          [1, -2])
+
+        self.assertEqual(ds.UniformDistribution(-1, 3).getSupport(),
+                         (-1, 3))
+        self.assertEqual(ds.GaussianDistribution(5, 2).getSupport(),
+                         (-11, 21))
+        self.assertAlmostEqual(ds.UniformDistribution(-1, 3).getWeight(),
+                               4, 14)
+        self.assertAlmostEqual(ds.GaussianDistribution(5, 2).getWeight(),
+                               2 * np.sqrt(2 * np.pi), 12)
+        self.assertAlmostEqual(
+                ds.TabulatedDistribution([0, 1, 3], [0, 2, 2]).getWeight(),
+                5, 14)
+        self.assertAlmostEqual(
+                ds.ExponentialDistribution(0, 10, 0.5).getWeight(),
+                (1 - np.exp(-5)) / 0.5, 14)
+
+    def test_calculateIntegral(self):
+        """
+        Compare the closed-form integrals with numerical integration.
+        """
+
+        distributions = [
+                ds.UniformDistribution(-100, 200),
+                ds.ExponentialDistribution(-100, 200, -0.03),
+                ds.GaussianDistribution(50, 30),
+                ds.GaussianDistribution(50, 30, 0, 60),
+                ds.TabulatedDistribution([-50, 0, 20, 100, 150],
+                                         [0, 1, 3, 0.5, 2])]
+        rates = np.array([0, 1e-9, 0.02, -0.03, 0.01 - 0.05j, 0.05j,
+                          -0.05 - 0.1j])
+        for distribution in distributions:
+            for (lower, upper, reference) in [(-300, 500, 0),
+                                              (0, 100, 50), (30, 70, 30),
+                                              (300, 400, 350)]:
+                integrals = distribution.calculateIntegral(
+                        rates, lower, upper, reference)
+                self.assertEqual(integrals.shape, rates.shape)
+                for (rate, integral) in zip(rates, integrals):
+                    expected = self.numericalIntegral(distribution, rate,
+                            lower, upper, reference)
+                    self.assertTrue(abs(integral - expected) <=
+                                    1e-9 * max(abs(expected), 1e-3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import helpers
+import excitation as ex
+import distributions as ds
+import multilayers as ml
+import numpy as np
+import shutil
+
+
+class TestExcitationEmissionMap(unittest.TestCase):
+    """
+    Test the ExcitationEmissionMap class.
+    """
+
+    def setUp(self):
+        """
+        Prepare the ground with common data for the tests that follow.
+        """
+
+        self.mediumDir = helpers.writeMediums([('ambient', 1.0, 0.0),
+                                               ('active', 2.0, 0.3),
+                                               ('oxide', 1.46, 0.0),
+                                               ('glass', 1.5, 0.0)])
+
+        self.ambient = helpers.loadMedium(self.mediumDir, 'ambient')
+        self.active = helpers.loadMedium(self.mediumDir, 'active')
+        self.oxide = helpers.loadMedium(self.mediumDir, 'oxide')
+        self.glass = helpers.loadMedium(self.mediumDir, 'glass')
+        self.system = ml.Multilayer([
+                self.ambient,
+                [self.active, 100],
+                [self.oxide, 200],
+                self.glass])
+        # The upper interface of the active layer belongs to the top
+        # medium, so the grid stops right below it.
+        self.zlist = np.linspace(200, 300 - 1e-9, 4001)
+        self.excitation = np.array([350, 400, 450])
+        self.emission = np.array([450, 500, 600, 700])
+        self.angles = np.array([0, 0.5])
+
+    def tearDown(self):
+        """
+        Clean up.
+        """
+
+        shutil.rmtree(self.mediumDir)
+
+    def test_init(self):
+        """
+        Test the argument checks.
+        """
+
+        self.assertRaises(TypeError, ex.ExcitationEmissionMap, 'hola',
+                          self.zlist, self.excitation, self.emission,
+                          self.angles)
+        self.assertRaises(ValueError, ex.ExcitationEmissionMap, self.system,
+                          [3, 2, 1], self.excitation, self.emission,
+                          self.angles)
+        self.assertRaises(ValueError, ex.ExcitationEmissionMap, self.system,
+                          self.zlist, self.excitation, self.emission,
+                          self.angles, 0, 'hola')
+        self.assertRaises(ValueError, ex.ExcitationEmissionMap, self.system,
+                          self.zlist, self.excitation, self.emission,
+                          self.angles, 2)
+
+        engine = ex.ExcitationEmissionMap(self.system, self.zlist,
+                                          self.excitation, self.emission, 0.3)
+        np.testing.assert_array_equal(engine.getZ(), self.zlist)
+        np.testing.assert_array_equal(engine.getExcitation(),
+                                      self.excitation)
+        np.testing.assert_array_equal(engine.getEmission(), self.emission)
+        np.testing.assert_array_equal(engine.getAngles(), [0.3])
+        self.assertRaises(ValueError, engine.calculateMap, np.ones(10))
+
+    def test_absorption(self):
+        """
+        The pump absorbed within the only absorbing layer is 1 - R - T.
+        """
+
+        for pumpAngle in [0, 0.6]:
+            for polarization in ['te', 'tm', 'unpolarized']:
+                engine = ex.ExcitationEmissionMap(
+                        self.system, self.zlist, self.excitation,
+                        self.emission, self.angles, pumpAngle, polarization)
+                absorbed = engine.calculateMap()['absorption']
+                expected = 0
+                for key in ['te', 'tm']:
+                    if polarization in [key, 'unpolarized']:
+                        coefficients = self.system.calculateCoefficients(
+                                self.excitation, pumpAngle, key)
+                        expected = expected + 1 - coefficients['R'] - \
+                            coefficients['T']
+                if polarization == 'unpolarized':
+                    expected = expected / 2
+                np.testing.assert_allclose(absorbed, expected.real, 1e-5)
+
+    def test_calculateMap(self):
+        """
+        The map is the integral of the absorption times the emission
+        factors over the distribution of emitters.
+        """
+
+        engine = ex.ExcitationEmissionMap(self.system, self.zlist,
+                                          self.excitation, self.emission,
+                                          self.angles, 0.2)
+        distribution = ds.GaussianDistribution(250, 20, 210, 290)
+        results = engine.calculateMap(distribution)
+        self.assertEqual(results['te'].shape, (3, 4, 2))
+
+        profiles = engine.calculateProfiles()
+        self.assertEqual(profiles['absorption'].shape, (4001, 3))
+        factors = self.system.calculateF(
+                self.zlist[:, np.newaxis, np.newaxis],
+                self.emission[:, np.newaxis], self.angles)
+        np.testing.assert_array_almost_equal(
+                profiles['te'], np.absolute(factors['fy']) ** 2, 12)
+
+        density = distribution.calculateDensity(self.zlist)
+        for (i, j, k) in [(0, 0, 0), (1, 2, 1), (2, 3, 0)]:
+            integrand = density * profiles['absorption'][:, i] * \
+                profiles['tm'][:, j, k]
+            self.assertAlmostEqual(results['tm'][i, j, k],
+                                   np.trapz(integrand, self.zlist), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import helpers
+import functional as fn
+import distributions as ds
+import multilayers as ml
+import numpy as np
+import shutil
+from multiprocessing.pool import ThreadPool
+
+
+class TestFunctional(unittest.TestCase):
+    """
+    Test the stateless functions.
+    """
+
+    def setUp(self):
+        """
+        Prepare the ground with common data for the tests that follow.
+        """
+
+        self.mediumDir = helpers.writeMediums([('ambient', 1.0, 0.0),
+                                               ('active', 1.8, 0.01),
+                                               ('oxide', 1.46, 0.0),
+                                               ('silicon', 4.0, 0.05)])
+
+        self.ambient = helpers.loadMedium(self.mediumDir, 'ambient')
+        self.active = helpers.loadMedium(self.mediumDir, 'active')
+        self.oxide = helpers.loadMedium(self.mediumDir, 'oxide')
+        self.silicon = helpers.loadMedium(self.mediumDir, 'silicon')
+        self.system = ml.Multilayer([
+                self.ambient,
+                [self.active, 200],
+                [self.oxide, 50],
+                self.silicon])
+        self.zlist = np.linspace(-20, 300, 9)
+        self.wlengths = np.linspace(400, 700, 31)
+        self.angles = np.array([0, 0.4, 0.9])
+
+    def tearDown(self):
+        """
+        Clean up.
+        """
+
+        shutil.rmtree(self.mediumDir)
+
+    def test_freezeStack(self):
+        """
+        A stack is an immutable snapshot of the multilayer.
+        """
+
+        stack = fn.freezeStack(self.system)
+        self.assertEqual(stack, fn.freezeStack([self.ambient,
+                                                [self.active, 200],
+                                                [self.oxide, 50],
+                                                self.silicon]))
+        self.assertEqual(len(stack), 4)
+        self.assertTrue(stack[1][0] is self.active)
+        self.assertEqual(stack[2][1], 50)
+        self.assertEqual(stack[0][1], np.inf)
+        self.assertTrue(self.system.getMedium(3) is self.silicon)
+        self.assertRaises(IndexError, self.system.getMedium, -1)
+
+        self.system.setThickness(120, 1)
+        self.assertEqual(stack[1][1], 200)
+        self.assertRaises(TypeError, fn.calculateF, self.system, 0, 500, 0)
+
+    def test_functions(self):
+        """
+        The functions give the results of the methods of the multilayer.
+        """
+
+        stack = fn.freezeStack(self.system)
+        z = self.zlist[:, np.newaxis, np.newaxis]
+        wlengths = self.wlengths[:, np.newaxis]
+        expected = self.system.calculateF(z, wlengths, self.angles)
+        results = fn.calculateF(stack, z, wlengths, self.angles)
+        for key in ['fx', 'fy', 'fz']:
+            np.testing.assert_allclose(results[key], expected[key], 1e-12)
+        results = fn.calculateF(stack, z, wlengths, self.angles,
+                                output='energy')
+        np.testing.assert_array_almost_equal(
+                results['te'], np.absolute(expected['fy']) ** 2, 12)
+
+        expected = self.system.calculateCoefficients(wlengths, self.angles,
+                                                     'tm')
+        results = fn.calculateCoefficients(stack, wlengths, self.angles, 'tm')
+        np.testing.assert_allclose(results['R'], expected['R'], 1e-12)
+
+        expected = self.system.calculateEmission(z, wlengths, self.angles,
+                                                 orientation='parallel')
+        results = fn.calculateEmission(stack, z, wlengths, self.angles,
+                                       orientation='parallel')
+        np.testing.assert_allclose(results['tm'], expected['tm'], 1e-12)
+
+        distribution = ds.GaussianDistribution(150, 30)
+        expected = self.system.calculateDepthIntegral(
+                distribution, wlengths, self.angles)
+        results = fn.calculateDepthIntegral(stack, distribution, wlengths,
+                                            self.angles)
+        np.testing.assert_allclose(results['te'], expected['te'], 1e-12)
+
+    def test_threads(self):
+        """
+        Several threads evaluate different stacks concurrently while the
+        multilayer they come from is being changed.
+        """
+
+        thicknesses = np.linspace(50, 250, 16)
+        stacks = []
+        for thickness in thicknesses:
+            self.system.setThickness(thickness, 1)
+            stacks.append(fn.freezeStack(self.system))
+        z = self.zlist[:, np.newaxis, np.newaxis]
+        wlengths = self.wlengths[:, np.newaxis]
+        expected = [fn.calculateF(stack, z, wlengths, self.angles)['fy']
+                    for stack in stacks]
+
+        def task(stack):
+            self.system.setThickness(10, 1)
+            return fn.calculateF(stack, z, wlengths, self.angles)['fy']
+
+        pool = ThreadPool(4)
+        results = pool.map(task, stacks * 4)
+        pool.close()
+        pool.join()
+        for (k, result) in enumerate(results):
+            np.testing.assert_allclose(result, expected[k % 16], 1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
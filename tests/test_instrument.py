@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import helpers
+import instrument as ins
+import multilayers as ml
+import numpy as np
+import shutil
+from os.path import join
+
+
+class TestInstrument(unittest.TestCase):
+    """
+    Test the Instrument class.
+    """
+
+    def setUp(self):
+        """
+        Prepare the ground with common data for the tests that follow.
+        """
+
+        self.mediumDir = helpers.writeMediums([('ambient', 1.0, 0.0),
+                                               ('dielectric', 1.45, 0.0)])
+        comstr = "#BogusCol0%n%k%wlength%#Comment2\n"
+        datastr = \
+                "300%1.0%1.030\n" + \
+                "350%2.1%1.025\n" + \
+                "400%3.2%1.020\n" + \
+                "500%3.0%1.010\n" + \
+                "600%2.8%0.000\n" + \
+                "700%2.7%1.000\n" + \
+                "800%2.7%1.000\n"
+        fname = join(self.mediumDir, "medium2.txt")
+        fhandle = open(fname, "w")
+        fhandle.write(comstr + datastr)
+        fhandle.close()
+
+        self.medium2 = ml.Medium(fname, delimiter='%')
+        self.dielectric = helpers.loadMedium(self.mediumDir, 'dielectric')
+        self.ambient = helpers.loadMedium(self.mediumDir, 'ambient')
+        self.system = ml.Multilayer([
+                self.ambient,
+                [self.dielectric, 1000],
+                [self.medium2, 20],
+                self.dielectric])
+
+    def tearDown(self):
+        """
+        Clean up.
+        """
+
+        shutil.rmtree(self.mediumDir)
+
+    def test_init(self):
+        """
+        Test the initialization and the setters and getters.
+        """
+
+        self.assertRaises(ValueError, ins.Instrument, 0)
+        self.assertRaises(ValueError, ins.Instrument, 2.5)
+        self.assertRaises(ValueError, ins.Instrument, 5, -1)
+
+        instrument = ins.Instrument(5)
+        self.assertEqual(instrument.getBandwidth(), 0)
+        self.assertEqual(instrument.getAngularSpread(), 0)
+        self.assertEqual(instrument.getThicknessSpread(), 0)
+        self.assertEqual(instrument.getNumNodes(), 1)
+        self.assertRaises(ValueError, instrument.setBandwidth, -1)
+        self.assertRaises(TypeError, instrument.setBandwidth, 'hola')
+        self.assertRaises(TypeError, instrument.setBandwidth, 1, 'hola')
+        self.assertRaises(TypeError, instrument.setThicknessSpread, 0.1, 1)
+
+        instrument.setBandwidth(2)
+        instrument.setAngularSpread(0.01)
+        self.assertEqual(instrument.getBandwidth(), 2)
+        self.assertEqual(instrument.getAngularSpread(), 0.01)
+        self.assertEqual(instrument.getNumNodes(), 25)
+        instrument.setThicknessSpread(0.02, [1])
+        self.assertEqual(instrument.getThicknessSpread(), 0.02)
+        self.assertEqual(instrument.getNumNodes(), 125)
+
+    def test_perfect(self):
+        """
+        An instrument with perfect resolution must reproduce the
+        results of the multilayer.
+        """
+
+        instrument = ins.Instrument()
+        wlengths = np.array([400, 500, 600])
+        angles = np.array([0, 0.3])
+        averaged = instrument.calculateCoefficients(self.system,
+                wlengths[:, np.newaxis], angles, 'tm')
+        exact = self.system.calculateCoefficients(
+                wlengths[:, np.newaxis], angles, 'tm')
+        np.testing.assert_array_almost_equal(averaged['R'], exact['R'], 14)
+        np.testing.assert_array_almost_equal(averaged['T'], exact['T'], 14)
+
+        averaged = instrument.calculateF(self.system, 1010, wlengths, 0.3)
+        f = self.system.calculateF(1010, wlengths, 0.3)
+        np.testing.assert_array_almost_equal(averaged['te'],
+                np.absolute(f['fy']) ** 2, 14)
+        np.testing.assert_array_almost_equal(averaged['tm'],
+                np.absolute(f['fx'] * np.cos(0.3) ** 2 +
+                            f['fz'] * np.sin(0.3) ** 2) ** 2, 14)
+
+    def test_averaging(self):
+        """
+        Compare the quadrature with a brute-force oversampling of the
+        Gaussian distributions.
+        """
+
+        instrument = ins.Instrument(order=15, span=4)
+        instrument.setBandwidth(3)
+        instrument.setThicknessSpread(0.01)
+        averaged = instrument.calculateCoefficients(self.system, 550, 0.2,
+                'te')
+
+        # Brute force
+        deviations = np.linspace(-4, 4, 801)
+        weights = np.exp(-0.5 * deviations ** 2)
+        weights = weights / weights.sum()
+        reflectance = 0
+        for (deviation, weight) in zip(deviations, weights):
+            self.system.setThickness(1000 * (1 + 0.01 * deviation), 1)
+            self.system.setThickness(20 * (1 + 0.01 * deviation), 2)
+            reflectance += weight * np.dot(weights,
+                    self.system.calculateCoefficients(
+                    550 + 3 * deviations, 0.2, 'te')['R'])
+        self.assertAlmostEqual(averaged['R'], reflectance, 5)
+
+        # The fringes of the thick layer are washed out by the spread
+        self.system.setThickness(1000, 1)
+        self.system.setThickness(20, 2)
+        wlengths = np.linspace(500, 600, 201)
+        sharp = self.system.calculateCoefficients(wlengths, 0, 'te')['R']
+        smooth = instrument.calculateCoefficients(self.system, wlengths, 0,
+                'te')['R']
+        self.assertTrue(np.ptp(smooth) < np.ptp(sharp))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import helpers
+import jobs as jb
+import spectra as sp
+import distributions as ds
+import multilayers as ml
+import numpy as np
+import shutil
+import threading
+
+
+class TestJobManager(unittest.TestCase):
+    """
+    Test the JobManager and SweepJob classes.
+    """
+
+    def setUp(self):
+        """
+        Prepare the ground with common data for the tests that follow.
+        """
+
+        self.mediumDir = helpers.writeMediums([('ambient', 1.0, 0.0),
+                                               ('active', 1.8, 0.01),
+                                               ('silicon', 4.0, 0.05)])
+
+        self.ambient = helpers.loadMedium(self.mediumDir, 'ambient')
+        self.active = helpers.loadMedium(self.mediumDir, 'active')
+        self.silicon = helpers.loadMedium(self.mediumDir, 'silicon')
+        self.system = ml.Multilayer([
+                self.ambient,
+                [self.active, 200],
+                [self.ambient, 30],
+                self.silicon])
+        self.zlist = np.linspace(-20, 250, 7)
+        self.wlengths = np.linspace(400, 700, 13)
+        self.angles = np.array([0, 0.3, 0.9])
+
+    def tearDown(self):
+        """
+        Clean up.
+        """
+
+        shutil.rmtree(self.mediumDir)
+
+    def test_init(self):
+        """
+        Test the argument checks.
+        """
+
+        self.assertRaises(ValueError, jb.JobManager, 0)
+        manager = jb.JobManager(2)
+        self.assertEqual(manager.getWorkers(), 2)
+        self.assertRaises(TypeError, manager.submitF, 'hola', self.zlist,
+                          self.wlengths, self.angles)
+        self.assertRaises(ValueError, manager.submitF, self.system,
+                          self.zlist, self.wlengths, self.angles, 0, 'hola')
+        self.assertRaises(TypeError, manager.submitSpectra, 'hola',
+                          self.wlengths)
+        manager.close()
+        self.assertRaises(ValueError, manager.submit, len, [])
+
+    def test_submitF(self):
+        """
+        The chunks and the result of a grid of F are those of the
+        multilayer.
+        """
+
+        expected = self.system.calculateF(
+                self.zlist[:, np.newaxis, np.newaxis],
+                self.wlengths[:, np.newaxis], self.angles)
+        with jb.JobManager(2) as manager:
+            job = manager.submitF(self.system, self.zlist, self.wlengths,
+                                  self.angles, chunkSize=5)
+            chunks = list(job.iterChunks())
+            results = job.getResult()
+        self.assertEqual(job.getState(), 'finished')
+        self.assertEqual(job.getProgress(), (3, 3))
+        self.assertEqual([chunk['wlength'].size for chunk in chunks],
+                         [5, 5, 3])
+        np.testing.assert_allclose(chunks[1]['fy'],
+                                   expected['fy'][:, 5:10], 1e-12)
+        self.assertEqual(sorted(results.keys()), ['fx', 'fy', 'fz'])
+        for key in ['fx', 'fy', 'fz']:
+            np.testing.assert_allclose(results[key], expected[key], 1e-12)
+
+    def test_submitSpectra(self):
+        """
+        The result of a job of spectra is that of the pipeline.
+        """
+
+        pipeline = sp.SpectralPipeline(self.system,
+                                       ds.GaussianDistribution(100, 15),
+                                       self.angles, chunkSize=4)
+        expected = pipeline.calculateSpectra(self.wlengths)
+        with jb.JobManager() as manager:
+            job = manager.submitSpectra(pipeline, self.wlengths)
+            results = job.getResult()
+            self.assertEqual(job.getProgress(), (4, 4))
+            for key in ['te', 'tm']:
+                np.testing.assert_allclose(results[key], expected[key], 1e-12)
+
+            # Any function, and its exceptions
+            job = manager.submit(sum, [1, 2, 3])
+            self.assertEqual(job.getResult(), 6)
+            job = manager.submit(int, 'hola')
+            self.assertRaises(ValueError, job.getResult)
+            self.assertEqual(job.getState(), 'failed')
+
+    def test_cancel(self):
+        """
+        The jobs are cancelled before they start or between chunks.
+        """
+
+        event = threading.Event()
+        with jb.JobManager(1) as manager:
+            blocking = manager.submit(event.wait)
+            job = manager.submitF(self.system, self.zlist, self.wlengths,
+                                  self.angles)
+            self.assertFalse(job.wait(0.01))
+            self.assertRaises(RuntimeError, job.getResult, 0.01)
+            self.assertEqual(job.getState(), 'pending')
+            self.assertTrue(job.cancel())
+            self.assertFalse(job.cancel())
+            event.set()
+            self.assertTrue(blocking.getResult())
+        self.assertEqual(job.getState(), 'cancelled')
+        self.assertEqual(job.getProgress(), (0, 1))
+        self.assertRaises(RuntimeError, job.getResult)
+        self.assertEqual(list(job.iterChunks()), [])
+
+    @unittest.skipIf(jb.asyncio is None, "asyncio is not available")
+    def test_asyncio(self):
+        """
+        The jobs can be awaited and streamed in an event loop.
+        """
+
+        expected = self.system.calculateF(
+                self.zlist[:, np.newaxis, np.newaxis],
+                self.wlengths[:, np.newaxis], self.angles, output='energy')
+        asyncio = jb.asyncio
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        manager = jb.JobManager(1)
+        try:
+            job = manager.submitF(self.system, self.zlist, self.wlengths,
+                                  self.angles, output='energy', chunkSize=4)
+            stream = job.streamChunks()
+            chunks = []
+            while True:
+                try:
+                    chunks.append(loop.run_until_complete(stream.__anext__()))
+                except StopAsyncIteration:
+                    break
+            results = loop.run_until_complete(asyncio.ensure_future(job))
+            self.assertEqual(len(chunks), 4)
+            for key in ['te', 'tm']:
+                np.testing.assert_allclose(results[key], expected[key], 1e-12)
+
+            # Cancelling the task that awaits a job cancels the job
+            event = threading.Event()
+            manager.submit(event.wait)
+            job = manager.submitF(self.system, self.zlist, self.wlengths,
+                                  self.angles)
+            task = asyncio.ensure_future(job)
+            loop.call_soon(task.cancel)
+            self.assertRaises(asyncio.CancelledError,
+                              loop.run_until_complete, task)
+            self.assertEqual(job.getState(), 'cancelled')
+            event.set()
+        finally:
+            manager.close()
+            asyncio.set_event_loop(None)
+            loop.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import helpers
+import kernels as kn
+import distributions as ds
+import multilayers as ml
+import numpy as np
+import shutil
+from os.path import join
+
+
+class TestEmissionKernel(unittest.TestCase):
+    """
+    Test the EmissionKernel class.
+    """
+
+    def setUp(self):
+        """
+        Prepare the ground with common data for the tests that follow.
+        """
+
+        self.mediumDir = helpers.writeMediums([('ambient', 1.0, 0.0),
+                                               ('active', 1.8, 0.01),
+                                               ('oxide', 1.46, 0.0),
+                                               ('silicon', 4.0, 0.05)])
+
+        self.ambient = helpers.loadMedium(self.mediumDir, 'ambient')
+        self.active = helpers.loadMedium(self.mediumDir, 'active')
+        self.oxide = helpers.loadMedium(self.mediumDir, 'oxide')
+        self.silicon = helpers.loadMedium(self.mediumDir, 'silicon')
+        self.system = ml.Multilayer([
+                self.ambient,
+                [self.active, 300],
+                [self.oxide, 50],
+                self.silicon])
+        self.zlist = np.linspace(50.25, 349.75, 600)
+        self.wlengths = np.linspace(400, 700, 61)
+        self.angles = np.array([0, 0.4, 0.8])
+
+    def tearDown(self):
+        """
+        Clean up.
+        """
+
+        shutil.rmtree(self.mediumDir)
+
+    def test_init(self):
+        """
+        Test the argument checks and the compression.
+        """
+
+        factors = {'te': np.ones((3, 2, 1)), 'tm': np.ones((3, 2, 1))}
+        self.assertRaises(ValueError, kn.EmissionKernel, [0, 2, 1],
+                          [400, 500], 0, factors)
+        self.assertRaises(ValueError, kn.EmissionKernel, [0, 1, 2],
+                          [400, 500], 0, factors, 2)
+        self.assertRaises(ValueError, kn.EmissionKernel, [0, 1, 2],
+                          [400, 500, 600], 0, factors)
+        self.assertRaises(TypeError, kn.calculateKernel, 'hola',
+                          self.zlist, self.wlengths, self.angles)
+
+        kernel = kn.EmissionKernel([0, 1, 2], [400, 500], 0, factors)
+        self.assertEqual(kernel.getRank(), {'te': 1, 'tm': 1})
+        self.assertEqual(kernel.getTolerance(), 1e-6)
+        np.testing.assert_array_almost_equal(kernel.calculateFactors()['te'],
+                                             factors['te'], 12)
+
+        kernel = kn.calculateKernel(self.system, self.zlist, self.wlengths,
+                                    self.angles, 1e-5)
+        calculated = self.system.calculateF(
+                self.zlist[:, np.newaxis, np.newaxis],
+                self.wlengths[:, np.newaxis], self.angles)
+        fte = np.absolute(calculated['fy']) ** 2
+        decompressed = kernel.calculateFactors()['te']
+        error = np.linalg.norm(decompressed - fte) / np.linalg.norm(fte)
+        self.assertTrue(error <= 1e-5)
+        self.assertAlmostEqual(error, kernel.getError()['te'], 10)
+        self.assertTrue(kernel.getRank()['te'] < 30)
+        left, right = kernel.getFactors('tm')
+        self.assertEqual(left.shape, (600, kernel.getRank()['tm']))
+        self.assertEqual(right.shape, (kernel.getRank()['tm'], 61 * 3))
+
+    def test_integrateDistributions(self):
+        """
+        The averages over the distributions agree with the depth
+        integrals of the multilayer.
+        """
+
+        kernel = kn.calculateKernel(self.system, self.zlist, self.wlengths,
+                                    self.angles)
+        distributions = [ds.GaussianDistribution(200, 20, 100, 300),
+                         ds.UniformDistribution(60, 340),
+                         ds.ExponentialDistribution(60, 340, -0.01)]
+        results = kernel.integrateDistributions(distributions)
+        self.assertEqual(results['te'].shape, (3, 61, 3))
+        for (k, distribution) in enumerate(distributions):
+            factors = self.system.calculateDepthIntegral(
+                    distribution, self.wlengths[:, np.newaxis], self.angles)
+            for key in ['te', 'tm']:
+                np.testing.assert_allclose(results[key][k], factors[key],
+                                           1e-3)
+
+        # Many distributions at once, as densities on the grid
+        centers = np.linspace(80, 320, 500)
+        densities = np.exp(-(self.zlist - centers[:, np.newaxis]) ** 2 /
+                           (2 * 15.0 ** 2))
+        results = kernel.integrateDistributions(densities)
+        self.assertEqual(results['tm'].shape, (500, 61, 3))
+        single = kernel.integrateDistributions(densities[123])
+        np.testing.assert_array_almost_equal(single['tm'],
+                                             results['tm'][123], 12)
+        self.assertRaises(ValueError, kernel.integrateDistributions,
+                          np.ones(10))
+        self.assertRaises(ValueError, kernel.integrateDistributions,
+                          np.zeros(600))
+
+    def test_saveKernel(self):
+        """
+        A saved kernel is loaded back unchanged.
+        """
+
+        kernel = kn.calculateKernel(self.system, self.zlist, self.wlengths,
+                                    self.angles)
+        fname = join(self.mediumDir, "kernel.npz")
+        kernel.saveKernel(fname)
+        loaded = kn.loadKernel(fname)
+        np.testing.assert_array_equal(loaded.getZ(), self.zlist)
+
+        # The name is used as is, with or without extension
+        fname = join(self.mediumDir, "kernel")
+        kernel.saveKernel(fname)
+        unnamed = kn.loadKernel(fname)
+        self.assertEqual(unnamed.getRank(), kernel.getRank())
+        np.testing.assert_array_equal(loaded.getWavelengths(), self.wlengths)
+        np.testing.assert_array_equal(loaded.getAngles(), self.angles)
+        self.assertEqual(loaded.getRank(), kernel.getRank())
+        self.assertEqual(loaded.getError(), kernel.getError())
+        distribution = ds.GaussianDistribution(150, 30)
+        for key in ['te', 'tm']:
+            np.testing.assert_array_equal(
+                    loaded.integrateDistributions(distribution)[key],
+                    kernel.integrateDistributions(distribution)[key])
+
+
+if __name__ == '__main__':
+    unittest.main()
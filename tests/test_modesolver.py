@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import helpers
+import modesolver as ms
+import multilayers as ml
+import numpy as np
+import shutil
+from scipy.optimize import brentq
+
+
+class TestModeSolver(unittest.TestCase):
+    """
+    Test the ModeSolver class.
+    """
+
+    def setUp(self):
+        """
+        Prepare the ground with common data for the tests that follow.
+        """
+
+        self.mediumDir = helpers.writeMediums([('cladding', 1.45, 0.0),
+                                               ('core', 2.0, 0.0),
+                                               ('air', 1.0, 0.0),
+                                               ('substrate', 3.5, 0.0)])
+
+        self.cladding = helpers.loadMedium(self.mediumDir, 'cladding')
+        self.core = helpers.loadMedium(self.mediumDir, 'core')
+        self.air = helpers.loadMedium(self.mediumDir, 'air')
+        self.substrate = helpers.loadMedium(self.mediumDir, 'substrate')
+        self.slab = ml.Multilayer([
+                self.cladding,
+                [self.core, 600],
+                self.cladding])
+        self.region = (1.46, 1.99, -0.01, 0.01)
+
+    def tearDown(self):
+        """
+        Clean up.
+        """
+
+        shutil.rmtree(self.mediumDir)
+
+    def slabModes(self, wlength):
+        """
+        The effective indices of the TE modes of the symmetric slab
+        waveguide from its analytic dispersion relation.
+        """
+
+        def dispersion(neff, order):
+            kappa = 2 * np.pi / wlength * np.sqrt(2.0 ** 2 - neff ** 2)
+            gamma = 2 * np.pi / wlength * np.sqrt(neff ** 2 - 1.45 ** 2)
+            return kappa * 600 - order * np.pi - 2 * np.arctan(gamma / kappa)
+
+        modes = []
+        for order in range(10):
+            try:
+                modes.append(brentq(dispersion, 1.45 + 1e-9, 2.0 - 1e-9,
+                                    args=(order,), xtol=1e-14))
+            except ValueError:
+                break
+
+        return np.array(modes)
+
+    def test_init(self):
+        """
+        Test the initialization and the argument checks.
+        """
+
+        self.assertRaises(TypeError, ms.ModeSolver, 'hola', 'te')
+        self.assertRaises(ValueError, ms.ModeSolver, self.slab, 'hola')
+        self.assertRaises(ValueError, ms.ModeSolver, self.slab, 'te',
+                          ('proper', 'hola'))
+
+        solver = ms.ModeSolver(self.slab, 'te')
+        self.assertEqual(solver.getPolarization(), 'TE')
+        self.assertEqual(solver.getSheets(), ('proper', 'proper'))
+        self.assertRaises(ValueError, solver.findModes, 500,
+                          (1.9, 1.5, -0.01, 0.01))
+        self.assertRaises(TypeError, solver.findModes, 500, 'hola')
+
+    def test_slab(self):
+        """
+        Compare the guided modes of a symmetric slab waveguide with the
+        analytic solution.
+        """
+
+        solver = ms.ModeSolver(self.slab, 'te')
+        expected = self.slabModes(500)
+        self.assertEqual(solver.countModes(500, self.region), expected.size)
+        modes = solver.findModes(500, self.region)
+        self.assertEqual(modes.shape, (1, expected.size))
+        np.testing.assert_array_almost_equal(modes[0].real, expected, 10)
+        np.testing.assert_array_almost_equal(modes[0].imag, 0, 10)
+
+        # The modes are zeros of the dispersion function
+        values = solver.calculateDispersion(500, modes[0])
+        self.assertTrue(np.all(np.absolute(values) < 1e-8))
+
+    def test_continuation(self):
+        """
+        Follow the modes over a range of wavelengths. Modes reaching
+        cutoff leave the region and must be NaN from then on.
+        """
+
+        solver = ms.ModeSolver(self.slab, 'te')
+        wlengths = np.linspace(450, 650, 9)
+        modes = solver.findModes(wlengths, self.region)
+        for (i, wlength) in enumerate(wlengths):
+            expected = self.slabModes(wlength)
+            expected = expected[expected > self.region[0]]
+            found = modes[i][np.isfinite(modes[i])]
+            np.testing.assert_array_almost_equal(found.real, expected, 10)
+
+        # Each column is a single mode, which becomes less confined
+        # as the wavelength grows.
+        for column in modes.T:
+            column = column[np.isfinite(column)].real
+            self.assertTrue(np.all(np.diff(column) < 0))
+
+    def test_leaky(self):
+        """
+        A waveguide on a high-index substrate has leaky modes only.
+        They are found on the improper sheet of the substrate.
+        """
+
+        system = ml.Multilayer([
+                self.air,
+                [self.core, 600],
+                [self.cladding, 300],
+                self.substrate])
+        proper = ms.ModeSolver(system, 'te')
+        self.assertEqual(proper.countModes(500, (1.5, 1.99, 1e-7, 0.05)), 0)
+
+        improper = ms.ModeSolver(system, 'te', ('proper', 'improper'))
+        modes = improper.findModes([500, 510], (1.5, 1.99, 1e-7, 0.05))
+        self.assertEqual(modes.shape[1], 3)
+        self.assertTrue(np.all(modes.imag > 0))
+        values = improper.calculateDispersion(500, modes[0])
+        self.assertTrue(np.all(np.absolute(values) < 1e-8))
+
+        # The thicker the buffer layer, the lower the losses
+        system.setThickness(500, 2)
+        thicker = improper.findModes(500, (1.5, 1.99, 1e-12, 0.05))
+        self.assertEqual(thicker.shape, (1, 3))
+        self.assertTrue(np.all(thicker[0].imag < modes[0].imag))
+
+
+if __name__ == '__main__':
+    unittest.main()
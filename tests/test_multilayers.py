@@ -2,6 +2,7 @@
 
 import unittest
 import multilayers as ml
+import distributions as ds
 import numpy as np
 from os import remove
 
@@ -96,6 +97,19 @@ class TestMedium(unittest.TestCase):
         self.assertEqual(min_m2, 300)
         self.assertEqual(max_m2, 800)
 
+    def test_getTable(self):
+        """
+        Test the getTable method.
+        """
+
+        table = self.medium2.getTable()
+        np.testing.assert_array_equal(table['wavelengths'],
+                                      [300, 350, 400, 500, 600, 700, 800])
+        np.testing.assert_array_equal(table['refrIndex'],
+                                      [1.0, 2.1, 3.2, 3.0, 2.8, 2.7, 2.7])
+        np.testing.assert_array_equal(table['extCoef'],
+                                      [1.03, 1.025, 1.02, 1.01, 0, 1, 1])
+
     def test_getRefrIndex(self):
         """
         Test the getRefrIndex method.
@@ -504,6 +518,20 @@ class TestMultilayer(unittest.TestCase):
         self.assertEqual(self.mlminimum.getIndexAtPos(-1), 1)
         self.assertEqual(self.mlminimum.getIndexAtPos(1), 0)
 
+        # Arrays of positions
+        z = np.array([[-1, 0, 10], [20, 25, 31]])
+        np.testing.assert_array_equal(self.ml2layers.getIndexAtPos(z),
+                                      [[3, 2, 2], [1, 1, 0]])
+        self.ml2layers.setThickness(5, 1)
+        np.testing.assert_array_equal(self.ml2layers.getIndexAtPos(z),
+                                      [[3, 2, 2], [1, 0, 0]])
+        self.assertEqual(self.ml2layers.getIndexAtPos(np.array([])).size, 0)
+
+        # Positions that are not finite are rejected
+        self.assertRaises(ValueError, self.ml2layers.getIndexAtPos, np.nan)
+        self.assertRaises(ValueError, self.ml2layers.getIndexAtPos,
+                          np.array([0, np.inf]))
+
     def test_setgetWlength(self):
         """
         Test the setWlength method and getWlength
@@ -1570,5 +1598,451 @@ class TestMultilayer(unittest.TestCase):
         self.assertAlmostEqual(Tud, Tdu, 12)
         self.assertAlmostEqual(Rud, Rdu, 12)
 
+    def test_calculateCoefficients(self):
+        """
+        Test that the vectorized coefficients agree with those obtained
+        through the scalar methods and that the state of the multilayer
+        is left untouched.
+        """
+
+        wlengths = np.array([350, 400, 600])
+        angles = np.array([0, 0.5, 1.2])
+        self.assertRaises(ValueError, self.ml2layers.calculateCoefficients,
+                250, 0, 'te')
+        self.assertRaises(ValueError, self.ml2layers.calculateCoefficients,
+                400, 0, 'hola')
+        self.assertRaises(IndexError, self.ml2layers.calculateCoefficients,
+                400, 0, 'te', 4)
+
+        coefs = self.ml2layers.calculateCoefficients(
+                wlengths[:, np.newaxis], angles, 'te')
+        self.assertEqual(coefs['r'].shape, (3, 3))
+        self.assertEqual(self.ml2layers.getWlength(), None)
+        self.assertEqual(self.ml2layers.getPolarization(), None)
+
+        for pol in ['te', 'tm']:
+            coefs = self.ml2layers.calculateCoefficients(
+                    wlengths[:, np.newaxis], angles, pol)
+            for (i, wlength) in enumerate(wlengths):
+                for (j, angle) in enumerate(angles):
+                    self.ml2layers.setWlength(wlength)
+                    self.ml2layers.setPropAngle(angle)
+                    self.ml2layers.setPolarization(pol)
+                    self.ml2layers.calcMatrices()
+                    self.ml2layers.updateCharMatrix()
+                    expected = self.ml2layers.getCoefficientsUpDown()
+                    for key in ['r', 't', 'R', 'T']:
+                        self.assertAlmostEqual(coefs[key][i, j],
+                                expected[key], 12)
+
+        # Angles given in an inner layer
+        coefs = self.ml2layers.calculateCoefficients(400, 0.3, 'tm', 2)
+        self.ml2layers.setWlength(400)
+        self.ml2layers.setPropAngle(0.3, 2)
+        self.ml2layers.setPolarization('tm')
+        self.ml2layers.calcMatrices()
+        self.ml2layers.updateCharMatrix()
+        self.assertAlmostEqual(coefs['r'],
+                self.ml2layers.getCoefficientsUpDown()['r'], 12)
+
+    def test_calculateEllipsometry(self):
+        """
+        Test the ellipsometric angles against the TE and TM reflection
+        coefficients.
+        """
+
+        wlengths = np.array([400, 500, 600])
+        angles = np.array([0, 0.4, 1.1])
+        psi, delta, rtm, rte = self.symmetry.calculateEllipsometry(
+                wlengths[:, np.newaxis], angles, full=True)
+        psi2, delta2 = self.symmetry.calculateEllipsometry(
+                wlengths[:, np.newaxis], angles)
+        np.testing.assert_array_equal(psi, psi2)
+        np.testing.assert_array_equal(delta, delta2)
+        te = self.symmetry.calculateCoefficients(
+                wlengths[:, np.newaxis], angles, 'te')['r']
+        tm = self.symmetry.calculateCoefficients(
+                wlengths[:, np.newaxis], angles, 'tm')['r']
+        np.testing.assert_array_almost_equal(rte, te, 14)
+        np.testing.assert_array_almost_equal(rtm, tm, 14)
+        np.testing.assert_array_almost_equal(
+                np.tan(psi) * np.exp(1j * delta), -tm / te, 12)
+
+        # At normal incidence TE and TM cannot be distinguished
+        np.testing.assert_array_almost_equal(psi[:, 0], np.pi / 4, 14)
+        np.testing.assert_array_almost_equal(delta[:, 0], 0, 14)
+
+    def test_calculateDepthIntegral(self):
+        """
+        Test the closed-form depth integrals against a numerical
+        integration of the factors given by calculateF.
+        """
+
+        # In a system with all the layers made of the same material the
+        # factors are 1 everywhere.
+        uniform = ds.UniformDistribution(-20, 30)
+        factors = self.mlsame.calculateDepthIntegral(uniform, 400,
+                                                     [0, 0.5])
+        np.testing.assert_array_almost_equal(factors['te'], 1, 12)
+        np.testing.assert_array_almost_equal(factors['tm'], 1, 12)
+
+        wlengths = np.array([350, 600])
+        angles = np.array([0, 0.3, 1.0])
+        distributions = [
+                ds.UniformDistribution(-15, 40),
+                ds.ExponentialDistribution(2, 28, -0.05),
+                ds.GaussianDistribution(12, 6),
+                ds.TabulatedDistribution([-5, 0, 15, 25, 35], [1, 2, 0, 3, 1])]
+        for system in [self.ml2layers, self.cssystem_f2_film]:
+            for distribution in distributions:
+                factors = system.calculateDepthIntegral(distribution,
+                        wlengths[:, np.newaxis], angles)
+                self.assertEqual(factors['te'].shape, (2, 3))
+
+                # Fz is discontinuous at the interfaces, so every layer
+                # is integrated separately.
+                zmin, zmax = distribution.getSupport()
+                limits = [zmin, zmax] + [system.getPosition(layer) for
+                                         layer in range(system.numLayers())
+                                         if zmin < system.getPosition(layer)
+                                         < zmax]
+                limits = np.sort(limits)
+                te = tm = weight = 0
+                for (lower, upper) in zip(limits[:-1], limits[1:]):
+                    z = np.linspace(lower, upper - 1e-9, 20001)
+                    f = system.calculateF(z[:, np.newaxis, np.newaxis],
+                                          wlengths[:, np.newaxis], angles)
+                    density = distribution.calculateDensity(z)
+                    weight += np.trapz(density, z)
+                    density = density[:, np.newaxis, np.newaxis]
+                    te += np.trapz(density * np.absolute(f['fy']) ** 2, z,
+                                   axis=0)
+                    tm += np.trapz(density * np.absolute(
+                            f['fx'] * np.cos(angles) ** 2 +
+                            f['fz'] * np.sin(angles) ** 2) ** 2, z, axis=0)
+                np.testing.assert_allclose(factors['te'], te / weight, 1e-6)
+                np.testing.assert_allclose(factors['tm'], tm / weight, 1e-6)
+
+            # All the distributions at once
+            factors = system.calculateDepthIntegrals(distributions,
+                    wlengths[:, np.newaxis], angles)
+            self.assertEqual(factors['te'].shape, (2, 3, 4))
+            for (k, distribution) in enumerate(distributions):
+                single = system.calculateDepthIntegral(distribution,
+                        wlengths[:, np.newaxis], angles)
+                for key in ['te', 'tm']:
+                    np.testing.assert_allclose(factors[key][..., k],
+                                               single[key], 1e-12)
+
+    def test_calculateFWavevector(self):
+        """
+        Test the factors F as a function of the in-plane wavevector.
+        """
+
+        self.assertRaises(ValueError, self.ml2layers.calculateFWavevector,
+                          5, 400, 0.5, 'hola')
+        self.assertRaises(ValueError, self.ml2layers.calculateFWavevector,
+                          5, 400, 0.5, 'top', 'w')
+
+        # Same as calculateF for real angles in the top medium,
+        # including the normal and grazing directions.
+        zlist = np.array([-10, 50, 150, 250, 400])
+        wlengths = np.array([350, 600])
+        angles = np.array([0, 0.4, 1.2, np.pi / 2])
+        system = self.cssystem_f2_film
+        f = system.calculateF(zlist[:, np.newaxis, np.newaxis],
+                              wlengths[:, np.newaxis], angles)
+        g = system.calculateFWavevector(zlist[:, np.newaxis, np.newaxis],
+                                        wlengths[:, np.newaxis],
+                                        np.sin(angles))
+        for component in ['fx', 'fy', 'fz']:
+            np.testing.assert_array_almost_equal(f[component], g[component],
+                                                 12)
+
+        # The bottom side is the top side of the upside down multilayer
+        flipped = ml.Multilayer([
+                self.medium2,
+                [self.medium1, 20],
+                [self.medium2, 10],
+                self.medium1])
+        neff = 3.0 * np.sin(angles[:-1])
+        f = flipped.calculateFWavevector(30 - zlist[:, np.newaxis], 400,
+                                         neff)
+        g = self.ml2layers.calculateFWavevector(zlist[:, np.newaxis], 400,
+                                                neff, 'bottom', 'zy')
+        self.assertEqual(sorted(g.keys()), ['fy', 'fz'])
+        np.testing.assert_array_almost_equal(f['fy'], g['fy'], 12)
+        np.testing.assert_array_almost_equal(f['fz'], g['fz'], 12)
+
+        # Beyond the critical angle of the bottom medium the field of a
+        # dipole within it decays away from the interface.
+        system = ml.Multilayer([self.cs_dielectric, self.cs_ambient])
+        zlist = np.array([-100, -200])
+        f = system.calculateFWavevector(zlist, 500, 1.2)
+        decay = np.exp(-2 * np.pi / 500 * np.sqrt(1.2 ** 2 - 1) * 100)
+        for component in ['fx', 'fy', 'fz']:
+            self.assertAlmostEqual(np.absolute(f[component][1] /
+                                               f[component][0]), decay, 12)
+
+    def test_calculateEmission(self):
+        """
+        Test the orientation averages against the scalar F methods.
+        """
+
+        self.assertRaises(ValueError, self.ml2layers.calculateEmission,
+                          5, 400, 0.3, 0, 'hola')
+        self.assertRaises(ValueError, self.ml2layers.calculateEmission,
+                          5, 400, 0.3, 0, 1.5)
+
+        # Randomly oriented dipoles in a homogeneous medium
+        emission = self.mlsame.calculateEmission(
+                np.array([-3, 2, 7, 12])[:, np.newaxis], 400,
+                [0, 0.3, 1.0, np.pi / 2])
+        self.assertEqual(emission['te'].shape, (4, 4))
+        np.testing.assert_array_almost_equal(emission['te'], 1 / 3.0, 12)
+        np.testing.assert_array_almost_equal(emission['tm'], 1 / 3.0, 12)
+
+        zlist = np.array([-10, 5, 20, 45])
+        wlengths = np.array([350, 500])
+        angles = np.array([0, 0.4, 1.1])
+        for orientation in ['isotropic', 'parallel', 'perpendicular', 0.25]:
+            vertical = {'isotropic': 1 / 3.0, 'parallel': 0,
+                        'perpendicular': 1}.get(orientation, orientation)
+            emission = self.ml2layers.calculateEmission(
+                    zlist[:, np.newaxis, np.newaxis],
+                    wlengths[:, np.newaxis], angles, 0, orientation)
+            self.assertEqual(emission['tm'].shape, (4, 2, 3))
+            for (i, z) in enumerate(zlist):
+                for (j, wlength) in enumerate(wlengths):
+                    for (k, angle) in enumerate(angles):
+                        fx = self.ml2layers.calculateFx(z, wlength, angle)
+                        fy = self.ml2layers.calculateFy(z, wlength, angle)
+                        fz = self.ml2layers.calculateFz(z, wlength, angle)
+                        self.assertAlmostEqual(
+                                emission['te'][i, j, k],
+                                (1 - vertical) / 2.0 * abs(fy) ** 2, 12)
+                        self.assertAlmostEqual(
+                                emission['tm'][i, j, k],
+                                (1 - vertical) / 2.0 * abs(fx) ** 2 *
+                                np.cos(angle) ** 2 + vertical *
+                                abs(fz) ** 2 * np.sin(angle) ** 2, 12)
+
+    def test_calculateFGradient(self):
+        """
+        Test the analytic derivatives against finite differences, with
+        the dipoles attached to their layers.
+        """
+
+        self.assertRaises(IndexError, self.ml2layers.calculateFGradient,
+                          5, 400, 0.3, [0])
+        self.assertRaises(IndexError, self.ml2layers.calculateFGradient,
+                          5, 400, 0.3, [3])
+
+        zlist = np.array([-5.0, 3.0, 15.0, 25.0, 40.0])
+        indices = np.array([3, 2, 2, 1, 0])
+        wlengths = np.array([350, 500])[:, np.newaxis, np.newaxis]
+        angles = np.array([0, 0.4, np.pi / 2])[:, np.newaxis]
+        results = self.ml2layers.calculateFGradient(
+                zlist, wlengths, angles, [1, 2])
+        factors = self.ml2layers.calculateF(zlist, wlengths, angles)
+        for key in ['fx', 'fy', 'fz']:
+            np.testing.assert_array_almost_equal(results[key], factors[key],
+                                                 12)
+            self.assertEqual(results['d' + key].shape, (2, 2, 3, 5))
+
+        step = 1e-4
+        for (k, layer) in enumerate([1, 2]):
+            thickness = self.ml2layers.getThickness(layer)
+            values = []
+            for sign in [1, -1]:
+                self.ml2layers.setThickness(thickness + sign * step, layer)
+                shift = sign * step * (indices < layer)
+                values.append(self.ml2layers.calculateF(
+                        zlist + shift, wlengths, angles))
+            self.ml2layers.setThickness(thickness, layer)
+            for key in ['fx', 'fy', 'fz']:
+                np.testing.assert_array_almost_equal(
+                        results['d' + key][k],
+                        (values[0][key] - values[1][key]) / (2 * step), 6)
+
+    def test_calculateExtraction(self):
+        """
+        Test the emission patterns and the extraction efficiencies.
+        """
+
+        self.assertRaises(ValueError, self.mlsame.calculateExtraction,
+                          5, 600, 24, 'hola')
+        self.assertRaises(ValueError, self.mlsame.calculateExtraction,
+                          5, 600, 1)
+        self.assertRaises(ValueError, self.cssystem_f2_film.calculateExtraction,
+                          100, 600, 24, 'bottom')
+
+        # A dipole in a homogeneous medium radiates half of its power
+        # to each side.
+        for side in ['top', 'bottom']:
+            results = self.mlsame.calculateExtraction(
+                    [[-3], [2], [7], [12]], [600, 700], 16, side)
+            self.assertEqual(results['angles'].shape, (4, 2, 16))
+            for orientation in ['perpendicular', 'parallel', 'isotropic']:
+                np.testing.assert_array_almost_equal(
+                        results[orientation]['efficiency'], 0.5, 12)
+                self.assertTrue(np.all(results[orientation]['error'] <
+                                       1e-4))
+
+        # The patterns are those given by calculateF, and the
+        # efficiency is their integral over the solid angle.
+        z = np.array([50, 150, 250])
+        results = self.cssystem_f2_film.calculateExtraction(
+                z[:, np.newaxis], [400, 600], 32)
+        angles = results['angles']
+        f = self.cssystem_f2_film.calculateF(
+                z[:, np.newaxis, np.newaxis],
+                np.array([400, 600])[:, np.newaxis], angles)
+        np.testing.assert_array_almost_equal(
+                results['perpendicular']['tm'],
+                3 / (8 * np.pi * 1.45) * np.absolute(f['fz']) ** 2 *
+                np.sin(angles) ** 2, 12)
+        np.testing.assert_array_almost_equal(
+                results['parallel']['te'],
+                3 / (16 * np.pi * 1.45) * np.absolute(f['fy']) ** 2, 12)
+        np.testing.assert_array_almost_equal(
+                results['parallel']['tm'],
+                3 / (16 * np.pi * 1.45) * np.absolute(f['fx']) ** 2 *
+                np.cos(angles) ** 2, 12)
+        for orientation in ['perpendicular', 'parallel', 'isotropic']:
+            pattern = results[orientation]
+            np.testing.assert_array_almost_equal(
+                    pattern['efficiency'],
+                    np.sum(results['weights'] * (pattern['te'] +
+                                                 pattern['tm']), axis=-1),
+                    12)
+
+        # The error estimate bounds the difference with a finer rule
+        coarse = self.cssystem_f4_film.calculateExtraction(100, 500, 8)
+        fine = self.cssystem_f4_film.calculateExtraction(100, 500, 64)
+        for orientation in ['perpendicular', 'parallel']:
+            self.assertTrue(np.absolute(coarse[orientation]['efficiency'] -
+                                        fine[orientation]['efficiency']) <=
+                            coarse[orientation]['error'])
+
+    def test_calculateThicknessSweep(self):
+        """
+        Test the thickness sweep against calculateCoefficients with the
+        thickness set explicitly.
+        """
+
+        self.assertRaises(IndexError,
+                self.ml2layers.calculateThicknessSweep, 0, 10, 400, 0, 'te')
+        self.assertRaises(IndexError,
+                self.ml2layers.calculateThicknessSweep, 3, 10, 400, 0, 'te')
+        self.assertRaises(ValueError,
+                self.ml2layers.calculateThicknessSweep, 1, -10, 400, 0, 'te')
+
+        thicknesses = np.array([[0, 5, 10], [50, 200, 1000]])
+        wlengths = np.array([350, 600])
+        angles = np.array([0, 0.7])
+        for pol in ['te', 'tm']:
+            for layer in [1, 2]:
+                sweep = self.ml2layers.calculateThicknessSweep(layer,
+                        thicknesses, wlengths[:, np.newaxis], angles, pol)
+                self.assertEqual(sweep['r'].shape, (2, 2, 2, 3))
+                original = self.ml2layers.getThickness(layer)
+                for (i, thickness) in np.ndenumerate(thicknesses):
+                    self.ml2layers.setThickness(thickness, layer)
+                    coefs = self.ml2layers.calculateCoefficients(
+                            wlengths[:, np.newaxis], angles, pol)
+                    for key in ['r', 't', 'R', 'T']:
+                        np.testing.assert_array_almost_equal(
+                                sweep[key][..., i[0], i[1]], coefs[key], 14)
+                self.ml2layers.setThickness(original, layer)
+
+    def test_calculateCharMatrix(self):
+        """
+        Test the characteristic matrix parameterized by the in-plane
+        wavevector against the scalar methods at real angles.
+        """
+
+        wlengths = np.array([350, 500])
+        angles = np.array([0, 0.5, 1.2])
+        for pol in ['te', 'tm']:
+            for wlength in wlengths:
+                self.ml2layers.setWlength(wlength)
+                self.ml2layers.setPolarization(pol)
+                n0 = self.ml2layers.getRefrIndex(0)
+                matrices = self.ml2layers.calculateCharMatrix(
+                        wlength, n0 * np.sin(angles), pol)
+                self.assertEqual(matrices.shape, (3, 2, 2))
+                for (j, angle) in enumerate(angles):
+                    self.ml2layers.setPropAngle(angle)
+                    self.ml2layers.calcMatrices()
+                    self.ml2layers.updateCharMatrix()
+                    np.testing.assert_array_almost_equal(matrices[j],
+                            self.ml2layers.getCharMatrixUpDown(), 12)
+
+        # Beyond the critical angle of every layer
+        matrix = self.ml2layers.calculateCharMatrix(500, 5.0 + 0.1j, 'te')
+        self.assertAlmostEqual(np.linalg.det(matrix), 1, 10)
+
+    def test_calculateF(self):
+        """
+        Test that the vectorized F agrees with calculateFx, calculateFy
+        and calculateFz, including the special angles 0 and pi/2.
+        """
+
+        self.assertRaises(ValueError, self.ml2layers.calculateF, 0, 400, 0,
+                0, 'w')
+        self.assertRaises(ValueError, self.ml2layers.calculateF, 0, 400, 0,
+                0, '')
+        f = self.ml2layers.calculateF(5, 400, 0, components='Y')
+        self.assertEqual(list(f.keys()), ['fy'])
+
+        zlist = np.array([-10, 0, 5, 10, 20, 25, 30, 45])
+        wlengths = np.array([350, 500])
+        angles = np.array([0, 0.4, np.pi / 2])
+        for system in [self.ml2layers, self.cssystem_f5_film_alt,
+                self.zerothick]:
+            f = system.calculateF(zlist[:, np.newaxis, np.newaxis],
+                    wlengths[:, np.newaxis], angles)
+            self.assertEqual(f['fx'].shape, (8, 2, 3))
+            for (i, z) in enumerate(zlist):
+                for (j, wlength) in enumerate(wlengths):
+                    for (k, angle) in enumerate(angles):
+                        np.testing.assert_almost_equal(f['fx'][i, j, k],
+                                system.calculateFx(z, wlength, angle), 12)
+                        np.testing.assert_almost_equal(f['fy'][i, j, k],
+                                system.calculateFy(z, wlength, angle), 12)
+                        np.testing.assert_almost_equal(f['fz'][i, j, k],
+                                system.calculateFz(z, wlength, angle), 12)
+
+        # Angle fixed in an inner layer
+        f = self.ml2layers.calculateF(15, 600, 0.2, 1)
+        self.assertAlmostEqual(f['fy'],
+                self.ml2layers.calculateFy(15, 600, 0.2, 1), 12)
+        self.assertAlmostEqual(f['fz'],
+                self.ml2layers.calculateFz(15, 600, 0.2, 1), 12)
+
+        # The energy factors, evaluated in small blocks of positions
+        self.assertRaises(ValueError, self.ml2layers.calculateF, 0, 400, 0,
+                output='power')
+        for system in [self.ml2layers, self.cssystem_f5_film_alt,
+                self.zerothick]:
+            f = system.calculateF(zlist[:, np.newaxis, np.newaxis],
+                    wlengths[:, np.newaxis], angles)
+            energy = system.calculateF(zlist[:, np.newaxis, np.newaxis],
+                    wlengths[:, np.newaxis], angles, output='energy')
+            self.assertEqual(sorted(energy.keys()), ['te', 'tm'])
+            self.assertEqual(energy['te'].dtype, np.float64)
+            np.testing.assert_array_almost_equal(energy['te'],
+                    np.absolute(f['fy']) ** 2, 12)
+            np.testing.assert_array_almost_equal(energy['tm'],
+                    np.absolute(f['fx'] * np.cos(angles) ** 2 +
+                    f['fz'] * np.sin(angles) ** 2) ** 2, 12)
+        field = {'etas': np.ones((7, 2)), 'z': np.arange(7.0),
+                 'layers': np.array([1, 1, 1, 0, 0, 0, 0]),
+                 'positions': np.array([3.0, -np.inf]),
+                 'amplitudes': (np.ones((7, 2)), np.zeros((7, 2)))}
+        np.testing.assert_array_almost_equal(
+                ml._evaluateIntensity(field, (2, 2), 2), 4, 12)
+
 if __name__ == '__main__':
     unittest.main()
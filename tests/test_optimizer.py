@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import helpers
+import optimizer as op
+import distributions as ds
+import multilayers as ml
+import numpy as np
+import shutil
+
+
+class TestStackOptimizer(unittest.TestCase):
+    """
+    Test the StackOptimizer class.
+    """
+
+    def setUp(self):
+        """
+        Prepare the ground with common data for the tests that follow.
+        """
+
+        self.mediumDir = helpers.writeMediums([('ambient', 1.0, 0.0),
+                                               ('active', 1.8, 0.0),
+                                               ('oxide', 1.46, 0.0),
+                                               ('silicon', 4.0, 0.05)])
+
+        self.ambient = helpers.loadMedium(self.mediumDir, 'ambient')
+        self.active = helpers.loadMedium(self.mediumDir, 'active')
+        self.oxide = helpers.loadMedium(self.mediumDir, 'oxide')
+        self.silicon = helpers.loadMedium(self.mediumDir, 'silicon')
+        self.system = ml.Multilayer([
+                self.ambient,
+                [self.oxide, 80],
+                [self.active, 300],
+                [self.oxide, 50],
+                self.silicon])
+        self.distribution = ds.GaussianDistribution(200, 30, 120, 280)
+        self.wlengths = np.linspace(500, 600, 11)
+        self.angles = np.array([0, 0.3, 0.6])
+
+    def tearDown(self):
+        """
+        Clean up.
+        """
+
+        shutil.rmtree(self.mediumDir)
+
+    def test_init(self):
+        """
+        Test the argument checks.
+        """
+
+        self.assertRaises(TypeError, op.StackOptimizer, 'hola',
+                          self.distribution, self.wlengths, self.angles)
+        self.assertRaises(TypeError, op.StackOptimizer, self.system,
+                          'hola', self.wlengths, self.angles)
+        self.assertRaises(ValueError, op.StackOptimizer, self.system,
+                          self.distribution, [600, 500], self.angles)
+        self.assertRaises(ValueError, op.StackOptimizer, self.system,
+                          self.distribution, self.wlengths, self.angles,
+                          [1, 2])
+        self.assertRaises(ValueError, op.StackOptimizer, self.system,
+                          self.distribution, self.wlengths, self.angles,
+                          polarization='hola')
+        self.assertRaises(IndexError, op.StackOptimizer, self.system,
+                          self.distribution, self.wlengths, self.angles,
+                          index=5)
+
+        optimizer = op.StackOptimizer(self.system, self.distribution,
+                                      self.wlengths, self.angles)
+        np.testing.assert_array_equal(optimizer.getAngles(), self.angles)
+        np.testing.assert_array_equal(optimizer.getWavelengths(),
+                                      self.wlengths)
+        self.assertRaises(IndexError, optimizer.optimize, [0])
+        self.assertRaises(ValueError, optimizer.optimize, [1, 3], [(0, 10)])
+
+    def test_calculateObjective(self):
+        """
+        The objective is the band and angle average of the depth
+        integrals, and its gradient agrees with finite differences.
+        """
+
+        band = np.ones(11)
+        band[[0, -1]] = 0.5
+        factors = self.system.calculateDepthIntegral(
+                self.distribution, self.wlengths[:, np.newaxis], self.angles)
+        for polarization in ['te', 'tm', 'both']:
+            optimizer = op.StackOptimizer(
+                    self.system, self.distribution, self.wlengths,
+                    self.angles, polarization=polarization)
+            keys = ['te', 'tm'] if polarization == 'both' else [polarization]
+            expected = sum(np.sum(band[:, np.newaxis] * factors[key])
+                           for key in keys) / (3 * np.sum(band))
+            result = optimizer.calculateObjective([1, 2, 3])
+            self.assertAlmostEqual(result['objective'], expected, 10)
+
+            step = 1e-3
+            for (k, layer) in enumerate([1, 2, 3]):
+                thickness = self.system.getThickness(layer)
+                values = []
+                for sign in [1, -1]:
+                    self.system.setThickness(thickness + sign * step, layer)
+                    values.append(optimizer.calculateObjective()['objective'])
+                self.system.setThickness(thickness, layer)
+                self.assertAlmostEqual(result['gradient'][k],
+                                       (values[0] - values[1]) / (2 * step),
+                                       8)
+
+        # Angles given in an inner layer weight TM as the depth integrals
+        factors = self.system.calculateDepthIntegral(
+                self.distribution, self.wlengths[:, np.newaxis], self.angles,
+                2)
+        optimizer = op.StackOptimizer(self.system, self.distribution,
+                                      self.wlengths, self.angles,
+                                      polarization='tm', index=2)
+        self.assertAlmostEqual(optimizer.calculateObjective()['objective'],
+                               np.sum(band[:, np.newaxis] * factors['tm']) /
+                               (3 * np.sum(band)), 10)
+
+    def test_optimize(self):
+        """
+        The optimization improves the emission, respects the bounds and
+        leaves the fixed layers untouched.
+        """
+
+        optimizer = op.StackOptimizer(self.system, self.distribution,
+                                      self.wlengths, self.angles)
+        result = optimizer.optimize([1, 3], [(0, 300), (None, 400)])
+        self.assertTrue(result['success'])
+        self.assertTrue(result['objective'] > result['initial'])
+        self.assertTrue(np.all(result['thicknesses'] >= 0))
+        self.assertTrue(np.all(result['thicknesses'] <= [300, 400]))
+        self.assertEqual(self.system.getThickness(2), 300)
+        self.assertEqual(self.system.getThickness(1),
+                         result['thicknesses'][0])
+
+        # The optimum is stationary: the projected gradient vanishes
+        gradient = optimizer.calculateObjective([1, 3])['gradient']
+        for (thickness, slope, upper) in zip(result['thicknesses'],
+                                             gradient, [300, 400]):
+            if 0 < thickness < upper:
+                self.assertTrue(abs(slope) < 1e-4 * result['objective'])
+
+        # The active layer cannot become thinner than the emitters
+        optimizer = op.StackOptimizer(self.system, self.distribution,
+                                      self.wlengths, self.angles, nodes=8)
+        self.assertRaises(ValueError, optimizer.optimize, [2], [(0, 100)])
+        result = optimizer.optimize([2], [(0, 400)])
+        self.assertTrue(result['thicknesses'][0] >= 225)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import helpers
+import parallel as pl
+import multilayers as ml
+import numpy as np
+import pickle
+import shutil
+import tempfile
+from multiprocessing.pool import ThreadPool
+from os.path import join
+
+
+class TestSweepExecutor(unittest.TestCase):
+    """
+    Test the SweepExecutor class.
+    """
+
+    def setUp(self):
+        """
+        Prepare the ground with common data for the tests that follow.
+        """
+
+        self.mediumDir = helpers.writeMediums([('ambient', 1.0, 0.0),
+                                               ('active', 1.8, 0.01),
+                                               ('silicon', 4.0, 0.05)])
+
+        self.ambient = helpers.loadMedium(self.mediumDir, 'ambient')
+        self.active = helpers.loadMedium(self.mediumDir, 'active')
+        self.silicon = helpers.loadMedium(self.mediumDir, 'silicon')
+        self.system = ml.Multilayer([
+                self.ambient,
+                [self.active, 200],
+                [self.ambient, 30],
+                [self.active, 100],
+                self.silicon])
+        self.zlist = np.linspace(-20, 350, 12)
+        self.wlengths = np.linspace(400, 700, 13)
+        self.angles = np.array([0, 0.3, 0.9, np.pi / 2])
+
+    def tearDown(self):
+        """
+        Clean up.
+        """
+
+        shutil.rmtree(self.mediumDir)
+
+    def test_init(self):
+        """
+        Test the argument checks.
+        """
+
+        self.assertRaises(TypeError, pl.SweepExecutor, 'hola')
+        self.assertRaises(ValueError, pl.SweepExecutor, self.system, 0)
+        self.assertRaises(ValueError, pl.SweepExecutor, self.system, 1, 0)
+        executor = pl.SweepExecutor(self.system, 1, 5)
+        self.assertEqual(executor.getWorkers(), 1)
+        self.assertEqual(executor.getChunkSize(), 5)
+        self.assertRaises(ValueError, executor.calculateF, self.zlist,
+                          self.wlengths, self.angles, 0, 'hola')
+        self.assertRaises(ValueError, executor.calculateF,
+                          self.zlist[:, np.newaxis], self.wlengths,
+                          self.angles)
+
+    def test_pickle(self):
+        """
+        The multilayers sent to the workers are rebuilt from the tables
+        of refractive indices of their mediums.
+        """
+
+        system = pickle.loads(pickle.dumps(self.system, 2))
+        np.testing.assert_allclose(
+                system.getRefrIndices(self.wlengths),
+                self.system.getRefrIndices(self.wlengths), 1e-12)
+        self.assertEqual(system.getMinMaxWlength(),
+                         self.system.getMinMaxWlength())
+
+    def test_calculateF(self):
+        """
+        The results assembled from the chunks are those of the
+        multilayer, for any number of workers and size of the chunks.
+        """
+
+        expected = self.system.calculateF(
+                self.zlist[:, np.newaxis, np.newaxis],
+                self.wlengths[:, np.newaxis], self.angles)
+        energy = self.system.calculateF(
+                self.zlist[:, np.newaxis, np.newaxis],
+                self.wlengths[:, np.newaxis], self.angles, output='energy')
+        for (workers, chunkSize) in [(1, 7), (2, 5), (3, 100)]:
+            with pl.SweepExecutor(self.system, workers, chunkSize) as \
+                    executor:
+                results = executor.calculateF(self.zlist, self.wlengths,
+                                              self.angles)
+                for key in ['fx', 'fy', 'fz']:
+                    self.assertEqual(results[key].shape, (12, 13, 4))
+                    np.testing.assert_allclose(results[key],
+                                               expected[key], 1e-12)
+                results = executor.calculateF(self.zlist, self.wlengths,
+                                              self.angles, output='energy')
+                for key in ['te', 'tm']:
+                    np.testing.assert_allclose(results[key],
+                                               energy[key], 1e-12)
+
+        # The workers keep the multilayer they were given
+        executor = pl.SweepExecutor(self.system, 2)
+        self.system.setThickness(150, 1)
+        results = executor.calculateF(self.zlist, self.wlengths, self.angles)
+        executor.close()
+        np.testing.assert_allclose(results['fy'], expected['fy'], 1e-12)
+        self.assertRaises(ValueError, executor.calculateF, self.zlist,
+                          self.wlengths, self.angles)
+
+    def test_threads(self):
+        """
+        Single-worker executors in several threads keep their own
+        multilayers.
+        """
+
+        other = ml.Multilayer([self.ambient, [self.active, 80],
+                               self.silicon])
+        executors = [pl.SweepExecutor(system, 1, 3) for system in
+                     [self.system, other] * 3]
+        pool = ThreadPool(6)
+        results = pool.map(lambda executor: executor.calculateF(
+                self.zlist, self.wlengths, self.angles, output='energy'),
+                executors)
+        pool.close()
+        for (k, result) in enumerate(results):
+            system = [self.system, other][k % 2]
+            expected = system.calculateF(
+                    self.zlist[:, np.newaxis, np.newaxis],
+                    self.wlengths[:, np.newaxis], self.angles,
+                    output='energy')
+            np.testing.assert_allclose(result['te'], expected['te'], 1e-12)
+
+    def test_directory(self):
+        """
+        The results written to a directory are memory maps of .npy files
+        that can be loaded again.
+        """
+
+        expected = self.system.calculateF(
+                self.zlist[:, np.newaxis, np.newaxis],
+                self.wlengths[:, np.newaxis], self.angles, output='energy')
+        directory = tempfile.mkdtemp(prefix='pl_')
+        try:
+            for workers in [1, 2]:
+                with pl.SweepExecutor(self.system, workers, 6) as executor:
+                    results = executor.calculateF(
+                            self.zlist, self.wlengths, self.angles,
+                            output='energy', directory=directory)
+                for key in ['te', 'tm']:
+                    self.assertTrue(isinstance(results[key], np.memmap))
+                    np.testing.assert_allclose(results[key],
+                                               expected[key], 1e-12)
+                    saved = np.load(join(directory, key + '.npy'),
+                                    mmap_mode='r')
+                    np.testing.assert_allclose(saved, expected[key], 1e-12)
+                    del saved
+                del results
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import helpers
+import retrieval as rt
+import distributions as ds
+import multilayers as ml
+import numpy as np
+import shutil
+
+
+class TestProfileRetrieval(unittest.TestCase):
+    """
+    Test the ProfileRetrieval class.
+    """
+
+    def setUp(self):
+        """
+        Prepare the ground with common data for the tests that follow.
+        """
+
+        self.mediumDir = helpers.writeMediums([('ambient', 1.0, 0.0),
+                                               ('active', 1.8, 0.0),
+                                               ('oxide', 1.46, 0.0),
+                                               ('silicon', 4.0, 0.05)])
+
+        self.ambient = helpers.loadMedium(self.mediumDir, 'ambient')
+        self.active = helpers.loadMedium(self.mediumDir, 'active')
+        self.oxide = helpers.loadMedium(self.mediumDir, 'oxide')
+        self.silicon = helpers.loadMedium(self.mediumDir, 'silicon')
+        self.system = ml.Multilayer([
+                self.ambient,
+                [self.active, 300],
+                [self.oxide, 50],
+                self.silicon])
+        self.edges = np.linspace(60, 350, 7)
+        self.wlengths = np.linspace(400, 750, 36)
+        self.angles = np.array([0, 0.4, 0.8])
+
+    def tearDown(self):
+        """
+        Clean up.
+        """
+
+        shutil.rmtree(self.mediumDir)
+
+    def test_init(self):
+        """
+        Test the argument checks.
+        """
+
+        self.assertRaises(TypeError, rt.ProfileRetrieval, 'hola',
+                          self.edges, self.wlengths, self.angles)
+        self.assertRaises(ValueError, rt.ProfileRetrieval, self.system,
+                          [10, 5, 20], self.wlengths, self.angles)
+        retrieval = rt.ProfileRetrieval(self.system, self.edges,
+                                        self.wlengths, self.angles)
+        np.testing.assert_array_equal(retrieval.getEdges(), self.edges)
+        np.testing.assert_array_almost_equal(
+                retrieval.getCenters(), np.linspace(84.1666667, 325.833333,
+                                                    6), 5)
+        self.assertRaises(ValueError, retrieval.solveProfile, {})
+        self.assertRaises(ValueError, retrieval.solveProfile,
+                          {'te': np.ones((36, 3))}, 1, 3)
+        self.assertRaises(ValueError, retrieval.solveProfile,
+                          {'te': np.ones((36, 2))})
+
+    def test_kernel(self):
+        """
+        The kernel holds the depth integrals of every bin and is only
+        recalculated when the multilayer changes.
+        """
+
+        retrieval = rt.ProfileRetrieval(self.system, self.edges,
+                                        self.wlengths, self.angles)
+        kernel = retrieval.getKernel()
+        self.assertEqual(kernel['te'].shape, (36, 3, 6))
+        self.assertTrue(retrieval.getKernel() is kernel)
+
+        factors = self.system.calculateDepthIntegral(
+                ds.UniformDistribution(self.edges[2], self.edges[3]),
+                self.wlengths[:, np.newaxis], self.angles)
+        width = self.edges[3] - self.edges[2]
+        np.testing.assert_array_almost_equal(kernel['tm'][..., 2],
+                                             factors['tm'] * width, 10)
+
+        self.system.setThickness(200, 1)
+        self.assertFalse(retrieval.getKernel() is kernel)
+
+    def test_solveProfile(self):
+        """
+        Recover a profile from synthetic spectra.
+        """
+
+        retrieval = rt.ProfileRetrieval(self.system, self.edges,
+                                        self.wlengths, self.angles)
+        kernel = retrieval.getKernel()
+        density = np.array([0, 1, 3, 2, 0.5, 0])
+        measurement = {'te': np.dot(kernel['te'], density),
+                       'tm': np.dot(kernel['tm'], density)}
+        solution = retrieval.solveProfile(measurement)
+        np.testing.assert_array_almost_equal(solution['density'], density, 8)
+        np.testing.assert_array_almost_equal(solution['fit']['te'],
+                                             measurement['te'], 8)
+        self.assertTrue(solution['residual'] < 1e-8)
+
+        # The intrinsic spectrum and the uncertainties of the
+        # measurements are taken into account.
+        spectrum = np.linspace(1, 2, 36)
+        sigma = {'tm': np.linspace(0.5, 1.5, 36)[:, np.newaxis]}
+        solution = retrieval.solveProfile(
+                {'tm': measurement['tm'] * spectrum[:, np.newaxis]},
+                sigma=sigma, spectrum=spectrum)
+        np.testing.assert_array_almost_equal(solution['density'], density, 8)
+        self.assertEqual(list(solution['fit'].keys()), ['tm'])
+
+        # With noise, the regularization gives a smoother profile
+        noise = np.random.RandomState(7)
+        noisy = dict((key, value * (1 + 0.05 * noise.randn(*value.shape)))
+                     for (key, value) in measurement.items())
+        rough = retrieval.solveProfile(noisy)
+        smooth = retrieval.solveProfile(noisy, 200.0)
+        self.assertTrue(np.all(smooth['density'] >= 0))
+        self.assertTrue(np.sum(np.diff(smooth['density'], 2) ** 2) <
+                        np.sum(np.diff(rough['density'], 2) ** 2))
+        self.assertTrue(smooth['residual'] >= rough['residual'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import helpers
+import server as sv
+import functional as fn
+import numpy as np
+import shutil
+import sys
+from multiprocessing.pool import ThreadPool
+from os.path import join, realpath
+
+
+class TestSimulationServer(unittest.TestCase):
+    """
+    Test the SimulationServer and SimulationClient classes.
+    """
+
+    def setUp(self):
+        """
+        Prepare the ground with common data for the tests that follow.
+        """
+
+        self.mediumDir = helpers.writeMediums([('ambient', 1.0, 0.0),
+                                               ('active', 1.8, 0.01),
+                                               ('silicon', 4.0, 0.05)])
+
+        self.stack = fn.freezeStack([
+                helpers.loadMedium(self.mediumDir, 'ambient'),
+                [helpers.loadMedium(self.mediumDir, 'active'), 120],
+                helpers.loadMedium(self.mediumDir, 'silicon')])
+        self.description = [['ambient'], ['active', 120], ['silicon']]
+        self.zlist = np.linspace(-20, 150, 5)
+        self.wlengths = np.linspace(400, 700, 7)
+        self.angles = np.array([0, 0.3, 0.9])
+
+    def tearDown(self):
+        """
+        Clean up.
+        """
+
+        shutil.rmtree(self.mediumDir)
+
+    def test_handleRequest(self):
+        """
+        The requests are answered with the results of the functional
+        module, reusing the stacks and results already calculated.
+        """
+
+        self.assertRaises(ValueError, sv.SimulationServer, ('127.0.0.1', 0),
+                          0)
+        self.assertRaises(ValueError, sv.SimulationServer,
+                          mediumDir=join(self.mediumDir, "hola"))
+        with sv.SimulationServer(cacheSize=1,
+                                 mediumDir=self.mediumDir) as server:
+            self.assertEqual(server.getWorkers(), 4)
+            self.assertEqual(server.getMediumDir(),
+                             realpath(self.mediumDir))
+            for name in ['ambient', 'active', 'silicon']:
+                answer = server.handleRequest(
+                        {'method': 'loadMedium',
+                         'params': {'name': name, 'fname': name + ".txt",
+                                    'delimiter': ';'}})
+                self.assertEqual(answer, {'result': None})
+            self.assertEqual(server.handleRequest({'method': 'getMediums'}),
+                             {'result': ['active', 'ambient', 'silicon']})
+
+            # The clients only load the files of the medium directory
+            for fname in [join("..", "hola.txt"), "/etc/passwd",
+                          join(self.mediumDir, "..", "ambient.txt")]:
+                answer = server.handleRequest(
+                        {'method': 'loadMedium',
+                         'params': {'name': 'hola', 'fname': fname}})
+                self.assertEqual(answer, {'error': "Error: %s is not in "
+                                          "the medium directory" % fname})
+
+            request = {'method': 'calculateCoefficients',
+                       'params': {'stack': self.description,
+                                  'wlengths': self.wlengths.tolist(),
+                                  'angles': 0.3, 'polarization': 'te'}}
+            answer = server.handleRequest(request)
+            self.assertTrue(server.handleRequest(request)['result'] is
+                            answer['result'])
+            expected = fn.calculateCoefficients(self.stack, self.wlengths,
+                                                0.3, 'te')
+            np.testing.assert_allclose(
+                    sv._decode(answer['result'])['R'], expected['R'], 1e-12)
+
+            # Only the latest stacks are kept
+            for thickness in [100, 110, 120]:
+                request['params']['stack'] = [['ambient'],
+                                              ['active', thickness],
+                                              ['silicon']]
+                server.handleRequest(request)
+            self.assertEqual(len(server._SimulationServer__stacks), 1)
+
+            # Errors, with the messages printed by the functions
+            self.assertEqual(server.handleRequest({'method': 'hola'}),
+                             {'error': "unknown method hola"})
+            self.assertTrue('error' in server.handleRequest('hola'))
+            request['params']['stack'] = [['ambient'], ['hola']]
+            self.assertEqual(server.handleRequest(request),
+                             {'error': "Error: unknown medium hola"})
+            request['params']['stack'] = ['ambient', 'silicon']
+            self.assertTrue('must be a list' in
+                            server.handleRequest(request)['error'])
+            request['params']['stack'] = self.description
+            request['params']['wlengths'] = [100.0, 200.0]
+            stdout = sys.stdout
+            self.assertEqual(server.handleRequest(request),
+                             {'error': "Error: Wavelength out of bounds"})
+
+            # The standard output is restored after the request
+            self.assertTrue(sys.stdout is stdout)
+
+    def test_reload(self):
+        """
+        The requests running when a medium is loaded again do not cache
+        what they built with the old medium.
+        """
+
+        other = join(self.mediumDir, "other.txt")
+        helpers.writeMedium(other, 2.5, 0.0)
+        request = {'method': 'calculateCoefficients',
+                   'params': {'stack': self.description,
+                              'wlengths': self.wlengths.tolist(),
+                              'angles': 0.3, 'polarization': 'te'}}
+        calculate = sv._methods['calculateCoefficients']
+
+        def reload(*args, **kwargs):
+            server.loadMedium('active', other, ';')
+            return calculate(*args, **kwargs)
+
+        with sv.SimulationServer() as server:
+            for name in ['ambient', 'active', 'silicon']:
+                server.loadMedium(name, join(self.mediumDir, name + ".txt"),
+                                  ';')
+            sv._methods['calculateCoefficients'] = reload
+            try:
+                old = server.handleRequest(request)['result']
+            finally:
+                sv._methods['calculateCoefficients'] = calculate
+            new = server.handleRequest(request)['result']
+
+        np.testing.assert_allclose(
+                sv._decode(old)['R'],
+                fn.calculateCoefficients(self.stack, self.wlengths, 0.3,
+                                         'te')['R'], 1e-12)
+        self.assertFalse(np.allclose(sv._decode(new)['R'],
+                                     sv._decode(old)['R']))
+
+    def test_client(self):
+        """
+        Several clients are served at once over HTTP.
+        """
+
+        stdout = sys.stdout
+        server = sv.SimulationServer(workers=3)
+        for name in ['ambient', 'active', 'silicon']:
+            server.loadMedium(name, join(self.mediumDir, name + ".txt"), ';')
+        server.start()
+        client = sv.SimulationClient(server.getAddress())
+        try:
+            def calculate(wlength):
+                return client.call('calculateF', stack=self.description,
+                                   z=self.zlist[:, np.newaxis],
+                                   wlengths=wlength, angles=self.angles)
+
+            pool = ThreadPool(4)
+            results = pool.map(calculate, self.wlengths)
+            pool.close()
+            for (wlength, result) in zip(self.wlengths, results):
+                expected = fn.calculateF(self.stack, self.zlist[:, np.newaxis],
+                                         wlength, self.angles)
+                for key in ['fx', 'fy', 'fz']:
+                    self.assertEqual(result[key].shape, (5, 3))
+                    np.testing.assert_array_almost_equal(
+                            result[key], expected[key], 12)
+
+            result = client.call('calculateEmission', stack=self.description,
+                                 z=50.0, wlengths=self.wlengths, angles=0.5,
+                                 orientation='isotropic')
+            expected = fn.calculateEmission(self.stack, 50.0, self.wlengths,
+                                            0.5)
+            np.testing.assert_array_almost_equal(result['te'],
+                                                 expected['te'], 12)
+            self.assertRaises(ValueError, client.call, 'hola')
+            self.assertRaises(ValueError, client.call, 'loadMedium',
+                              name='hola', fname="ambient.txt")
+            self.assertRaises(ValueError, client.call, 'calculateF',
+                              stack=[['ambient'], ['hola']], z=0,
+                              wlengths=500, angles=0)
+        finally:
+            server.close()
+        self.assertTrue(sys.stdout is stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
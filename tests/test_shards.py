@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import helpers
+import shards as sh
+import multilayers as ml
+import numpy as np
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+
+def work(directory):
+    """
+    Runs a worker on a sweep directory.
+    """
+
+    sh.ShardedSweep(directory).runWorker()
+
+
+class TestShardedSweep(unittest.TestCase):
+    """
+    Test the ShardedSweep class.
+    """
+
+    def setUp(self):
+        """
+        Prepare the ground with common data for the tests that follow.
+        """
+
+        self.mediumDir = helpers.writeMediums([('ambient', 1.0, 0.0),
+                                               ('active', 1.8, 0.01),
+                                               ('silicon', 4.0, 0.05)])
+
+        self.system = ml.Multilayer([
+                helpers.loadMedium(self.mediumDir, 'ambient'),
+                [helpers.loadMedium(self.mediumDir, 'active'), 200],
+                helpers.loadMedium(self.mediumDir, 'silicon')])
+        self.zlist = np.linspace(-20, 250, 6)
+        self.wlengths = np.linspace(400, 700, 11)
+        self.angles = np.array([0, 0.3, 0.9, 1.2])
+        self.directory = tempfile.mkdtemp(prefix='sh_')
+
+    def tearDown(self):
+        """
+        Clean up.
+        """
+
+        shutil.rmtree(self.mediumDir)
+        shutil.rmtree(self.directory)
+
+    def test_createSweep(self):
+        """
+        Test the argument checks and the layout of the directory.
+        """
+
+        self.assertRaises(TypeError, sh.createSweep, self.directory, 'hola',
+                          self.zlist, self.wlengths, self.angles)
+        self.assertRaises(ValueError, sh.createSweep, self.directory,
+                          self.system, self.zlist, self.wlengths, self.angles,
+                          0, 'hola')
+        self.assertRaises(ValueError, sh.ShardedSweep, self.directory)
+        sweep = sh.createSweep(self.directory, self.system, self.zlist,
+                               self.wlengths, self.angles, shardSize=10)
+        self.assertEqual(sweep.getNumShards(), 5)
+        np.testing.assert_array_equal(sweep.getGrid()[1], self.wlengths)
+        self.assertEqual(sweep.getStatus(),
+                         {'pending': 5, 'claimed': 0, 'finished': 0})
+        self.assertRaises(ValueError, sh.createSweep, self.directory,
+                          self.system, self.zlist, self.wlengths, self.angles)
+
+        # A killed worker leaves its shard claimed
+        os.rename(os.path.join(self.directory, 'pending', '000003.shard'),
+                  os.path.join(self.directory, 'claimed', '000003.shard'))
+        self.assertEqual(sweep.runWorker(2), 2)
+        self.assertEqual(sweep.getStatus(),
+                         {'pending': 2, 'claimed': 1, 'finished': 2})
+        self.assertRaises(ValueError, sweep.mergeResults)
+        self.assertEqual(sweep.requeueShards(), 1)
+        self.assertEqual(sweep.runWorker(), 3)
+        self.assertEqual(sweep.getStatus(),
+                         {'pending': 0, 'claimed': 0, 'finished': 5})
+
+    def test_mergeResults(self):
+        """
+        The results of several workers are those of the multilayer.
+        """
+
+        sh.createSweep(self.directory, self.system, self.zlist,
+                       self.wlengths, self.angles, output='energy',
+                       shardSize=3)
+        workers = [multiprocessing.Process(target=work,
+                                           args=(self.directory,))
+                   for k in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        sweep = sh.ShardedSweep(self.directory)
+        self.assertEqual(sweep.getStatus(),
+                         {'pending': 0, 'claimed': 0, 'finished': 15})
+        results = sweep.mergeResults()
+        expected = self.system.calculateF(
+                self.zlist[:, np.newaxis, np.newaxis],
+                self.wlengths[:, np.newaxis], self.angles, output='energy')
+        self.assertEqual(sorted(results.keys()), ['te', 'tm'])
+        for key in ['te', 'tm']:
+            self.assertEqual(results[key].shape, (6, 11, 4))
+            np.testing.assert_array_almost_equal(results[key], expected[key],
+                                                 12)
+
+    def test_resumeSweep(self):
+        """
+        An interrupted sweep is resumed, and checkpoints of other
+        multilayers or grids are rejected.
+        """
+
+        fingerprint = sh.stackFingerprint(self.system)
+        self.assertEqual(len(fingerprint), 40)
+        self.system.setThickness(201, 1)
+        self.assertNotEqual(sh.stackFingerprint(self.system), fingerprint)
+        self.system.setThickness(200, 1)
+        self.assertEqual(sh.stackFingerprint(self.system), fingerprint)
+
+        # Interrupted with two shards finished and one claimed
+        sweep = sh.createSweep(self.directory, self.system, self.zlist,
+                               self.wlengths, self.angles, shardSize=10)
+        self.assertEqual(sweep.getFingerprint(), fingerprint)
+        sweep.runWorker(2)
+        os.rename(os.path.join(self.directory, 'pending', '000002.shard'),
+                  os.path.join(self.directory, 'claimed', '000002.shard'))
+        finished = os.path.join(self.directory, 'results', '000000.npz')
+        modified = os.path.getmtime(finished)
+
+        self.assertRaises(ValueError, sh.resumeSweep, self.directory,
+                          self.system, self.zlist, self.wlengths[:-1],
+                          self.angles)
+        self.assertRaises(ValueError, sh.resumeSweep, self.directory,
+                          self.system, self.zlist, self.wlengths,
+                          self.angles, output='energy')
+        self.system.setThickness(150, 1)
+        self.assertRaises(ValueError, sh.resumeSweep, self.directory,
+                          self.system, self.zlist, self.wlengths,
+                          self.angles)
+        self.system.setThickness(200, 1)
+
+        results = sh.resumeSweep(self.directory, self.system, self.zlist,
+                                 self.wlengths, self.angles)
+        self.assertEqual(os.path.getmtime(finished), modified)
+        self.assertEqual(sweep.getStatus(),
+                         {'pending': 0, 'claimed': 0, 'finished': 5})
+        expected = self.system.calculateF(
+                self.zlist[:, np.newaxis, np.newaxis],
+                self.wlengths[:, np.newaxis], self.angles)
+        for key in ['fx', 'fy', 'fz']:
+            np.testing.assert_array_almost_equal(results[key], expected[key],
+                                                 12)
+
+        # A new directory is created the first time, and an interrupted
+        # creation leaves nothing behind
+        directory = os.path.join(self.directory, 'new')
+        savez = np.savez
+
+        def interrupt(*args, **kwargs):
+            raise RuntimeError
+
+        np.savez = interrupt
+        try:
+            self.assertRaises(RuntimeError, sh.resumeSweep, directory,
+                              self.system, self.zlist, self.wlengths,
+                              self.angles)
+        finally:
+            np.savez = savez
+        self.assertFalse(os.path.exists(directory))
+        self.assertEqual([name for name in os.listdir(self.directory)
+                          if name.startswith('.new.')], [])
+
+        # An existing empty directory is replaced
+        os.mkdir(directory)
+        results = sh.resumeSweep(directory, self.system, self.zlist,
+                                 self.wlengths, self.angles)
+        np.testing.assert_array_almost_equal(results['fy'], expected['fy'],
+                                             12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import helpers
+import spectra as sp
+import distributions as ds
+import multilayers as ml
+import bphysics as bp
+import numpy as np
+import shutil
+from os.path import join
+
+
+class TestSpectralPipeline(unittest.TestCase):
+    """
+    Test the SpectralPipeline class.
+    """
+
+    def setUp(self):
+        """
+        Prepare the ground with common data for the tests that follow.
+        """
+
+        self.mediumDir = helpers.writeMediums([('ambient', 1.0, 0.0),
+                                               ('active', 1.8, 0.0),
+                                               ('oxide', 1.46, 0.0),
+                                               ('silicon', 4.0, 0.05)])
+
+        self.ambient = helpers.loadMedium(self.mediumDir, 'ambient')
+        self.active = helpers.loadMedium(self.mediumDir, 'active')
+        self.oxide = helpers.loadMedium(self.mediumDir, 'oxide')
+        self.silicon = helpers.loadMedium(self.mediumDir, 'silicon')
+        self.system = ml.Multilayer([
+                self.ambient,
+                [self.active, 100],
+                [self.oxide, 50],
+                self.silicon])
+        self.distribution = ds.GaussianDistribution(100, 15)
+        self.angles = np.array([0, 0.3, 0.8])
+        self.wlengths = np.linspace(400, 700, 31)
+
+    def tearDown(self):
+        """
+        Clean up.
+        """
+
+        shutil.rmtree(self.mediumDir)
+
+    def test_init(self):
+        """
+        Test the argument checks.
+        """
+
+        self.assertRaises(TypeError, sp.SpectralPipeline, 'hola',
+                          self.distribution, 0)
+        self.assertRaises(TypeError, sp.SpectralPipeline, self.system,
+                          'hola', 0)
+        self.assertRaises(ValueError, sp.SpectralPipeline, self.system,
+                          self.distribution, 0, None, 0)
+        self.assertRaises(ValueError, sp.SpectralPipeline, self.system,
+                          self.distribution, 0, [1, 2, 3])
+
+        pipeline = sp.SpectralPipeline(self.system, self.distribution, 0.5,
+                                       chunkSize=10)
+        np.testing.assert_array_equal(pipeline.getAngles(), [0.5])
+        self.assertEqual(pipeline.getChunkSize(), 10)
+
+    def test_spectra(self):
+        """
+        The spectra are the depth integrals times the intrinsic spectrum,
+        independently of the size of the chunks.
+        """
+
+        factors = self.system.calculateDepthIntegral(
+                self.distribution, self.wlengths[:, np.newaxis], self.angles)
+        intrinsic = bp.gaussian(self.wlengths, 1, 550, 40)
+        table = np.column_stack((np.linspace(350, 750, 2001),
+                                 bp.gaussian(np.linspace(350, 750, 2001), 1,
+                                             550, 40)))
+        for spectrum in [lambda x: bp.gaussian(x, 1, 550, 40), table]:
+            for chunkSize in [1, 7, 31, 100]:
+                pipeline = sp.SpectralPipeline(
+                        self.system, self.distribution, self.angles,
+                        spectrum, chunkSize)
+                chunks = list(pipeline.iterateSpectra(self.wlengths))
+                self.assertEqual(len(chunks),
+                                 int(np.ceil(31.0 / chunkSize)))
+                self.assertTrue(all(chunk['te'].shape[0] <= chunkSize
+                                    for chunk in chunks))
+                spectra = pipeline.calculateSpectra(self.wlengths)
+                self.assertEqual(spectra['te'].shape, (31, 3))
+                np.testing.assert_allclose(
+                        spectra['te'], intrinsic[:, np.newaxis] *
+                        factors['te'], 1e-5)
+                np.testing.assert_allclose(
+                        spectra['tm'], intrinsic[:, np.newaxis] *
+                        factors['tm'], 1e-5)
+
+        # Without an intrinsic spectrum the results are the factors
+        pipeline = sp.SpectralPipeline(self.system, self.distribution,
+                                       self.angles, chunkSize=4)
+        spectra = pipeline.calculateSpectra(self.wlengths)
+        np.testing.assert_array_almost_equal(spectra['te'], factors['te'], 12)
+        np.testing.assert_array_almost_equal(spectra['tm'], factors['tm'], 12)
+
+    def test_writeSpectra(self):
+        """
+        The file written chunk by chunk holds the same spectra.
+        """
+
+        pipeline = sp.SpectralPipeline(self.system, self.distribution,
+                                       self.angles, chunkSize=8)
+        fname = join(self.mediumDir, "output.txt")
+        pipeline.writeSpectra(fname, self.wlengths, '%.12e')
+        data = np.loadtxt(fname)
+        spectra = pipeline.calculateSpectra(self.wlengths)
+        self.assertEqual(data.shape, (31, 7))
+        np.testing.assert_allclose(data[:, 0], self.wlengths)
+        np.testing.assert_allclose(data[:, 1:4], spectra['te'], 1e-10)
+        np.testing.assert_allclose(data[:, 4:], spectra['tm'], 1e-10)
+
+    def test_unfoldSpectra(self):
+        """
+        The intrinsic spectra are recovered from the observed ones.
+        """
+
+        self.assertRaises(TypeError, sp.SpectralUnfolding, 'hola',
+                          self.distribution, self.wlengths, self.angles)
+        self.assertRaises(TypeError, sp.SpectralUnfolding, self.system,
+                          'hola', self.wlengths, self.angles)
+        unfolding = sp.SpectralUnfolding(self.system, self.distribution,
+                                         self.wlengths, self.angles)
+        np.testing.assert_array_equal(unfolding.getWavelengths(),
+                                      self.wlengths)
+        np.testing.assert_array_equal(unfolding.getAngles(), self.angles)
+        self.assertRaises(ValueError, unfolding.unfoldSpectra, {})
+        self.assertRaises(ValueError, unfolding.unfoldSpectra,
+                          {'te': np.ones((31, 2))})
+
+        kernel = unfolding.getKernel()
+        self.assertTrue(unfolding.getKernel() is kernel)
+        intrinsic = np.array([bp.gaussian(self.wlengths, 1, center, 40)
+                              for center in [500, 550, 600]])
+        measurement = {}
+        for key in ['te', 'tm']:
+            measurement[key] = intrinsic[:, :, np.newaxis] * kernel[key]
+        results = unfolding.unfoldSpectra(measurement)
+        self.assertEqual(results['spectrum'].shape, (3, 31))
+        np.testing.assert_array_almost_equal(results['spectrum'], intrinsic,
+                                             12)
+        np.testing.assert_array_almost_equal(results['fit']['tm'],
+                                             measurement['tm'], 12)
+
+        # A single spectrum, one polarization and the uncertainties
+        results = unfolding.unfoldSpectra(
+                {'tm': measurement['tm'][1]},
+                sigma={'tm': np.linspace(0.5, 1, 3)})
+        np.testing.assert_array_almost_equal(results['spectrum'],
+                                             intrinsic[1], 12)
+
+        # The regularization damps the noise where the factors are small
+        noise = np.random.RandomState(3).randn(31, 3) * 0.01
+        kernel['te'][10:15] *= 1e-3
+        noisy = {'te': intrinsic[0][:, np.newaxis] * kernel['te'] + noise}
+        rough = unfolding.unfoldSpectra(noisy)['spectrum']
+        smooth = unfolding.unfoldSpectra(noisy, 0.1)['spectrum']
+        error = lambda spectrum: np.absolute(spectrum - intrinsic[0])[10:15]
+        self.assertTrue(np.all(error(smooth) < error(rough)))
+        self.assertTrue(np.all(np.absolute(smooth[10:15]) < 1))
+
+        # The kernel follows the changes of the multilayer
+        self.system.setThickness(120, 1)
+        self.assertFalse(unfolding.getKernel() is kernel)
+
+
+if __name__ == '__main__':
+    unittest.main()